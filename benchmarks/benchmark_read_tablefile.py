@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   Benchmark of TableFile.read_datalines
+###
+################################################################################
+###
+###  Compares the bulk parser used by TableFile.read_datalines with the original
+###  line-by-line loop (split every line and map(float) every selected key),
+###  and optionally with the parallel parser (--nprocs).
+###  A synthetic LAMMPS-style table is written to a temporary file, unless an
+###  existing file is given.
+###
+###  example:
+###     python benchmark_read_tablefile.py -n 1000000 -k flux
+###     python benchmark_read_tablefile.py -f flux.dat -k flux Temp
+###     python benchmark_read_tablefile.py -n 2000000 --nprocs 8 --skip-loop
+################################################################################
+
+import os
+import argparse
+import tempfile
+import numpy as np
+from time import time
+
+import thermocepstrum as tc
+from thermocepstrum.utils.utils import PrintMethod
+log = PrintMethod()
+
+
+def write_table(filename, nsteps, nvectors=8, seed=0):
+    """Write a table with a Step, Temp columns and nvectors 3-component vectors (c_flux, c_vec1, c_vec2, ...)."""
+    rng = np.random.RandomState(seed)
+    names = ['flux'] + ['vec{:d}'.format(i) for i in range(1, nvectors)]
+    header = 'Step Temp ' + ' '.join('c_{0}[1] c_{0}[2] c_{0}[3]'.format(name) for name in names)
+    with open(filename, 'w') as f:
+        f.write('# synthetic table\n' + header + '\n')
+        for start in range(0, nsteps, 100000):
+            n = min(100000, nsteps - start)
+            values = np.c_[np.arange(start, start + n), 300. + rng.randn(n), 100. * rng.randn(n, 3 * nvectors)]
+            np.savetxt(f, values, fmt=['%d'] + ['%.8g'] * (1 + 3 * nvectors))
+    return header.split()
+
+
+def read_datalines_loop(jfile, NSTEPS=0, start_step=-1, select_ckeys=None):
+    """The original line-by-line implementation of TableFile.read_datalines (reference)."""
+    if (NSTEPS == 0):
+        NSTEPS = jfile.MAX_NSTEPS
+    jfile._set_ckey(select_ckeys)
+    jfile._initialize_dic(NSTEPS)
+    jfile.gotostep(start_step)
+    for step in range(NSTEPS):
+        line = jfile.file.readline()
+        if len(line) == 0:   # EOF
+            break
+        values = np.array(line.split())
+        for key, idx in jfile.ckey.items():
+            jfile.data[key][step, :] = np.array(list(map(float, values[idx])))
+    if (NSTEPS % 2 == 1):
+        NSTEPS = NSTEPS - 1
+    for key in jfile.ckey:
+        jfile.data[key] = jfile.data[key][:NSTEPS, :]
+    return jfile.data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of TableFile.read_datalines (bulk vs line-by-line).')
+    parser.add_argument('-f', '--file', type=str, help='table file to read (default: write a synthetic table)')
+    parser.add_argument('-n', '--nsteps', type=int, default=200000, help='number of steps of the synthetic table')
+    parser.add_argument('-k', '--ckeys', nargs='+', default=['flux'], help='column keys to read')
+    parser.add_argument('--skip-loop', action='store_true', help='do not run the line-by-line loop')
+    parser.add_argument('--nprocs', type=int, default=1, help='number of processes of the parallel parser (default: 1)')
+    args = parser.parse_args()
+
+    log.set_method('other')
+    log.set_func(lambda *a, **k: None)   # silence the readers
+    tmpdir = None
+    filename = args.file
+    if filename is None:
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, 'table.dat')
+        write_table(filename, args.nsteps)
+    size_MB = os.path.getsize(filename) / 1.0e6
+
+    timings = {}
+    jfile = tc.i_o.TableFile(filename, group_vectors=True, print_elapsed=False)
+    start_time = time()
+    bulk = jfile.read_datalines(start_step=0, select_ckeys=args.ckeys)
+    timings['bulk'] = time() - start_time
+
+    if (args.nprocs > 1):
+        jfile = tc.i_o.TableFile(filename, group_vectors=True, print_elapsed=False, nprocs=args.nprocs)
+        start_time = time()
+        parallel = jfile.read_datalines(start_step=0, select_ckeys=args.ckeys)
+        timings['np={:d}'.format(args.nprocs)] = time() - start_time
+        for key in args.ckeys:
+            if not np.array_equal(bulk[key], parallel[key]):
+                raise RuntimeError('Bulk and parallel results differ for key {}.'.format(key))
+
+    if not args.skip_loop:
+        jfile = tc.i_o.TableFile(filename, group_vectors=True, print_elapsed=False)
+        start_time = time()
+        loop = read_datalines_loop(jfile, start_step=0, select_ckeys=args.ckeys)
+        timings['loop'] = time() - start_time
+        for key in args.ckeys:
+            if not np.array_equal(bulk[key], loop[key]):
+                raise RuntimeError('Bulk and loop results differ for key {}.'.format(key))
+
+    print('file: {}  ({:.1f} MB, {:d} steps)'.format(filename, size_MB, jfile.MAX_NSTEPS))
+    for method, elapsed in timings.items():
+        print('  {:6s}  {:10.3f} s  {:10.1f} MB/s'.format(method, elapsed, size_MB / elapsed))
+    if 'loop' in timings:
+        print('  speedup = {:.1f}x'.format(timings['loop'] / timings['bulk']))
+
+    if tmpdir is not None:
+        os.remove(filename)
+        os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+def test_runavefilter_nd():
+    """The cumulative-sum running average matches the convolution with the reflected array, along any axis."""
+    from thermocepstrum.md.tools.filter import runavefilter
+
+    def reference(X, WF):
+        WF = WF + 1 if (WF % 2 == 0) else WF
+        W = WF // 2
+        return np.convolve(np.concatenate((X[W:0:-1], X, X[-2:-W - 2:-1])), np.ones(WF) / WF, 'valid')
+
+    rs = np.random.RandomState(5)
+    x = np.exp(5. * rs.randn(1001))   # a wide dynamic range
+    for WF in (0, 1, 2, 7, 64, 999):
+        np.testing.assert_allclose(runavefilter(x, WF), reference(x, WF), rtol=1e-13)
+    c = rs.randn(2, 2, 500) + 1j * rs.randn(2, 2, 500)
+    ref = np.array([[reference(c[i, j], 12) for j in range(2)] for i in range(2)])
+    np.testing.assert_allclose(runavefilter(c, 12), ref, rtol=1e-12, atol=1e-14)
+    out = np.empty((500, 2, 2), dtype=complex)
+    assert runavefilter(np.moveaxis(c, -1, 0), 12, axis=0, out=out) is out
+    np.testing.assert_allclose(out, np.moveaxis(ref, -1, 0), rtol=1e-12, atol=1e-14)
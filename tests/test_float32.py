@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import pytest
+import numpy as np
+
+
+@pytest.fixture
+def check_float32(filepath_tests):
+    """
+    Accuracy check of the single precision (DTYPE=np.float32) analysis against the double precision regression data:
+    the periodogram agrees within a relative error of 1e-4 (about 7e-6 found), kappa and its standard deviation
+    within 1e-6 (about 4e-8 found), and the same number of cepstral coefficients is selected.
+    """
+
+    def _check(jf, name):
+        import yaml
+
+        basename = filepath_tests + '/test_as_example/test_example_' + name
+        ref_psd = np.genfromtxt(basename + '.csv', delimiter=',', skip_header=1, usecols=1)
+        with open(basename + '.yml') as f:
+            ref = yaml.safe_load(f)
+        assert jf.traj.dtype == np.float32
+        np.testing.assert_allclose(jf.psd, ref_psd, rtol=1e-4)
+        assert int(jf.dct.aic_Kmin) == ref['aic_Kmin']
+        np.testing.assert_allclose(jf.kappa_Kmin, ref['kappa_Kmin'], rtol=1e-6)
+        np.testing.assert_allclose(jf.kappa_Kmin_std, ref['kappa_Kmin_std'], rtol=1e-6)
+
+    return _check
+
+
+def test_example_NaCl_float32(data_NaCl_path, check_float32):
+    import thermocepstrum as tc
+
+    jfile = tc.i_o.TableFile(data_NaCl_path, group_vectors=True, dtype=np.float32)
+    jfile.read_datalines(start_step=0, NSTEPS=0, select_ckeys=['Temp', 'flux', 'vcm[1]'])
+    assert jfile.data['flux'].dtype == np.float32
+    TEMPERATURE = np.mean(jfile.data['Temp'], dtype=np.float64)
+    j = tc.HeatCurrent([jfile.data['flux'], jfile.data['vcm[1]']], DT_FS=5.0, UNITS='metal', TEMPERATURE=TEMPERATURE,
+                       VOLUME=40.21**3, DTYPE=np.float32)
+    assert j.spectrALL.dtype == np.complex64
+    jf = j.resample(fstar_THz=14.0, plot=False, freq_units='thz')
+    jf.cepstral_analysis()
+    check_float32(jf, 'NaCl')
+
+
+def test_example_SiO2_float32(data_SiO2_path, check_float32):
+    import thermocepstrum as tc
+
+    jfile = tc.i_o.TableFile(data_SiO2_path, group_vectors=True, dtype=np.float32)
+    jfile.read_datalines(start_step=0, NSTEPS=0, select_ckeys=['flux1'])
+    j = tc.HeatCurrent(jfile.data['flux1'], DT_FS=1.0, UNITS='metal', TEMPERATURE=1065.705630, VOLUME=3130.431110818,
+                       DTYPE=np.float32)
+    jf = j.resample(fstar_THz=28.0, plot=False, freq_units='thz')
+    jf.cepstral_analysis()
+    check_float32(jf, 'SiO2')
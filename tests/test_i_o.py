@@ -0,0 +1,569 @@
+# -*- coding: utf-8 -*-
+import pytest
+import numpy as np
+
+
+@pytest.fixture
+def table_path(tmpdir):
+    """A small table with a comment, a Temp scalar and two vectors; values are row*100 + column."""
+    values = np.arange(1001)[:, np.newaxis] * 100. + np.arange(8)
+    filename = tmpdir.join('table.dat')
+    with filename.open('w') as f:
+        f.write('# comment line\nStep Temp c_flux[1] c_flux[2] c_flux[3] c_vcm[1][1] c_vcm[1][2] c_vcm[1][3]\n')
+        np.savetxt(f, values, fmt='%.1f')
+    return str(filename), values
+
+
+def test_tablefile_read_all(table_path):
+    import thermocepstrum as tc
+
+    filename, values = table_path
+    jfile = tc.i_o.TableFile(filename, group_vectors=True)
+    assert jfile.MAX_NSTEPS == 1001
+    data = jfile.read_datalines(start_step=0, select_ckeys=['Temp', 'flux', 'vcm[1]'])
+    assert jfile.NSTEPS == 1000   # even_NSTEPS
+    np.testing.assert_array_equal(data['Temp'], values[:1000, [1]])
+    np.testing.assert_array_equal(data['flux'], values[:1000, 2:5])
+    np.testing.assert_array_equal(data['vcm[1]'], values[:1000, 5:8])
+
+
+def test_tablefile_read_blocks(table_path):
+    import thermocepstrum as tc
+
+    filename, values = table_path
+    jfile = tc.i_o.TableFile(filename, group_vectors=True)
+    data = jfile.read_datalines(NSTEPS=11, start_step=7, select_ckeys=['flux'], even_NSTEPS=False)
+    np.testing.assert_array_equal(data['flux'], values[7:18, 2:5])
+    data = jfile.read_datalines(NSTEPS=4, select_ckeys=['flux'])   # continue from the current position
+    np.testing.assert_array_equal(data['flux'], values[18:22, 2:5])
+    data = jfile.read_datalines(NSTEPS=100, start_step=995, select_ckeys=['flux'])   # EOF reached
+    np.testing.assert_array_equal(data['flux'], values[995:1001, 2:5])
+
+
+def test_tablefile_malformed_line(tmpdir):
+    import thermocepstrum as tc
+
+    filename = tmpdir.join('table.dat')
+    filename.write('Step Temp\n0 1.0\n1 2.0\n2 3.0\n3\n4 5.0\n')
+    jfile = tc.i_o.TableFile(str(filename))
+    data = jfile.read_datalines(start_step=0, select_ckeys=['Temp'])
+    np.testing.assert_array_equal(data['Temp'], [[1.0], [2.0]])
+    assert jfile.file.readline() == b'3\n'   # stopped at the malformed line
+
+
+@pytest.mark.parametrize('bad_line', ['3 x 4.0\n', '3 4.0 4.0 1 1\n', '\n'])
+def test_tablefile_column_projection(tmpdir, bad_line):
+    import thermocepstrum as tc
+    from thermocepstrum.i_o.bulkparse import parse_block
+
+    block = b'1 2 3\n 4\t5 6 \n7 8 9'
+    np.testing.assert_array_equal(parse_block(block, 3, 3, usecols=[2, 0]), [[3, 1], [6, 4], [9, 7]])
+    with pytest.raises(ValueError):
+        parse_block(block, 3, 4, usecols=[0])
+    with pytest.raises(ValueError):   # same number of fields, but not on each line
+        parse_block(b'1 2 3\n4 5\n6 7 8 9\n', 3, 3, usecols=[0, 2])
+
+    # a malformed line in an unused column still stops the parser
+    filename = tmpdir.join('table.dat')
+    filename.write('Step Temp Press Vol\n0 1.0 1.0 1\n1 2.0 2.0 1\n2 3.0 3.0 1\n' + bad_line + '4 5.0 5.0 1\n')
+    jfile = tc.i_o.TableFile(str(filename))
+    data = jfile.read_datalines(start_step=0, select_ckeys=['Vol', 'Temp'], even_NSTEPS=False)
+    np.testing.assert_array_equal(data['Temp'], [[1.0], [2.0], [3.0]])
+    np.testing.assert_array_equal(data['Vol'], [[1], [1], [1]])
+    assert jfile.file.readline() == bad_line.encode()
+
+
+def test_parse_block_contiguous_columns(table_path, monkeypatch):
+    """Contiguous columns (e.g. all of them) are converted by np.fromstring and sliced, without np.loadtxt."""
+    import thermocepstrum as tc
+    from thermocepstrum.i_o.bulkparse import parse_block
+
+    def no_loadtxt(*args, **kwargs):
+        raise AssertionError('np.loadtxt called')
+
+    block = b'1 2 3\n 4\t5 6 \n7 8 9'
+    monkeypatch.setattr(np, 'loadtxt', no_loadtxt)
+    np.testing.assert_array_equal(parse_block(block, 3, 3, usecols=[0, 1, 2]), [[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+    np.testing.assert_array_equal(parse_block(block, 3, 3, usecols=[1, 2]), [[2, 3], [5, 6], [8, 9]])
+    with pytest.raises(ValueError):
+        parse_block(b'1 2 3\n4 5\n6 7 8 9\n', 3, 3, usecols=[0, 1, 2])
+    with pytest.raises(ValueError):
+        parse_block(b'1 2 3\n4 x 6\n', 2, 3, usecols=[0, 1, 2])
+
+    filename, values = table_path
+    jfile = tc.i_o.TableFile(filename, group_vectors=True)
+    data = jfile.read_datalines(start_step=0, select_ckeys=['Step', 'Temp', 'flux', 'vcm[1]'])
+    np.testing.assert_array_equal(data['flux'], values[:1000, 2:5])
+    np.testing.assert_array_equal(data['vcm[1]'], values[:1000, 5:8])
+
+
+def test_tablefile_cache(table_path, tmpdir):
+    import os
+    import thermocepstrum as tc
+
+    filename, values = table_path
+    cache_dir = str(tmpdir.join('cache'))
+    jfile = tc.i_o.TableFile(filename, cache=cache_dir)
+    data = jfile.read_datalines(NSTEPS=10, start_step=3, select_ckeys=['flux'])   # parse and store 'flux'
+    np.testing.assert_array_equal(data['flux'], values[3:13, 2:5])
+    assert jfile.cache.missing(['flux', 'Temp']) == ['Temp']
+
+    jfile = tc.i_o.TableFile(filename, cache=cache_dir)
+    assert jfile.cache.columns.keys() == {'flux'}
+    data = jfile.read_datalines(NSTEPS=10, start_step=3, select_ckeys=['flux', 'Temp'], max_vector_dim=2)
+    assert isinstance(data['flux'], np.memmap)
+    np.testing.assert_array_equal(data['flux'], values[3:13, 2:4])
+    np.testing.assert_array_equal(data['Temp'], values[3:13, [1]])
+    data = jfile.read_datalines(NSTEPS=5, select_ckeys=['Temp'])   # continue from the current step
+    np.testing.assert_array_equal(data['Temp'], values[13:17, [1]])
+
+    # a modified file invalidates the entry
+    with open(filename, 'a') as f:
+        f.write(' '.join(['0'] * 8) + '\n')
+    jfile = tc.i_o.TableFile(filename, cache=cache_dir)
+    assert not jfile.cache.columns
+    assert len(os.listdir(cache_dir)) == 0
+
+    # eviction of the least recently used entries
+    jfile.read_datalines(select_ckeys=['Temp'])
+    jfile = tc.i_o.TableFile(filename, cache=cache_dir, group_vectors=False, cache_max_size=1)
+    jfile.read_datalines(select_ckeys=['Temp'])
+    assert os.listdir(cache_dir) == [os.path.basename(jfile.cache.path)]
+    tc.i_o.column_cache.clear_cache(cache_dir)
+    assert len(os.listdir(cache_dir)) == 0
+
+    # nothing is stored if no step is read
+    empty = tmpdir.join('empty.dat')
+    empty.write('Step Temp\n')
+    jfile = tc.i_o.TableFile(str(empty), cache=cache_dir)
+    assert jfile.read_datalines(select_ckeys=['Temp']) is None
+    assert not jfile.cache.columns and (len(os.listdir(cache_dir)) == 0)
+
+
+def test_tablefile_parallel(table_path, tmpdir):
+    import thermocepstrum as tc
+
+    filename, values = table_path
+    jfile = tc.i_o.TableFile(filename, nprocs=3)
+    data = jfile.read_datalines(start_step=0, select_ckeys=['Temp', 'flux'])
+    np.testing.assert_array_equal(data['Temp'], values[:1000, [1]])
+    np.testing.assert_array_equal(data['flux'], values[:1000, 2:5])
+    data = jfile.read_datalines(NSTEPS=11, start_step=600, select_ckeys=['flux'], even_NSTEPS=False)
+    np.testing.assert_array_equal(data['flux'], values[600:611, 2:5])
+    data = jfile.read_datalines(NSTEPS=2, select_ckeys=['flux'])
+    np.testing.assert_array_equal(data['flux'], values[611:613, 2:5])
+
+    # stop at a malformed line, as in the serial parser
+    filename = tmpdir.join('malformed.dat')
+    filename.write('Step Temp\n' + ''.join('{:d} {:d}.0\n'.format(i, i) for i in range(500)) + '500\n501 1.0\n')
+    jfile = tc.i_o.TableFile(str(filename), nprocs=4)
+    data = jfile.read_datalines(start_step=0, select_ckeys=['Temp'])
+    np.testing.assert_array_equal(data['Temp'][:, 0], np.arange(500.))
+    assert jfile.file.readline() == b'500\n'
+
+
+def test_tablefile_line_index(table_path):
+    import os
+    import thermocepstrum as tc
+
+    filename, values = table_path
+    index_file = filename + '.lineindex.npz'
+    jfile = tc.i_o.TableFile(filename, group_vectors=True, index_file=True)
+    assert os.path.isfile(index_file)
+    jfile.index = tc.i_o.line_index.LineIndex(filename, start=jfile._start_byte, stride=100)   # index 1 line every 100
+    for start_step in [0, 99, 100, 101, 999, 1000]:
+        data = jfile.read_datalines(NSTEPS=1, start_step=start_step, select_ckeys=['Step'], even_NSTEPS=False)
+        np.testing.assert_array_equal(data['Step'], values[start_step:start_step + 1, [0]])
+    assert jfile.read_datalines(NSTEPS=2, start_step=1001, select_ckeys=['Step']) is None   # EOF
+    jfile._nprocs = 3   # parallel ranges split at the indexed lines
+    data = jfile.read_datalines(NSTEPS=700, start_step=150, select_ckeys=['flux'])
+    np.testing.assert_array_equal(data['flux'], values[150:850, 2:5])
+
+    jfile = tc.i_o.TableFile(filename, group_vectors=True, index_file=True)   # load the sidecar index
+    assert jfile.MAX_NSTEPS == 1001
+    data = jfile.read_datalines(NSTEPS=10, start_step=500, select_ckeys=['flux'])
+    np.testing.assert_array_equal(data['flux'], values[500:510, 2:5])
+
+
+def test_lammpslogfile_runs(tmpdir):
+    import thermocepstrum as tc
+    from thermocepstrum.i_o.read_lammps_log import list_runs
+
+    def block(steps):
+        return ''.join('{:d} {:.1f} {:.1f}\n'.format(s, 2. * s, -s) for s in steps)
+
+    filename = tmpdir.join('log.lammps')
+    equilibration = ''.join('{:d} 1.0\n'.format(s) for s in range(0, 101, 10))
+    filename.write('# EQUILIBRATION\nrun 100\nStep Temp\n' + equilibration +
+                   'Loop time of 1.0 on 1 procs for 100 steps\n# PRODUCTION RUN\nrun 300\nStep Temp c_flux[1]\n' +
+                   block(range(100, 401)) + 'Loop time of 1.0 on 1 procs for 300 steps\n' +
+                   'run 200\n   Step   Temp   c_flux[1]  \n' + block(range(400, 601)))   # interrupted run
+    runs = list_runs(str(filename))
+    assert [run['nlines'] for run in runs] == [11, 301, 201]
+    assert [(run['first_step'], run['last_step'], run['complete']) for run in runs] == \
+           [(0, 100, True), (100, 400, True), (400, 600, False)]
+    assert runs[1]['command'] == 'run 300'
+
+    # consecutive runs: the repeated step 400 is read once
+    logfile = tc.i_o.LAMMPSLogFile(str(filename), runs=[1, 2])
+    assert logfile.MAX_NSTEPS == 501
+    data = logfile.read_datalines(select_ckeys=['Step', 'flux'], even_NSTEPS=False)
+    np.testing.assert_array_equal(data['Step'][:, 0], np.arange(100, 601))
+    np.testing.assert_array_equal(data['flux'][:, 0], -np.arange(100, 601))
+    data = logfile.read_datalines(NSTEPS=10, start_step=296, select_ckeys=['Step'])
+    np.testing.assert_array_equal(data['Step'][:, 0], np.arange(396, 406))
+    chunks = list(logfile.iter_chunks(120, select_ckeys=['Step'], start_step=0))   # chunks across the two runs
+    assert [chunk['Step'].shape[0] for chunk in chunks] == [120, 120, 120, 120, 21]
+    np.testing.assert_array_equal(np.concatenate([chunk['Step'] for chunk in chunks])[:, 0], np.arange(100, 601))
+
+    logfile = tc.i_o.LAMMPSLogFile(str(filename), run_keyword='PRODUCTION RUN')
+    assert logfile.MAX_NSTEPS == 301
+    data = logfile.read_datalines(select_ckeys=['Step'], even_NSTEPS=False)
+    np.testing.assert_array_equal(data['Step'][:, 0], np.arange(100, 401))
+
+
+def test_lammpslogfile_follow(tmpdir):
+    import thermocepstrum as tc
+
+    def block(steps):
+        return ''.join('{:d} {:.1f} {:.1f}\n'.format(s, 2. * s, -s) for s in steps)
+
+    filename = tmpdir.join('log.lammps')
+    filename.write('run 100\nStep Temp\n0 1.0\n100 1.0\nLoop time of 1.0 on 1 procs for 100 steps\n' +
+                   'run 1000\nStep Temp c_flux[1]\n' + block(range(100, 150)) + '150 300')   # partial last line
+    logfile = tc.i_o.LAMMPSLogFile(str(filename), runs=-1)
+    assert logfile.follow(select_ckeys=['Step', 'flux']) == 50
+    assert logfile.follow() == 0
+    filename.write('.0 -150.0\n' + block(range(151, 400)) + 'WARNING: skipped\n' + block(range(400, 500)), mode='a')
+    assert logfile.follow() == 350
+    assert not logfile.follow_complete
+    filename.write(block(range(500, 510)) + 'Loop time of 1.0 on 1 procs for 1000 steps\n' + block(range(2)), mode='a')
+    assert logfile.follow() == 10
+    assert logfile.follow_complete and (logfile.follow() == 0)
+    np.testing.assert_array_equal(logfile.data['Step'][:, 0], np.arange(100, 510))
+    np.testing.assert_array_equal(logfile.data['flux'][:, 0], -np.arange(100, 510))
+
+
+def test_extract_lammps_thermo(tmpdir):
+    from thermocepstrum.i_o.extract_lammps_thermo import extract_thermo_files
+
+    filenames = []
+    for k in range(2):
+        filename = tmpdir.join('log{:d}.lammps'.format(k))
+        filename.write('run 10\nStep Temp\n0 1.0\nLoop time of 1.0\n# DUMP_RUN\nrun 100\n' +
+                       'Step Temp c_flux[1] c_flux[2]\n' +
+                       ''.join('{:d} {:d}.0 {:.1f} {:d}\n'.format(s, k, 0.5 * s, -s) for s in range(101)) +
+                       'WARNING: stop\nLoop time of 1.0\n')
+        filenames.append(str(filename))
+    stats = extract_thermo_files(filenames, ['Step', 'Temp', 'flux'], output_dir=str(tmpdir), nprocs=2,
+                                 run_keyword='DUMP_RUN', start_step=1000, last_step=50, skip_first=True, volume=8.)
+    assert [s['nsteps'] for s in stats] == [50, 50]
+    for k, s in enumerate(stats):
+        data = np.load(s['output'], allow_pickle=True).tolist()
+        assert set(data.keys()) == {'Step', 'Temp', 'flux', 'Volume'}
+        np.testing.assert_array_equal(data['Step'][:, 0], np.arange(1001, 1051))
+        np.testing.assert_array_equal(data['Temp'][:, 0], k)
+        np.testing.assert_array_equal(data['flux'], np.c_[0.5 * np.arange(1, 51), -np.arange(1, 51)])
+        assert data['Volume'] == 8.
+
+    # 'Step' is needed to find last_step, but it is saved only if selected
+    stats = extract_thermo_files(filenames[:1], ['flux'], output_dir=str(tmpdir), run_keyword='DUMP_RUN', last_step=50)
+    assert set(np.load(stats[0]['output'], allow_pickle=True).tolist().keys()) == {'flux'}
+
+
+def test_extract_lammps_thermo_exit_status(tmpdir):
+    import sys
+    import subprocess
+
+    args = [sys.executable, '-m', 'thermocepstrum.i_o.extract_lammps_thermo', str(tmpdir.join('missing.lammps'))]
+    result = subprocess.run(args, stdout=subprocess.PIPE)
+    assert b'ERROR' in result.stdout   # the failure is reported
+    assert result.returncode == 1
+
+
+@pytest.mark.parametrize('fmt', ['%12.6f', '%g'])   # fixed-width and variable-width columns
+def test_lammps_dump_frame_index(tmpdir, fmt):
+    import os
+    import thermocepstrum as tc
+
+    natoms, nframes = 4, 30
+    values = np.arange(nframes * natoms * 2).reshape((nframes, natoms, 2)) * 1.5
+    filename = str(tmpdir.join('dump.lammpstrj'))
+    with open(filename, 'w') as f:
+        for k in range(nframes):
+            f.write('ITEM: TIMESTEP\n{:d}\nITEM: NUMBER OF ATOMS\n{:d}\n'.format(10 * k, natoms) +
+                    'ITEM: BOX BOUNDS pp pp pp\n0 1\n0 1\n0 1\nITEM: ATOMS id vx vy\n')
+            for i in reversed(range(natoms)):   # unsorted atoms
+                f.write(('%d ' + fmt + ' ' + fmt + '\n') % (i + 1, values[k, i, 0], values[k, i, 1]))
+
+    traj = tc.i_o.LAMMPS_Dump(filename, index_file=True)
+    assert os.path.isfile(filename + '.frameindex.npz')
+    np.testing.assert_array_equal(traj.all_timesteps, 10 * np.arange(nframes))
+    data = traj.read_timesteps((50, 250, 40), select_ckeys=['vx', 'vy'])
+    assert [frame['TIMESTEP'] for frame in data] == [80, 120, 160, 200, 240]
+    for frame in data:
+        np.testing.assert_allclose(np.c_[frame['vx'], frame['vy']], values[frame['TIMESTEP'] // 10])
+    data = traj.read_timesteps(2, start_step=0, select_ckeys=['vx'])   # go back to the first frame
+    np.testing.assert_allclose(data[1]['vx'][:, 0], values[1, :, 0])
+
+    traj = tc.i_o.LAMMPS_Dump(filename, index_file=True)   # load the sidecar index
+    np.testing.assert_array_equal(traj.frame_index.offsets, tc.i_o.read_lammps_dump.scan_frames(filename)[0])
+
+
+@pytest.mark.parametrize('storage', ['list', 'array', 'memmap'])
+def test_lammps_dump_storage(tmpdir, storage):
+    import os
+    import gc
+    import thermocepstrum as tc
+
+    natoms, nframes = 6, 5
+    rng = np.random.RandomState(0)
+    values = rng.randn(nframes, natoms, 3)
+    filename = str(tmpdir.join('dump.lammpstrj'))
+    with open(filename, 'w') as f:
+        for k in range(nframes):
+            f.write('ITEM: TIMESTEP\n{:d}\nITEM: NUMBER OF ATOMS\n{:d}\n'.format(k, natoms) +
+                    'ITEM: BOX BOUNDS pp pp pp\n0 1\n0 1\n0 1\nITEM: ATOMS id element vx vy vz\n')
+            for i in rng.permutation(natoms):   # unsorted atoms
+                f.write('{:d} {} {!r} {!r} {!r}\n'.format(i + 1, 'Na' if (i % 2) else 'Cl', *values[k, i]))
+
+    traj = tc.i_o.LAMMPS_Dump(filename, storage=storage, memmap_dir=str(tmpdir))
+    data = traj.read_timesteps((1, 5), select_ckeys=['element', 'vx', 'vy'])
+    if (storage == 'list'):
+        data = {key: np.array([frame[key] for frame in data]) for key in ['TIMESTEP', 'element', 'vx', 'vy']}
+    else:
+        assert data['vx'].shape == (4, natoms, 1)
+    np.testing.assert_array_equal(data['TIMESTEP'], [1, 2, 3, 4])
+    np.testing.assert_array_equal(data['vx'][:, :, 0], values[1:, :, 0])
+    np.testing.assert_array_equal(data['vy'][:, :, 0], values[1:, :, 1])
+    np.testing.assert_array_equal(data['element'][0, :, 0], [b'Cl', b'Na'] * (natoms // 2))
+    if (storage == 'memmap'):
+        np.testing.assert_array_equal(np.load(str(tmpdir.join('vx.npy'))), data['vx'])
+
+        # default memmap_dir: a temporary directory, removed by close or when the object is deleted
+        traj = tc.i_o.LAMMPS_Dump(filename, storage=storage)
+        data = traj.read_timesteps((1, 5), select_ckeys=['vx'])
+        memmap_dir = traj._memmap_dir
+        np.testing.assert_array_equal(np.load(os.path.join(memmap_dir, 'vx.npy')), data['vx'])
+        traj.close()
+        assert not os.path.exists(memmap_dir)
+        traj = tc.i_o.LAMMPS_Dump(filename, storage=storage)
+        traj.read_timesteps((1, 5), select_ckeys=['vx'])
+        memmap_dir = traj._memmap_dir
+        del traj, data
+        gc.collect()
+        assert not os.path.exists(memmap_dir)
+
+
+def _write_binary_dump(filename, values, columns=None, nprocs=2, triclinic=False):
+    """Write a LAMMPS binary dump (new format if columns are given), with the atoms split among nprocs chunks."""
+    import struct
+    nframes, natoms, size_one = values.shape
+    rng = np.random.RandomState(1)
+    with open(filename, 'wb') as f:
+        for k in range(nframes):
+            if columns is not None:
+                f.write(struct.pack('<q', -10) + b'DUMPCUSTOM' + struct.pack('<ii', 1, 2))
+            f.write(struct.pack('<qqi6i', 10 * k, natoms, int(triclinic), *([0] * 4 + [1, 2])))
+            f.write(struct.pack('<6d', 0., 1., 0., 2., 0., 3.))
+            if triclinic:
+                f.write(struct.pack('<3d', 0.1, 0.2, 0.3))
+            f.write(struct.pack('<i', size_one))
+            if columns is not None:
+                units = b'metal' if (k == 0) else b''
+                f.write(struct.pack('<i', len(units)) + units + struct.pack('<bd', 1, 0.5 * k))
+                f.write(struct.pack('<i', len(columns)) + columns.encode())
+            order = rng.permutation(natoms)   # unsorted atoms
+            f.write(struct.pack('<i', nprocs))
+            for atoms in np.array_split(order, nprocs):
+                f.write(struct.pack('<i', atoms.size * size_one))
+                values[k, atoms].astype('<f8').tofile(f)
+
+
+@pytest.mark.parametrize('new_format', [True, False])
+def test_lammps_binary_dump(tmpdir, new_format):
+    import thermocepstrum as tc
+
+    natoms, nframes = 7, 6
+    values = np.random.RandomState(0).randn(nframes, natoms, 5)
+    values[:, :, 0] = np.arange(1, natoms + 1)   # atom ids
+    filename = str(tmpdir.join('dump.bin'))
+    columns = 'id type c_flux[1] c_flux[2] c_flux[3]'
+    _write_binary_dump(filename, values, columns if new_format else None, triclinic=new_format)
+
+    if not new_format:
+        with pytest.raises(ValueError):
+            tc.i_o.LAMMPS_BinaryDump(filename)
+    traj = tc.i_o.LAMMPS_BinaryDump(filename, columns=columns, index_file=True, storage='array')
+    assert traj.NATOMS == natoms
+    assert traj.BOX_BOUNDS_TYPE == ['pp', 'pp', 'fs']
+    assert traj.BOX_BOUNDS.shape == ((3, 3) if new_format else (3, 2))
+    assert traj.UNITS == ('metal' if new_format else None)
+    np.testing.assert_array_equal(traj.all_timesteps, 10 * np.arange(nframes))
+    data = traj.read_timesteps((10, 50, 20), select_ckeys=['type', 'flux'])
+    np.testing.assert_array_equal(data['TIMESTEP'], [20, 40])
+    np.testing.assert_array_equal(data['flux'], values[[2, 4], :, 2:])
+    np.testing.assert_array_equal(data['type'][:, :, 0], values[[2, 4], :, 1])
+
+    traj = tc.i_o.LAMMPS_BinaryDump(filename, columns=columns, preload=False)   # no frame index
+    traj.gototimestep(0)
+    data = traj.read_timesteps(3, start_step=20, select_ckeys=['flux'])
+    np.testing.assert_array_equal(np.array([frame['flux'] for frame in data]), values[2:5, :, 2:])
+
+
+def test_tablefile_iter_chunks(table_path):
+    import thermocepstrum as tc
+
+    filename, values = table_path
+    jfile = tc.i_o.TableFile(filename, group_vectors=True)
+    chunks = list(jfile.iter_chunks(300, select_ckeys=['Step', 'flux'], start_step=50))
+    assert [chunk['flux'].shape[0] for chunk in chunks] == [300, 300, 300, 51]
+    np.testing.assert_array_equal(np.concatenate([chunk['flux'] for chunk in chunks]), values[50:, 2:5])
+    chunks = list(jfile.iter_chunks(4, select_ckeys=['Step'], start_step=10, NSTEPS=10))
+    np.testing.assert_array_equal(np.concatenate([chunk['Step'] for chunk in chunks])[:, 0], values[10:20, 0])
+    data = jfile.read_datalines(NSTEPS=2, select_ckeys=['Step'])   # the file position is kept
+    np.testing.assert_array_equal(data['Step'][:, 0], values[20:22, 0])
+
+
+@pytest.mark.parametrize('module', ['gzip', 'bz2', 'lzma'])
+def test_compressed_input(table_path, tmpdir, module):
+    import importlib
+    import thermocepstrum as tc
+    from thermocepstrum.i_o import compressed
+
+    filename, values = table_path
+    compress = importlib.import_module(module).compress
+    with open(filename, 'rb') as f:
+        content = f.read()
+    zfilename = str(tmpdir.join('table.dat.z'))
+    with open(zfilename, 'wb') as f:   # two concatenated streams
+        f.write(compress(content[:5000]) + compress(content[5000:]))
+
+    jfile = tc.i_o.TableFile(zfilename, group_vectors=True)
+    assert jfile.MAX_NSTEPS == values.shape[0]
+    data = jfile.read_datalines(start_step=0, select_ckeys=['flux'], even_NSTEPS=False)
+    np.testing.assert_array_equal(data['flux'], values[:, 2:5])
+    data = jfile.read_datalines(NSTEPS=10, start_step=700, select_ckeys=['Step'])   # seek backward
+    np.testing.assert_array_equal(data['Step'][:, 0], values[700:710, 0])
+    with compressed.open_file(zfilename) as f:
+        f.seek(20000)
+        assert f.read(100) == content[20000:20100]
+        f.seek(10)
+        assert f.readline() == content[10:content.index(b'\n', 10) + 1]
+
+
+def test_chunked_store(tmpdir):
+    import thermocepstrum as tc
+    from thermocepstrum.i_o.read_lammps_log import save_hc_store
+
+    path = str(tmpdir.join('flux.store'))
+    values = np.arange(100 * 3, dtype=np.float64).reshape((100, 3))
+    temp = 300. + np.sin(np.arange(100.))
+    store = tc.i_o.ChunkedStore(path, mode='a', chunk_steps=16)
+    for a, b in [(0, 5), (5, 40), (40, 100)]:   # segments across the chunk boundaries
+        store.append({'flux': values[a:b], 'Temp': temp[a:b]})
+    store.set_attrs(DT=2., box=np.eye(2))
+
+    store = tc.i_o.ChunkedStore(path)
+    assert (store.NSTEPS, store.nchunks) == (100, 7)
+    assert isinstance(store.read('flux', 17, 30), np.memmap)   # contained in a chunk
+    np.testing.assert_array_equal(store.read('flux', 10, 90), values[10:90])
+    np.testing.assert_array_equal(store.column('flux')[95:, 1], values[95:, 1])
+    np.testing.assert_array_equal(store.stack(['flux', 'flux'], 3, 50, cols=[2, 0]), [values[3:50, [2, 0]]] * 2)
+    out = np.memmap(str(tmpdir.join('currents.bin')), dtype=np.float32, mode='w+', shape=(1, 80, 3))
+    assert store.stack(['flux'], 10, 90, out=out) is out   # filled in place
+    np.testing.assert_array_equal(out[0], values[10:90])
+    np.testing.assert_allclose([store.mean('Temp'), store.std('Temp')], [np.mean(temp), np.std(temp)])
+    data = store.as_dict(['flux'])
+    assert (data['DT'] == 2.) and (data['Temp_ave'] == store.mean('Temp'))
+    np.testing.assert_array_equal(data['box'], np.eye(2))
+    with pytest.raises(IOError):
+        store.append({'flux': values, 'Temp': temp})   # read-only
+
+    # stream a log file into a store
+    filename = tmpdir.join('log.lammps')
+    lines = ''.join('{:d} {:.1f} {:.1f} {:.1f} {:.1f}\n'.format(2 * s, temp[s], *values[s]) for s in range(100))
+    filename.write('run 10\nStep Temp c_flux[1] c_flux[2] c_flux[3]\n' + lines + 'Loop time of 1.0\n')
+    logfile = tc.i_o.LAMMPSLogFile(str(filename), runs=0)
+    store = save_hc_store(logfile, ['flux'], None, str(tmpdir.join('log.store')), chunk_steps=30)
+    assert (store.NSTEPS, store.attrs['DT']) == (100, 2.)
+    np.testing.assert_array_equal(store.read('flux'), values)
+    np.testing.assert_allclose(store.mean('Temp'), np.mean(np.round(temp, 1)))
+
+    # an existing store is resumed, not appended again
+    filename.write('run 10\nStep Temp c_flux[1] c_flux[2] c_flux[3]\n' + lines + lines + 'Loop time of 1.0\n')
+    logfile = tc.i_o.LAMMPSLogFile(str(filename), runs=0)
+    store = save_hc_store(logfile, ['flux'], None, str(tmpdir.join('log.store')))
+    assert (store.NSTEPS, store.chunk_steps) == (200, 30)
+    np.testing.assert_array_equal(store.read('flux'), np.concatenate([values, values]))
+    np.testing.assert_allclose(store.mean('Temp'), np.mean(np.round(temp, 1)))
+    assert save_hc_store(logfile, ['flux'], None, str(tmpdir.join('log.store'))).NSTEPS == 200
+
+
+def test_read_lammps_log_cli(tmpdir):
+    import sys
+    import subprocess
+    import thermocepstrum as tc
+
+    filename = tmpdir.join('log.lammps')
+    filename.write('run 10\nStep Temp c_flux[1] c_flux[2]\n' +
+                   ''.join('{:d} 300.0 {:.1f} {:.1f}\n'.format(2 * s, s, -s) for s in range(10)) + 'Loop time of 1.0\n')
+    structure = tmpdir.join('structure.data')
+    structure.write('\n0.0 2.0 xlo xhi\n0.0 3.0 ylo yhi\n0.0 4.0 zlo zhi\n')
+    args = [sys.executable, '-m', 'thermocepstrum.i_o.read_lammps_log', str(filename), str(structure)]
+
+    # the output is a numpy file, whatever its name
+    subprocess.run(args + [str(tmpdir.join('flux')), '-k', 'flux', '-r', '0'], check=True, stdout=subprocess.DEVNULL)
+    data = np.load(str(tmpdir.join('flux.npz')))
+    np.testing.assert_array_equal(data['flux'], np.c_[np.arange(10.), -np.arange(10.)])
+    assert (data['DT'], data['Volume']) == (2, 24.)
+
+    subprocess.run(args + [str(tmpdir.join('flux.store')), '-k', 'flux', '-r', '0', '--store'], check=True,
+                   stdout=subprocess.DEVNULL)
+    store = tc.i_o.ChunkedStore(str(tmpdir.join('flux.store')))
+    np.testing.assert_array_equal(store.read('flux'), data['flux'])
+    assert (store.attrs['DT'], store.attrs['Volume']) == (2, 24.)
+
+
+def test_md_currents_readers(tmpdir):
+    import thermocepstrum as tc
+
+    values = np.arange(20 * 8, dtype=np.float64).reshape((20, 8)) + 0.5
+    filename = tmpdir.join('compute.out')   # T (2 groups), jp, jk
+    with filename.open('w') as f:
+        np.savetxt(f, values, fmt='%.1f')
+    jfile = tc.i_o.GPUMDFile(str(filename), quantities=['jk', 'jp', 'T'], ngroups=2)
+    assert jfile.MAX_NSTEPS == 20
+    data = jfile.read_datalines(start_step=0, select_ckeys=['flux', 'Temp'])
+    assert set(data.keys()) == {'flux', 'Temp'}
+    np.testing.assert_array_equal(data['Temp'], values[:, :2])
+    np.testing.assert_array_equal(data['flux'], values[:, 2:5] + values[:, 5:8])
+    chunks = list(jfile.iter_chunks(8, select_ckeys=['flux', 'jk'], start_step=0))
+    assert [sorted(chunk.keys()) for chunk in chunks] == [['flux', 'jk']] * 3
+    np.testing.assert_array_equal(np.concatenate([chunk['jk'] for chunk in chunks]), values[:, 5:8])
+
+    filename = tmpdir.join('current_hz')
+    filename.write('# step time J\n\n' +
+                   ''.join('{:d} {:.1f} {:.1f} {:.1f} {:.1f}\n'.format(s, 0.1 * s, *values[s, :3]) for s in range(20)))
+    jfile = tc.i_o.QEHeatFile(str(filename))
+    data = jfile.read_datalines(NSTEPS=10, start_step=5, select_ckeys=['Step', 'flux'])
+    np.testing.assert_array_equal(data['Step'][:, 0], np.arange(5, 15))
+    np.testing.assert_array_equal(data['flux'], values[5:15, :3])
+    with pytest.raises(ValueError):
+        tc.i_o.DLPOLYFile(str(filename))   # wrong number of columns
+
+
+def test_prefetch_chunks(table_path):
+    import thermocepstrum as tc
+    from thermocepstrum.i_o.prefetch import prefetch_chunks
+
+    filename, values = table_path
+    jfile = tc.i_o.TableFile(filename)
+    chunks = [chunk['flux'].copy() for chunk in prefetch_chunks(jfile, 300, select_ckeys=['flux'], start_step=0)]
+    assert [chunk.shape[0] for chunk in chunks] == [300, 300, 300, 101]
+    np.testing.assert_array_equal(np.concatenate(chunks), values[:, 2:5])
+
+    for chunk in prefetch_chunks(jfile, 100, select_ckeys=['Temp'], start_step=0, nbuffers=3):
+        break   # the reading thread is stopped
+    with pytest.raises(KeyError):   # errors of the reading thread are raised by the consumer
+        list(prefetch_chunks(jfile, 100, select_ckeys=['nokey'], start_step=0))
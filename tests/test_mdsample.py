@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+def test_zero_copy_currents(tmpdir, capsys):
+    """C-contiguous arrays and memmaps are stored as views, and the main current factor is applied to the spectrum."""
+    import thermocepstrum as tc
+
+    traj = np.random.RandomState(3).randn(2, 1000, 3)
+    mm = np.memmap(str(tmpdir.join('currents.bin')), dtype=np.float64, mode='w+', shape=traj.shape)
+    mm[:] = traj
+    params = dict(DT_FS=1.0, UNITS='metal', TEMPERATURE=300., VOLUME=1000., PSD_FILTER_W=5.)
+    for source in (traj, mm):
+        j = tc.HeatCurrent(source, MAIN_CURRENT_INDEX=1, MAIN_CURRENT_FACTOR=3.0, **params)
+        assert np.shares_memory(j.traj, source) and np.shares_memory(j.otherMD[0].traj, source)
+        np.testing.assert_array_equal(j.traj, traj[1])   # not scaled
+        ref = tc.HeatCurrent(np.array([3.0 * traj[1], traj[0]]), **params)
+        np.testing.assert_allclose(j.psd, ref.psd, rtol=1e-12)
+        np.testing.assert_allclose(j.cospectrum, ref.cospectrum, rtol=1e-12, atol=1e-14)
+        jr = j.resample(TSKIP=4, plot=False, verbose=False)
+        np.testing.assert_allclose(jr.psd, ref.resample(TSKIP=4, plot=False, verbose=False).psd, rtol=1e-12)
+    capsys.readouterr()
+    j = tc.HeatCurrent(traj[0], MAIN_CURRENT_FACTOR=2.0, **params)
+    assert np.shares_memory(j.traj, traj) and ('copied' not in capsys.readouterr().out)
+    ref = tc.HeatCurrent(2.0 * traj[0], **params)
+    j.compute_acf()
+    ref.compute_acf()
+    np.testing.assert_allclose(j.acf, ref.acf, rtol=1e-12, atol=1e-14)
+    j = tc.HeatCurrent(traj[:, ::2], **params)   # not contiguous: copied, with a warning
+    assert not np.shares_memory(j.traj, traj) and ('copied' in capsys.readouterr().out)
+    assert np.shares_memory(j.traj, j.currents) and np.shares_memory(j.otherMD[0].traj, j.currents)
+
+
+def test_lazy_derived_attributes():
+    """The derived spectral attributes are computed on first access, and discarded when their inputs change."""
+    import thermocepstrum as tc
+
+    traj = np.random.RandomState(4).randn(2000, 3)
+    j = tc.HeatCurrent(traj, DT_FS=2.0, UNITS='metal', TEMPERATURE=300., VOLUME=1000., PSD_FILTER_W=5.)
+    assert not {'logpsd', 'psd_power', 'fpsd', 'flogpsd', 'freqs_THz'} & set(vars(j))
+    np.testing.assert_allclose(j.logpsd, np.log(j.psd))
+    np.testing.assert_allclose(j.freqs_THz, j.freqs * 500.)
+    fpsd = j.fpsd
+    assert 'fpsd' in vars(j) and j.fpsd is fpsd
+    j.filter_psd(10.)
+    assert 'fpsd' not in vars(j)
+    np.testing.assert_allclose(j.fpsd, tc.md.tools.filter.runavefilter(j.psd, j.PSD_FILTER_WF))
+    assert j.PSD_FILTER_WF > 0 and not np.allclose(j.fpsd, fpsd)
+    j.psd = 2. * j.psd
+    np.testing.assert_allclose(j.psd_power, np.trapz(j.psd))
+    np.testing.assert_allclose(j.flogpsd, tc.md.tools.filter.runavefilter(np.log(j.psd), j.PSD_FILTER_WF))
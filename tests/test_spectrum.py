@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import pytest
+import numpy as np
+
+
+def test_mdsample_spectrum_cache():
+    """The spectrum of the trajectory is computed once, and the periodogram and the cospectrum are derived from it."""
+    from scipy.signal import periodogram
+    import thermocepstrum as tc
+    from thermocepstrum.md.tools.acf import acovf
+
+    rng = np.random.RandomState(0)
+    traj, other = rng.randn(2, 1000, 3)
+    x = tc.md.MDSample(traj=traj, DT_FS=2.0)
+    x.compute_psd()
+    spectrALL = x.spectrALL
+    freqs, psdALL = periodogram(traj, detrend=None, axis=0)
+    np.testing.assert_allclose(x.psd, 2.0 * np.mean(psdALL, axis=1) * np.r_[1., [0.5] * (freqs.size - 2), 1.])
+    x.compute_psd(PSD_FILTER_W=0.1)
+    y = tc.md.MDSample(traj=other, DT_FS=2.0)
+    x.compute_kappa_multi([y])
+    assert x.spectrALL is spectrALL   # not computed again
+    np.testing.assert_allclose(x.cospectrum[0, 0].real, 2.0 / x.N * np.sum(np.abs(spectrALL)**2, axis=1))
+    x.compute_acf(NLAGS=50)
+    np.testing.assert_allclose(x.acf[:, 1], acovf(traj[:, 1], unbiased=True, fft=True)[:50])
+
+
+def test_fft_backend(monkeypatch):
+    from thermocepstrum.md.tools import fftbackend
+    from thermocepstrum.md.tools.acf import acovf, acovf_multi
+
+    x = np.random.RandomState(0).randn(1001, 3)
+    monkeypatch.setenv(fftbackend.ENV_BACKEND, 'numpy')
+    monkeypatch.setenv(fftbackend.ENV_WORKERS, '2')
+    fftbackend.set_backend()
+    try:
+        assert fftbackend.get_backend() == ('numpy', 2)
+        ref = np.fft.rfft(x, axis=0)
+        np.testing.assert_allclose(fftbackend.rfft(x, axis=0), ref)
+        assert fftbackend.rfft(x.astype(np.float32), axis=0).dtype == np.complex64
+        acov = acovf_multi(x, unbiased=True)
+        fftbackend.set_backend('scipy', workers=-1)
+        assert fftbackend.get_backend()[1] >= 1
+        np.testing.assert_allclose(fftbackend.rfft(x, axis=0), ref)
+        assert fftbackend.rfft(x.astype(np.float32), axis=0).dtype == np.complex64
+        np.testing.assert_allclose(acovf_multi(x, unbiased=True), acov)
+        np.testing.assert_allclose(acovf(x[:, 0], unbiased=True, fft=True), acov[:, 0])
+        assert fftbackend.next_fast_len(2003) == 2025
+        with pytest.raises(ValueError):
+            fftbackend.set_backend('mkl')
+    finally:
+        monkeypatch.undo()
+        fftbackend.set_backend()
+
+
+def test_resample_spectral():
+    """The spectral resampling gives the periodogram of the time-domain resampling (exactly, if TSKIP divides N)."""
+    import thermocepstrum as tc
+
+    traj = np.random.RandomState(0).randn(2, 4000, 3)
+    j = tc.HeatCurrent(traj, DT_FS=1.0, UNITS='metal', TEMPERATURE=300., VOLUME=1000., PSD_FILTER_W=5.)
+    jt = j.resample(TSKIP=8, plot=False, verbose=False)
+    js = j.resample(TSKIP=8, plot=False, verbose=False, method='spectral')
+    assert js.traj is None
+    assert (js.NFREQS, js.DT_FS, js.Nyquist_f_THz) == (jt.NFREQS, jt.DT_FS, jt.Nyquist_f_THz)
+    np.testing.assert_allclose(js.psd, jt.psd, rtol=1e-9)
+    np.testing.assert_allclose(js.cospectrum, jt.cospectrum, rtol=1e-9, atol=1e-12 * np.max(np.abs(jt.cospectrum)))
+    np.testing.assert_allclose(js.fpsd, jt.fpsd, rtol=1e-9)
+    js = j.resample(TSKIP=7, plot=False, verbose=False, method='spectral')   # 7 does not divide N
+    assert js.NFREQS == 4000 // 7 // 2 + 1
+    np.testing.assert_allclose(np.mean(js.psd), np.mean(j.resample(TSKIP=7, plot=False, verbose=False).psd), rtol=0.1)
+    jf = j.fstar_analysis([4, 8], plot=False, method='spectral')
+    jt.cepstral_analysis()
+    np.testing.assert_allclose(jf[1].kappa_Kmin, jt.kappa_Kmin, rtol=1e-8)
+
+
+def test_cospectrum_chunks():
+    """The chunked cospectrum and its Schur complement match the full cospectrum tensor and its inverse."""
+    from thermocepstrum.md.tools.spectrum import cospectrum
+
+    rs = np.random.RandomState(1)
+    spectra = [rs.randn(1001, 4) + 1j * rs.randn(1001, 4) for _ in range(3)]
+    covar = 0.5 * np.einsum('a...,b...->ab...', np.array(spectra), np.array(spectra).conj()).sum(axis=3)
+    ref = (np.linalg.inv(covar.transpose((2, 0, 1)))[:, 0, 0]**-1).real
+    for L in (1, 3):
+        cospectr, schur = cospectrum(spectra[:L], scale=0.5, chunk=64)
+        np.testing.assert_allclose(cospectr, covar[:L, :L], rtol=1e-12)
+        if (L == 1):
+            np.testing.assert_allclose(schur, covar[0, 0].real, rtol=1e-12)
+        else:
+            np.testing.assert_allclose(schur, ref, rtol=1e-10)
+
+
+def test_multi_current_batched_spectra():
+    """The spectra of all the currents are computed by one transform of the currents buffer, and shared."""
+    import thermocepstrum as tc
+
+    traj = np.random.RandomState(2).randn(3, 1001, 3)
+    j = tc.HeatCurrent(traj, DT_FS=1.0, UNITS='metal', TEMPERATURE=300., VOLUME=1000., MAIN_CURRENT_INDEX=1,
+                       MAIN_CURRENT_FACTOR=2.0)
+    assert j.currents.shape == (3, 1001, 3) and j.currents.flags['C_CONTIGUOUS']
+    assert np.shares_memory(j.traj, j.currents) and all(np.shares_memory(x.traj, j.currents) for x in j.otherMD)
+    assert j.N == 1000 and all(x.N == 1000 for x in j.otherMD)
+    for x, ref in zip([j] + j.otherMD, [2.0 * traj[1], traj[0], traj[2]]):
+        np.testing.assert_allclose(x.spectrALL, np.fft.rfft(ref[:1000], axis=0), rtol=1e-10, atol=1e-10)
+        assert x.NFREQS == 501 and x.Nyquist_f_THz == j.Nyquist_f_THz
+    assert j.spectrALL.base is not None and all(x.spectrALL.base is j.spectrALL.base for x in j.otherMD)
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import tempfile
 from sys import path, argv
 import argparse
 import numpy as np
@@ -45,7 +46,8 @@ def main():
     INPUT FORMAT:
      - table  : a column-formatted text file, with a header in the same format of LAMMPS. The name of the LAMMPS compute can start with c_ and end with [#some_number], the code will recognize vectors, and will read automatically all the components.
      - dict   : a Numpy binary file containing a dictionary (e.g. obtained from the script i_o/read_lammps_log.py)
-     - LAMMPS : a LAMMPS log file. In this case a --run-keyword  must be provided, that identifies the run to be read (see documentation of i_o/read_lammps_log.py)
+     - LAMMPS : a LAMMPS log file. In this case a --run-keyword  must be provided, that identifies the run to be read, or the --runs indexes (see documentation of i_o/read_lammps_log.py)
+    The columns parsed from table and LAMMPS files can be stored in a binary cache (--cache, or set the THERMOCEPSTRUM_CACHE_DIR environment variable), so that later runs on the same file do not parse the text again.
     The average temperature is computed if a column with the header 'Temp' is found; otherwise you have to specify it.
     You must provide the name of the heat flux compute. You can also provide additional currents if your system is a multi-component fluid.
     (Notice that the output is the same with any number of components. If you have a lots of components, note that you may want to use more than 3 independent processes -- see theory.)
@@ -98,10 +100,17 @@ def main():
     parser.add_argument('-k', '--heatfluxkey', type=str, required=True, help='Name of the column keyword that identifies the heat flux')
     parser.add_argument('-N', '--nsteps', type=int, default=0, help='Number of steps to read (default: 0=all)')
     parser.add_argument('-S', '--start-step', type=int, default=0, help='The first step to read (default: 0=first)')
-    parser.add_argument('--input-format', default='table', type=str, choices=['table','dict','lammps'], help='Format of the input file')
+    parser.add_argument('--input-format', default='table', type=str, choices=['table','dict','lammps','store','gpumd','dlpoly','qe'], help='Format of the input file (store: a chunked store directory, see i_o/chunked_store.py; gpumd: GPUMD compute.out; dlpoly: DL_POLY heat flux; qe: QEHeat all_currents output)')
     parser.add_argument('--cindex', nargs='*', type=int, help='Column indexes of the heatflux to read (0,1,2,...)')
     parser.add_argument('--sindex', nargs='*', type=int, help='Column indexes of the heatflux to substract from the flux read with --cindex (3,4,5,...)')
     parser.add_argument('--run-keyword', type=str, help='Keyword that identifies the run to be read (only for "lammps" format)')
+    parser.add_argument('--runs', nargs='+', type=int, help='Indexes of the runs to be read as a single time series, instead of --run-keyword (only for "lammps" format)')
+    parser.add_argument('--cache', nargs='?', const=True, default=os.environ.get('THERMOCEPSTRUM_CACHE_DIR'), help='Store the columns read from "table" and "lammps" files in a binary cache, in the given directory (default: .thermocepstrum_cache next to the input file, or $THERMOCEPSTRUM_CACHE_DIR)')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the binary cache (do not read nor write it)')
+    parser.add_argument('--clear-cache', action='store_true', help='Remove all the entries of the binary cache directory before reading')
+    parser.add_argument('--cache-max-size', type=float, default=10., help='Maximum size of the binary cache directory (GB, default: 10)')
+    parser.add_argument('--nprocs', type=int, default=1, help='Number of processes used to parse a "table" file (default: 1)')
+    parser.add_argument('--dtype', type=str, default='float64', choices=['float64', 'float32'], help='Floating point precision of the time series: float32 halves the memory, spectra are computed in single precision and accumulated in double precision (default: float64)')
     parser.add_argument('--split', type=int, default=1, help='Build a time series with n*m independent processes (n is the number of processes of the original timeseries, m is the number provided with --split). The length of the new time series will be [original length]/m.')
 
     parser.add_argument('-o', '--output', type=str, default='output', help='prefix of the output files')
@@ -112,7 +121,8 @@ def main():
     parser.add_argument('-V', '--volume', type=float, help='Volume of the cell (Angstrom). If not set it will be read from structure file or inputfile.')
     parser.add_argument('--structure', type=str, help='LAMMPS data file containing the structure. Read to get Volume.')
     parser.add_argument('-T', '--temperature', type=float, help='average Temperature (K). If not set it will be read from file')
-    parser.add_argument('-u', '--units', type=str, default='metal', choices=['metal', 'real', 'qepw', 'gpumd', 'dlpoly'], help='LAMMPS units (default: metal)')
+    parser.add_argument('--gpumd-quantities', nargs='+', default=['T', 'jp', 'jk'], help='Quantities of the compute keyword of GPUMD, in {T, U, F, W, jp, jk} (only for "gpumd" format, default: T jp jk)')
+    parser.add_argument('-u', '--units', type=str, choices=['metal', 'real', 'qepw', 'gpumd', 'dlpoly'], help='LAMMPS units (default: metal, or the units of the gpumd, dlpoly, qe input formats)')
 
     parser.add_argument('-r', '--resample', action='store_true', help='resample the time series (you should define --TSKIP or --FSTAR')
     resamplearg = parser.add_mutually_exclusive_group()
@@ -143,6 +153,10 @@ def main():
     jindex = args.cindex
     sindex = args.sindex
     run_keyword = args.run_keyword
+    runs = args.runs
+    cache = None if args.no_cache else args.cache
+    nprocs = args.nprocs
+    dtype = np.dtype(args.dtype)
     NSPLIT = args.split
     print_elapsed = False if args.test_suite_run else True
     print_cmd = False if args.test_suite_run else True
@@ -153,6 +167,8 @@ def main():
     no_text_out = args.no_text_output
 
     units = args.units
+    if units is None:
+        units = {'gpumd': 'gpumd', 'dlpoly': 'dlpoly', 'qe': 'qepw'}.get(input_format, 'metal')
     temperature = args.temperature
     volume = args.volume
     structurefile = args.structure
@@ -190,6 +206,11 @@ def main():
         raise ValueError('the correction factor must be positive')
     if NSPLIT < 1:
         raise ValueError('The number of splits must be a positive number')
+    if nprocs < 1:
+        raise ValueError('The number of processes must be a positive number')
+    if args.cache_max_size <= 0.:
+        raise ValueError('The maximum cache size must be positive')
+    cache_max_size = int(args.cache_max_size * 1024**3)
 
     ncurrents = len(j2_keys) + 1
 
@@ -210,6 +231,9 @@ def main():
 
     # Read data
     jdata = None
+    if args.clear_cache:
+        cache_dir = args.cache if isinstance(args.cache, str) else tc.i_o.column_cache.default_cache_dir(inputfile)
+        tc.i_o.column_cache.clear_cache(cache_dir)
     if input_format == 'table':
         if temperature is None:
             selected_keys.append('Temp')
@@ -217,14 +241,38 @@ def main():
 #         selected_keys.append('Press')
         if volume is None and structurefile is None:
             selected_keys.append('Volume')
-        jfile = tc.i_o.TableFile(inputfile, group_vectors=True, print_elapsed=print_elapsed)
+        jfile = tc.i_o.TableFile(inputfile, group_vectors=True, print_elapsed=print_elapsed, cache=cache,
+                                 cache_max_size=cache_max_size, nprocs=nprocs, dtype=dtype)
         jfile.read_datalines(start_step=START_STEP, NSTEPS=NSTEPS, select_ckeys=selected_keys)
         jdata = jfile.data
         START_STEP = 0   # reset to zero, as later we will need to read all of jdata
     elif input_format == 'dict':
         jdata = np.load(inputfile, allow_pickle=True).tolist()
+    elif input_format == 'store':
+        jstore = tc.i_o.ChunkedStore(inputfile)
+        if volume is None and structurefile is None:
+            selected_keys.append('Volume')
+        jdata = jstore.as_dict(selected_keys)   # columns are read only when indexed; Temp_ave/Temp_std from the store
+    elif input_format in ('gpumd', 'dlpoly', 'qe'):
+        if input_format == 'gpumd':
+            jfile = tc.i_o.GPUMDFile(inputfile, quantities=args.gpumd_quantities, print_elapsed=print_elapsed,
+                                     cache=cache, cache_max_size=cache_max_size, nprocs=nprocs, dtype=dtype)
+        elif input_format == 'dlpoly':
+            jfile = tc.i_o.DLPOLYFile(inputfile, print_elapsed=print_elapsed, cache=cache,
+                                      cache_max_size=cache_max_size, nprocs=nprocs, dtype=dtype)
+        else:
+            jfile = tc.i_o.QEHeatFile(inputfile, print_elapsed=print_elapsed, cache=cache,
+                                      cache_max_size=cache_max_size, nprocs=nprocs, dtype=dtype)
+        if temperature is None and 'Temp' in jfile.all_ckeys:
+            selected_keys.append('Temp')
+        if volume is None and structurefile is None and 'Volume' in jfile.all_ckeys:
+            selected_keys.append('Volume')
+        jfile.read_datalines(start_step=START_STEP, NSTEPS=NSTEPS, select_ckeys=selected_keys)
+        jdata = jfile.data
+        START_STEP = 0   # reset to zero, as later we will need to read all of jdata
     elif input_format == 'lammps':
-        jfile = tc.i_o.LAMMPSLogFile(inputfile, run_keyword=run_keyword)
+        jfile = tc.i_o.LAMMPSLogFile(inputfile, run_keyword=run_keyword, runs=runs, cache=cache,
+                                     cache_max_size=cache_max_size, dtype=dtype)
         if temperature is None:
             selected_keys.append('Temp')
 #      if 'Press' in jfile.ckey:
@@ -262,8 +310,8 @@ def main():
     # Define Temperature
     if temperature is None:
         if 'Temp' in jdata:
-            temperature = np.mean(jdata['Temp'])
-            temperature_std = np.std(jdata['Temp'])   # this is wrong (needs block average)
+            temperature = np.mean(jdata['Temp'], dtype=np.float64)
+            temperature_std = np.std(jdata['Temp'], dtype=np.float64)   # this is wrong (needs block average)
             if 'Temp' in selected_keys:
                 selected_keys.remove('Temp')
             log.write_log(' Mean Temperature (computed):  {} K  +/-  {}'.format(temperature, temperature_std))
@@ -290,7 +338,7 @@ def main():
             log.write_log(' Volume (structure file):    {} A^3'.format(volume))
             logfile.write(' Volume (structure file):    {} A^3'.format(volume))
         elif 'Volume' in jdata:
-            volume = np.mean(jdata['Volume'])
+            volume = np.mean(jdata['Volume'], dtype=np.float64)
             log.write_log(' Volume (file):    {} A^3'.format(volume))
             logfile.write(' Volume (file):    {} A^3\n'.format(volume))
             if 'Volume' in selected_keys:
@@ -312,16 +360,26 @@ def main():
 
     # Define currents
     log.write_log(selected_keys, jindex)
-    if jindex is None:
-        currents = np.array([jdata[key][START_STEP:(START_STEP + NSTEPS), :] for key in selected_keys])
+    if (input_format == 'store') and (NSPLIT == 1) and (sindex is None):
+        # copy the chunks into a memory-mapped temporary file (next to the output), that HeatCurrent stores without
+        # copying it: the currents are not loaded in memory at once
+        stop = min(START_STEP + NSTEPS, jstore.NSTEPS)
+        ncomp = jstore.columns[selected_keys[0]]['shape'][1] if (jindex is None) else len(jindex)
+        tmpfile = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(output)))   # removed when closed
+        currents = np.memmap(tmpfile, dtype=dtype, mode='w+', shape=(len(selected_keys), stop - START_STEP, ncomp))
+        jstore.stack(selected_keys, START_STEP, stop, jindex, out=currents)
     else:
-        if sindex is None:
-            currents = np.array([jdata[key][START_STEP:(START_STEP + NSTEPS), jindex] for key in selected_keys])
-        else:
-            currents = np.array([
-                jdata[key][START_STEP:(START_STEP + NSTEPS), jindex] -
-                jdata[key][START_STEP:(START_STEP + NSTEPS), sindex] for key in selected_keys
-            ])
+        # fill a preallocated currents array (of the final dtype, that HeatCurrent stores without copying it)
+        jslice = slice(START_STEP, START_STEP + NSTEPS)
+        cols = slice(None) if (jindex is None) else jindex
+        shape = jdata[selected_keys[0]][jslice, cols].shape
+        currents = np.empty((len(selected_keys),) + shape, dtype=dtype)
+        for ckey, key in enumerate(selected_keys):
+            if (sindex is None) or (jindex is None):
+                currents[ckey] = jdata[key][jslice, cols]
+            else:
+                np.subtract(jdata[key][jslice, jindex], jdata[key][jslice, sindex], out=currents[ckey],
+                            casting='unsafe')
     log.write_log('  currents shape is {}'.format(currents.shape))
     logfile.write('  currents shape is {}\n'.format(currents.shape))
     log.write_log('snippet:')
@@ -329,7 +387,7 @@ def main():
 
     # create HeatCurrent object
     j = tc.HeatCurrent(currents, DT_FS=DT_FS, UNITS=units, TEMPERATURE=temperature, VOLUME=volume,
-                       PSD_FILTER_W=psd_filter_w)
+                       PSD_FILTER_W=psd_filter_w, DTYPE=dtype)
 
     log.write_log(' Number of currents = {}'.format(ncurrents))
     logfile.write(' Number of currrents = {}\n'.format(ncurrents))
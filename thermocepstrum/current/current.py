@@ -4,7 +4,7 @@
 import numpy as np
 from .. import md
 from ..md.mdsample import MDSample
-from ..md.tools.spectrum import freq_THz_to_red, freq_red_to_THz
+from ..md.tools.spectrum import freq_THz_to_red, freq_red_to_THz, rfft
 from ..md.tools.resample import filter_and_sample
 from . import units
 import inspect
@@ -43,10 +43,11 @@ class Current(MDSample):
      - FREQ_UNITS    frequency units   [THz or red] (optional)
      - MAIN_CURRENT_INDEX for a multi-current time series, the index of the "main" current (e.g. energy) [0]
      - MAIN_CURRENT_FACTOR factor to be multiplied by the main current [1.0]
+     - DTYPE         floating point type of the time series: np.float64, or np.float32 to halve the memory [np.float64]
     """
     _current_type = None
     _input_parameters = {'DT_FS', 'KAPPA_SCALE'}
-    _optional_parameters = {'PSD_FILTER_W', 'FREQ_UNITS', 'MAIN_CURRENT_INDEX', 'MAIN_CURRENT_FACTOR'}
+    _optional_parameters = {'PSD_FILTER_W', 'FREQ_UNITS', 'MAIN_CURRENT_INDEX', 'MAIN_CURRENT_FACTOR', 'DTYPE'}
 
     plot = Plotter()
 
@@ -72,7 +73,8 @@ class Current(MDSample):
         DT_FS = params.pop('DT_FS')
         MAIN_CURRENT_INDEX = params.pop('MAIN_CURRENT_INDEX', 0)
         MAIN_CURRENT_FACTOR = params.pop('MAIN_CURRENT_FACTOR', 1.0)
-        self.initialize_currents(traj, DT_FS, MAIN_CURRENT_INDEX, MAIN_CURRENT_FACTOR)
+        DTYPE = params.pop('DTYPE', np.float64)
+        self.initialize_currents(traj, DT_FS, MAIN_CURRENT_INDEX, MAIN_CURRENT_FACTOR, DTYPE)
         self.initialize_units(**params)   # KAPPA_SCALE or (e.g. UNITS, TEMPERATURE, VOLUME)
         if self.traj is not None:
             self.compute_psd(PSD_FILTER_W, FREQ_UNITS)
@@ -105,9 +107,23 @@ class Current(MDSample):
         # this is a virtual method
         pass
 
-    def initialize_currents(self, j, DT_FS, main_current_index=0, main_current_factor=1.0):
+    def initialize_currents(self, j, DT_FS, main_current_index=0, main_current_factor=1.0, dtype=np.float64):
+        """
+        Initialize the currents from the array j, of shape (N_CURRENTS, N, N_COMPONENTS) or (N, N_COMPONENTS).
+        A C-contiguous array (or np.memmap) of type dtype is not copied: self.currents is the input array, and the
+        trajectories of self and of self.otherMD are views of it. The main current factor is applied lazily to the
+        spectrum (see MDSample.TRAJ_FACTOR). In the multi-current case the spectra of all the currents are computed
+        at once (see compute_spectrALL).
+        Any other input is copied into a new array (and a warning is logged).
+        """
+        source = j
+        j = np.ascontiguousarray(j, dtype=dtype)
+        if not (isinstance(source, np.ndarray) and np.may_share_memory(j, source)):
+            log.write_log('Warning:  the currents were copied into a C-contiguous array of type {}.'.format(
+                np.dtype(dtype).name))
+        self.MAIN_CURRENT_INDEX = main_current_index
+        self.MAIN_CURRENT_FACTOR = main_current_factor
         # check if we have a multicomponent fluid
-        j = np.array(j, dtype=float)
         if (len(j.shape) == 3):
             self.N_CURRENTS = j.shape[0]
             if (self.N_CURRENTS == 1):
@@ -120,17 +136,47 @@ class Current(MDSample):
             self.MANY_CURRENTS = False
         else:
             raise ValueError('Shape of j {} not valid.'.format(j.shape))
+        self.currents = j
 
         if self.MANY_CURRENTS:
             log.write_log('Using multicomponent code.')
-            super().__init__(traj=(j[main_current_index] * main_current_factor), DT_FS=DT_FS)
+            super().__init__(traj=j[main_current_index], DT_FS=DT_FS, dtype=dtype, traj_factor=main_current_factor)
             # initialize other MDSample currents
-            other_currents_idxs = (np.arange(self.N_CURRENTS) != main_current_index)   # select the other currents
-            self.otherMD = [MDSample(traj=js, DT_FS=DT_FS) for js in j[other_currents_idxs]]
+            self.otherMD = [MDSample(traj=j[i], DT_FS=DT_FS, dtype=dtype) for i in self._other_currents_idxs()]
         else:
             log.write_log('Using single component code.')
-            super().__init__(traj=(j * main_current_factor), DT_FS=DT_FS)
+            super().__init__(traj=j, DT_FS=DT_FS, dtype=dtype, traj_factor=main_current_factor)
             self.otherMD = None
+        # the trajectories are views of the currents array
+        assert np.shares_memory(self.traj, self.currents), 'traj is a copy of the currents.'
+        assert all(np.shares_memory(x.traj, self.currents) for x in (self.otherMD or [])), \
+            'the other trajectories are copies of the currents.'
+
+    def _other_currents_idxs(self):
+        """The indexes of the other currents in self.currents."""
+        return [i for i in range(self.N_CURRENTS) if (i != self.MAIN_CURRENT_INDEX)]
+
+    def _get_currents(self):
+        """The currents array (without the odd last point) used to build a new object with the same parameters."""
+        if self.MANY_CURRENTS:
+            return self.currents[:, :self.N]
+        return self.traj
+
+    def compute_spectrALL(self):
+        # overrides MDSample method
+        """
+        Compute and cache the spectrum of the trajectory. In the multi-current case the spectra of all the currents are
+        computed at once by a single real FFT of self.currents, and shared with self.otherMD.
+        """
+        if (self.spectrALL is None) and self.MANY_CURRENTS and (self.currents is not None) and \
+                (self.traj is not None) and np.may_share_memory(self.traj, self.currents):   # traj was not replaced
+            spectra = rfft(self.currents[:, :self.N], axis=1)   # (N_CURRENTS, NFREQS, N_COMPONENTS)
+            self.spectrALL = spectra[self.MAIN_CURRENT_INDEX]
+            if (self.TRAJ_FACTOR != 1.0):
+                self.spectrALL *= self.TRAJ_FACTOR
+            for current, i in zip(self.otherMD, self._other_currents_idxs()):
+                current.spectrALL = spectra[i]
+        return super().compute_spectrALL()
 
     @classmethod
     def _get_units(cls):
@@ -274,8 +320,18 @@ class Current(MDSample):
             return self.plot.plot_cepstral_spectrum(current=self, freq_units=freq_units, freq_scale=freq_scale,
                                                     axes=axes, kappa_units=kappa_units, FIGSIZE=FIGSIZE, **plot_kwargs)
 
+    def _resample_spectrum(self, TSKIP, FILTER_W=None):
+        # overrides MDSample method
+        """Return a copy of this current filtered & resampled in the frequency domain (with the other currents)."""
+        xf = super()._resample_spectrum(TSKIP, FILTER_W)
+        xf.currents = None
+        if self.otherMD:
+            xf.otherMD = [j._resample_spectrum(TSKIP, FILTER_W) for j in self.otherMD]
+        xf.dct = None
+        return xf
+
     def resample(self, TSKIP=None, fstar_THz=None, FILTER_W=None, plot=True, PSD_FILTER_W=None,
-                 freq_units='THz', FIGSIZE=None, verbose=True):   # yapf: disable
+                 freq_units='THz', FIGSIZE=None, verbose=True, method='time'):   # yapf: disable
         """
         Simulate the resampling of the time series.
 
@@ -292,13 +348,15 @@ class Current(MDSample):
                        'red'  [omega*DT/(2*pi)]
         FIGSIZE      = plot figure size
         verbose      = print log [True]
+        method       = 'time'      filter & sample the time series, and compute its spectrum [default]
+                       'spectral'  filter & sample the cached spectrum (fast, the new object has no trajectory)
 
         Returns
         -------
         xf : a filtered & resampled time series object
         ax : an array of plot axes, optional (if plot=True)
         """
-        xf = super().resample(TSKIP, fstar_THz, FILTER_W, False, PSD_FILTER_W, freq_units, None, verbose)
+        xf = super().resample(TSKIP, fstar_THz, FILTER_W, False, PSD_FILTER_W, freq_units, None, verbose, method)
 
         if plot and self.check_plotter():
             return self.plot.plt_resample(current=self, xf=xf, freq_units=freq_units, PSD_FILTER_W=PSD_FILTER_W,
@@ -306,8 +364,9 @@ class Current(MDSample):
         return xf
 
     def fstar_analysis(self, TSKIP_LIST, aic_type='aic', Kmin_corrfactor=1.0, plot=True, axes=None, FIGSIZE=None,
-                       verbose=False, **plot_kwargs):   # yapf: disable
-        return fstar_analysis(self, TSKIP_LIST, aic_type, Kmin_corrfactor, plot, axes, FIGSIZE, verbose, **plot_kwargs)
+                       verbose=False, method='time', **plot_kwargs):   # yapf: disable
+        return fstar_analysis(self, TSKIP_LIST, aic_type, Kmin_corrfactor, plot, axes, FIGSIZE, verbose, method,
+                              **plot_kwargs)
 
     #TODO: transform plot into a @property, with its own setter method
     def check_plotter(self):
@@ -328,7 +387,7 @@ class Current(MDSample):
 
 
 def fstar_analysis(x, TSKIP_LIST, aic_type='aic', Kmin_corrfactor=1.0, plot=True, axes=None, FIGSIZE=None,
-                   verbose=False, **plot_kwargs):   # yapf: disable
+                   verbose=False, method='time', **plot_kwargs):   # yapf: disable
     """
     Perform cepstral analysis on a set of resampled time series, to study the effect of f*.
     For each TSKIP in TSKIP_LIST, the HeatCurrent x is filtered & resampled, and then cesptral-analysed.
@@ -342,6 +401,7 @@ def fstar_analysis(x, TSKIP_LIST, aic_type='aic', Kmin_corrfactor=1.0, plot=True
     axes          = matplotlib.axes.Axes object (if None, create one)
     FIGSIZE       = plot figure size
     verbose       = verbose output (default: False)
+    method        = resampling method, 'time' or 'spectral' (fast, from the cached spectrum) (see resample)
     **plot_kwargs = other parameters passed to plot function
 
     Returns
@@ -354,13 +414,13 @@ def fstar_analysis(x, TSKIP_LIST, aic_type='aic', Kmin_corrfactor=1.0, plot=True
         plot figure
     """
 
-    if not isinstance(x, HeatCurrent):
-        raise ValueError('x must be a HeatCurrent object.')
+    if not isinstance(x, Current):
+        raise ValueError('x must be a Current object.')
 
     xf = []
     for TSKIP in TSKIP_LIST:
         log.write_log('TSKIP =  {:d}'.format(TSKIP))
-        xff = resample_current(x, TSKIP, plot=False, verbose=verbose)
+        xff = x.resample(TSKIP=TSKIP, plot=False, verbose=verbose, method=method)
         xff.cepstral_analysis(aic_type, Kmin_corrfactor)
         xf.append(xff)
     FSTAR_THZ_LIST = [xff.Nyquist_f_THz for xff in xf]
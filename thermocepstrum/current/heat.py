@@ -34,11 +34,12 @@ class HeatCurrent(Current):
      - FREQ_UNITS    frequency units   [THz or red] (optional)
      - MAIN_CURRENT_INDEX for a multi-current time series, the index of the "main" current (e.g. energy) [0]
      - MAIN_CURRENT_FACTOR factor to be multiplied by the main current [1.0]
+     - DTYPE         floating point type of the time series: np.float64, or np.float32 to halve the memory [np.float64]
     """
     _current_type = 'heat'
     _input_parameters = {'DT_FS', 'UNITS', 'TEMPERATURE', 'VOLUME'}
 
-    # _optional_parameters = {'PSD_FILTER_W', 'FREQ_UNITS', 'MAIN_CURRENT_INDEX', 'MAIN_CURRENT_FACTOR'}
+    # _optional_parameters = {'PSD_FILTER_W', 'FREQ_UNITS', 'MAIN_CURRENT_INDEX', 'MAIN_CURRENT_FACTOR', 'DTYPE'}
 
     def __init__(self, traj, **params):
         # params: (DT_FS, UNITS, TEMPERATURE, VOLUME, PSD_FILTER_W=None, FREQ_UNITS='THz')
@@ -50,10 +51,7 @@ class HeatCurrent(Current):
           TimeSeries, builder = self._get_builder()
           new_ts = TimeSeries(**builder)
         """
-        if self.MANY_CURRENTS:
-            traj_array = np.row_stack(([self.traj], [j.traj for j in self.otherMD]))
-        else:
-            traj_array = self.traj
-        builder = dict(traj=traj_array, DT_FS=self.DT_FS, UNITS=self.UNITS, TEMPERATURE=self.TEMPERATURE,
-                       VOLUME=self.VOLUME, PSD_FILTER_W=self.PSD_FILTER_W_THZ, FREQ_UNITS='THz')
+        builder = dict(traj=self._get_currents(), DT_FS=self.DT_FS, UNITS=self.UNITS, TEMPERATURE=self.TEMPERATURE,
+                       VOLUME=self.VOLUME, PSD_FILTER_W=self.PSD_FILTER_W_THZ, FREQ_UNITS='THz', DTYPE=self.dtype,
+                       MAIN_CURRENT_INDEX=self.MAIN_CURRENT_INDEX, MAIN_CURRENT_FACTOR=self.MAIN_CURRENT_FACTOR)
         return type(self), builder
@@ -2,6 +2,10 @@
 
 from .read_tablefile import TableFile
 from .read_lammps_dump import LAMMPS_Dump
+from .read_lammps_bindump import LAMMPS_BinaryDump
 from .read_lammps_log import LAMMPSLogFile
+from .read_md_currents import GPUMDFile, DLPOLYFile, QEHeatFile
+from .chunked_store import ChunkedStore
 
-__all__ = ('TableFile', 'LAMMPS_Dump', 'LAMMPSLogFile')
+__all__ = ('TableFile', 'LAMMPS_Dump', 'LAMMPS_BinaryDump', 'LAMMPSLogFile', 'GPUMDFile', 'DLPOLYFile', 'QEHeatFile',
+           'ChunkedStore')
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   BulkParse
+###
+################################################################################
+###
+###  Tools to read and convert numerical data lines in bulk.
+###  A block of complete lines is read from a file opened in binary mode as a
+###  single bytes object, and converted to a 2-D float array in one shot by
+###  NumPy, instead of splitting and converting each line in Python.
+###  When only some columns are needed (column projection), only those fields
+###  are converted (np.loadtxt with usecols): the parsing time is proportional
+###  to the number of columns used rather than to the width of the table.
+###  If the columns are contiguous (e.g. all of them) the whole block is
+###  converted by np.fromstring and sliced, that is faster.
+###
+###  parse_file_parallel splits the data section of a file into byte ranges
+###  (at newline boundaries), that are parsed by a pool of processes directly
+###  into a shared-memory output array.
+###
+################################################################################
+###   example:
+###      with open(filename, 'rb') as f:
+###          block, nlines = read_lines(f, 1000)
+###          values = parse_block(block, nlines, ncols=9)
+###          flux = parse_block(block, nlines, ncols=9, usecols=[2, 3, 4])
+################################################################################
+
+import io
+import os
+import ctypes
+import numpy as np
+import warnings
+import multiprocessing
+
+__all__ = ('CHUNK_BYTES', 'CHUNK_STEPS', 'read_lines', 'count_fields', 'count_line_fields', 'parse_block',
+           'parse_lines', 'column_plan', 'parse_file_parallel')
+
+CHUNK_BYTES = 1 << 24   # size of each raw read (16 MiB)
+CHUNK_STEPS = 100000   # number of lines converted at once
+CTYPES = {np.dtype(np.float64): ctypes.c_double, np.dtype(np.float32): ctypes.c_float}   # shared memory types
+
+
+def _newline_positions(buf):
+    """Return the positions of all the newline characters in the bytes object buf."""
+    return np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == ord('\n'))
+
+
+def read_lines(f, nlines, chunk_bytes=CHUNK_BYTES):
+    """
+    Read (up to) nlines complete lines from the current position of the binary file f.
+    The file is read in raw chunks of chunk_bytes bytes; if more lines than needed are read, the file position is moved
+    back to the beginning of the first line that was not requested.
+    A final line with no trailing newline (at EOF) is counted as a line.
+      INPUT:
+        f           -> a file object opened in binary mode
+        nlines      -> number of lines to read
+        chunk_bytes -> size of each raw read (bytes)
+      OUTPUT:
+        block   ->  a bytes object with the lines read
+        nread   ->  the number of lines read (< nlines if EOF was reached)
+    """
+    parts = []
+    nread = 0
+    while (nread < nlines):
+        buf = f.read(chunk_bytes)
+        if (len(buf) == 0):   # EOF
+            break
+        if not buf.endswith(b'\n'):   # complete the last line
+            buf += f.readline()
+        newlines = _newline_positions(buf)
+        n = newlines.size
+        if not buf.endswith(b'\n'):   # EOF reached without a final newline
+            n += 1
+        if (nread + n > nlines):   # too many lines: step back
+            end = newlines[nlines - nread - 1] + 1
+            f.seek(end - len(buf), 1)
+            buf = buf[:end]
+            n = nlines - nread
+        parts.append(buf)
+        nread += n
+    return b''.join(parts), nread
+
+
+def count_fields(block):
+    """Return the number of whitespace-separated fields in the bytes object block."""
+    if (len(block) == 0):
+        return 0
+    space = (np.frombuffer(block, dtype=np.uint8) <= ord(' '))   # whitespace and control characters
+    return int(np.count_nonzero(space[:-1] & ~space[1:])) + (0 if space[0] else 1)
+
+
+def count_line_fields(block, nlines):
+    """Return the number of whitespace-separated fields of each line of the bytes object block (at least nlines)."""
+    buf = np.frombuffer(block, dtype=np.uint8)
+    space = (buf <= ord(' '))   # whitespace and control characters
+    starts = np.flatnonzero(space[:-1] & ~space[1:]) + 1
+    if (len(buf) > 0) and not space[0]:
+        starts = np.concatenate(([0], starts))
+    return np.bincount(np.searchsorted(_newline_positions(block), starts), minlength=nlines)
+
+
+def _fromstring(block, nlines, ncols):
+    with warnings.catch_warnings():
+        # np.fromstring warns (instead of raising) when non-numeric data is found
+        warnings.simplefilter('ignore', DeprecationWarning)
+        values = np.fromstring(block, sep=' ')
+    if (values.size != nlines * ncols):
+        raise ValueError('Block of {:d} lines cannot be converted to a ({:d}, {:d}) array ({:d} values found).'.format(
+            nlines, nlines, ncols, values.size))
+    return values.reshape((nlines, ncols))
+
+
+def parse_block(block, nlines, ncols, usecols=None):
+    """
+    Convert a block of whitespace-separated numerical lines into a (nlines, ncols) float array.
+    If usecols is given, only those columns are returned, in a (nlines, len(usecols)) array: every line must have
+    exactly ncols fields. If the columns are contiguous (e.g. all of them) the whole block is converted at once and
+    sliced, otherwise only the selected columns are converted.
+    A ValueError is raised if the block does not contain exactly nlines * ncols numbers.
+    """
+    if usecols is None:
+        return _fromstring(block, nlines, ncols)
+    usecols = [int(i) for i in usecols]
+    if (nlines == 0):
+        return np.zeros((0, len(usecols)))
+    counts = count_line_fields(block, nlines)
+    if (counts.size != nlines) or np.any(counts != ncols):
+        raise ValueError(
+            'Block of {:d} lines cannot be converted to a ({:d}, {:d}) array (lines with a wrong number of '
+            'fields found).'.format(nlines, nlines, ncols))
+    if usecols and (usecols == list(range(usecols[0], usecols[0] + len(usecols)))):   # contiguous columns
+        return _fromstring(block, nlines, ncols)[:, usecols[0]:usecols[0] + len(usecols)]
+    return np.loadtxt(io.BytesIO(block), comments=None, usecols=usecols, ndmin=2)
+
+
+def parse_lines(lines, ncols):
+    """
+    Convert a list of lines (str or bytes) one by one, stopping at the first line that does not contain exactly ncols
+    numbers. Used to locate a malformed line inside a block.
+      OUTPUT:
+        values  ->  a (n, ncols) float array with the valid lines
+        n       ->  the number of valid lines
+    """
+    values = np.zeros((len(lines), ncols))
+    for n, line in enumerate(lines):
+        fields = line.split()
+        if (len(fields) != ncols):
+            return values[:n], n
+        try:
+            values[n] = list(map(float, fields))
+        except ValueError:
+            return values[:n], n
+    return values, len(lines)
+
+
+def column_plan(ckey):
+    """
+    Build the column plan of a ckey dictionary ({key: list of column indexes}).
+      OUTPUT:
+        usecols  ->  the list of columns to convert
+        slices   ->  a dictionary {key: slice} with the position of the columns of each key in usecols
+    """
+    usecols, slices = [], {}
+    for key, idx in ckey.items():
+        slices[key] = slice(len(usecols), len(usecols) + len(idx))
+        usecols.extend(int(i) for i in idx)
+    return usecols, slices
+
+
+################################################################################
+## parallel parsing
+
+_worker_output = {}   # shared output array of each worker process
+
+
+def _init_worker(buffer, shape, dtype):
+    _worker_output['values'] = np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
+def _count_lines(task):
+    """Count the lines in the byte range [start, end) of a file."""
+    filename, start, end = task
+    count = 0
+    buf = b''
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        while (start < end):
+            buf = f.read(min(CHUNK_BYTES, end - start))
+            if (len(buf) == 0):   # EOF
+                break
+            count += buf.count(b'\n')
+            start += len(buf)
+        if (len(buf) > 0) and not buf.endswith(b'\n') and (len(f.read(1)) == 0):   # last line without newline
+            count += 1
+    return count
+
+
+def _parse_range(task):
+    """
+    Parse nlines lines starting at byte start of a file, and store their columns usecols in the rows [row, row+nlines)
+    of the shared output array. Returns the number of valid lines and the byte position after the last one.
+    """
+    filename, start, nlines, row, ncols, usecols = task
+    values = _worker_output['values']
+    nvalid = 0
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        while (nvalid < nlines):
+            block, nread = read_lines(f, min(CHUNK_STEPS, nlines - nvalid))
+            try:
+                chunk = parse_block(block, nread, ncols, usecols)
+            except ValueError:
+                lines = block.splitlines(True)
+                chunk, n = parse_lines(lines, ncols)
+                values[row + nvalid:row + nvalid + n] = chunk[:, usecols]
+                return nvalid + n, f.tell() - len(block) + sum(len(line) for line in lines[:n])
+            values[row + nvalid:row + nvalid + nread] = chunk
+            nvalid += nread
+            if (nread == 0):   # EOF
+                break
+        return nvalid, f.tell()
+
+
+def split_ranges(filename, start, nranges):
+    """Split the file from byte start to its end into nranges byte ranges, aligned to the beginning of a line."""
+    end = os.path.getsize(filename)
+    bounds = [start]
+    with open(filename, 'rb') as f:
+        for k in range(1, nranges):
+            pos = start + (end - start) * k // nranges
+            if (pos <= bounds[-1]):
+                continue
+            f.seek(pos - 1)
+            f.readline()   # move to the beginning of the next line
+            if (f.tell() > bounds[-1]) and (f.tell() < end):
+                bounds.append(f.tell())
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def parse_file_parallel(filename, start, nlines, ncols, usecols, nprocs, ranges=None, dtype=np.float64):
+    """
+    Parse (up to) nlines data lines of a file starting from byte start, using a pool of nprocs processes.
+    The data section is split into byte ranges at newline boundaries; the lines of each range are counted and then
+    parsed, in parallel, directly into a shared-memory array. Only the columns usecols are stored.
+    Parsing stops at the first malformed line.
+      INPUT:
+        filename  -> the file name
+        start     -> byte position of the first line to read
+        nlines    -> number of lines to read
+        ncols     -> number of columns of each line
+        usecols   -> list of the column indexes to store
+        nprocs    -> number of processes
+        ranges    -> a list of (start byte, number of lines) tuples that split the lines to read, e.g. obtained from a
+                     LineIndex (default: None -> split the data section and count its lines)
+        dtype     -> floating point type of the output array (default: np.float64)
+      OUTPUT:
+        values   ->  a (nread, len(usecols)) array (backed by shared memory)
+        nread    ->  the number of lines read
+        end      ->  byte position after the last line read
+    """
+    if ranges is None:
+        bounds = split_ranges(filename, start, nprocs)
+        with multiprocessing.Pool(nprocs) as pool:
+            counts = pool.map(_count_lines, [(filename, a, b) for a, b in bounds])
+        ranges = [(a, count) for (a, b), count in zip(bounds, counts)]
+    # rows of the output array assigned to each range
+    tasks = []
+    row = 0
+    for a, count in ranges:
+        if (row >= nlines):
+            break
+        tasks.append((filename, a, min(count, nlines - row), row, ncols, list(usecols)))
+        row += tasks[-1][2]
+    shape = (row, len(usecols))
+    dtype = np.dtype(dtype)
+    if dtype not in CTYPES:
+        raise ValueError('dtype {} not supported (use np.float64 or np.float32).'.format(dtype))
+    buffer = multiprocessing.RawArray(CTYPES[dtype], max(1, shape[0] * shape[1]))
+    with multiprocessing.Pool(nprocs, initializer=_init_worker, initargs=(buffer, shape, dtype)) as pool:
+        results = pool.map(_parse_range, tasks)
+
+    nread, end = 0, start
+    for task, (nvalid, end) in zip(tasks, results):
+        nread += nvalid
+        if (nvalid < task[2]):   # stop at the first malformed line
+            break
+    values = np.frombuffer(buffer, dtype=dtype, count=shape[0] * shape[1]).reshape(shape)
+    return values[:nread], nread, end
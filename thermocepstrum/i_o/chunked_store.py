@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   ChunkedStore
+###
+################################################################################
+###
+###  A chunked, appendable, columnar on-disk store of time series.
+###  The store is a directory: each column key (e.g. 'flux', 'Temp') is split
+###  into fixed-size chunks of chunk_steps steps, each saved into a .npy file;
+###  a JSON manifest holds the number of steps, the columns, the attributes
+###  (e.g. DT, box, Volume) and running statistics of each column (number of
+###  values, mean, sum of squared deviations), updated at every append, so that
+###  e.g. the mean temperature is known without reading the Temp column.
+###
+###  New segments are appended at the end (only the last, partial chunk is
+###  rewritten); the manifest is updated last, so an interrupted append leaves
+###  the store in its previous state.
+###  Any step range is read from memory-mapped chunks: a range contained in a
+###  single chunk is a read-only view of the chunk file, a larger one is copied
+###  into a new array chunk by chunk. stack copies the chunks of several columns
+###  into the (keys, steps, components) array of currents used by HeatCurrent:
+###  by default a new array in memory, or a preallocated out array, e.g. a
+###  memory-map of a temporary file, to keep a large time series on disk.
+###
+################################################################################
+###   example:
+###      store = ChunkedStore('flux.store', mode='a', chunk_steps=100000)
+###      for chunk in logfile.iter_chunks(100000, select_ckeys=['Temp', 'flux']):
+###          store.append(chunk)
+###      store.set_attrs(DT=1., Volume=1000.)
+###
+###      store = ChunkedStore('flux.store')
+###      flux = store.read('flux', 1000, 2000)   # steps [1000, 2000)
+###      print(store.mean('Temp'), store.std('Temp'))
+###      j = HeatCurrent(store.stack(['flux']), UNITS='metal', DT_FS=1., TEMPERATURE=300., VOLUME=1000.)
+###
+###      currents = np.memmap(tempfile.TemporaryFile(), dtype=np.float64, mode='w+', shape=(1, store.NSTEPS, 3))
+###      j = HeatCurrent(store.stack(['flux'], out=currents), UNITS='metal', DT_FS=1., TEMPERATURE=300., VOLUME=1000.)
+################################################################################
+
+import os
+import json
+import numpy as np
+from thermocepstrum.utils.utils import PrintMethod
+log = PrintMethod()
+
+__all__ = ('ChunkedStore', 'ChunkedColumn', 'is_store')
+
+MANIFEST = 'manifest.json'
+DEFAULT_CHUNK_STEPS = 100000   # number of steps of each chunk
+
+
+def is_store(path):
+    """Return True if path is a ChunkedStore directory."""
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def _merge_stats(stats, values):
+    """Merge the statistics (n, mean, M2) of the values of an array into stats (parallel algorithm of Chan et al.)."""
+    n_b = values.size
+    if (n_b == 0):
+        return stats
+    mean_b = np.mean(values, dtype=np.float64)
+    M2_b = np.sum(np.subtract(values, mean_b, dtype=np.float64)**2)
+    n_a, mean_a, M2_a = stats
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return [n, mean_a + delta * n_b / n, M2_a + M2_b + delta**2 * n_a * n_b / n]
+
+
+class ChunkedStore(object):
+    """
+    A chunked, appendable, columnar on-disk store of time series.
+
+    INPUT parameters:
+     - path           the store directory
+     - mode           'r' (default) read-only, 'a' read and append (the store is created if it does not exist)
+     - chunk_steps    number of steps of each chunk file (only used when the store is created)
+
+    The columns are 2-d arrays (steps, components). Attributes (attrs) are scalars or small arrays saved in the
+    manifest, e.g. DT, box, Volume.
+    """
+
+    def __init__(self, path, mode='r', chunk_steps=DEFAULT_CHUNK_STEPS):
+        if mode not in ('r', 'a'):
+            raise ValueError('mode must be "r" or "a".')
+        self.path = path
+        self.mode = mode
+        if is_store(path):
+            self._read_manifest()
+        elif (mode == 'a'):
+            if (chunk_steps <= 0):
+                raise ValueError('chunk_steps must be a positive number.')
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.chunk_steps = int(chunk_steps)
+            self.NSTEPS = 0
+            self.columns = {}
+            self.stats = {}
+            self.attrs = {}
+            self._write_manifest()
+        else:
+            raise IOError('{} is not a ChunkedStore.'.format(path))
+
+    def __repr__(self):
+        msg = 'ChunkedStore:\n' + \
+              '  path:          {}\n'.format(self.path) + \
+              '  NSTEPS:        {}\n'.format(self.NSTEPS) + \
+              '  chunk_steps:   {}\n'.format(self.chunk_steps) + \
+              '  columns:       {}\n'.format({key: col['shape'] for key, col in self.columns.items()}) + \
+              '  attrs:         {}\n'.format(list(self.attrs.keys()))
+        return msg
+
+    def _read_manifest(self):
+        with open(os.path.join(self.path, MANIFEST), 'r') as f:
+            content = json.load(f)
+        self.chunk_steps = content['chunk_steps']
+        self.NSTEPS = content['NSTEPS']
+        self.columns = content['columns']
+        self.stats = content['stats']
+        self.attrs = {}
+        for key, value in content['attrs'].items():
+            self.attrs[key] = np.array(value) if isinstance(value, list) else value
+
+    def _write_manifest(self):
+        manifest = os.path.join(self.path, MANIFEST)
+        attrs = {}
+        for key, value in self.attrs.items():
+            attrs[key] = value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value
+        content = dict(chunk_steps=self.chunk_steps, NSTEPS=self.NSTEPS, columns=self.columns, stats=self.stats,
+                       attrs=attrs)
+        with open(manifest + '.tmp', 'w') as f:
+            json.dump(content, f, indent=1)
+        os.replace(manifest + '.tmp', manifest)
+
+    def _check_writable(self):
+        if (self.mode != 'a'):
+            raise IOError('ChunkedStore {} is opened in read-only mode.'.format(self.path))
+
+    def _chunk_file(self, key, ichunk):
+        return os.path.join(self.path, '{}.{:06d}.npy'.format(self.columns[key]['file'], ichunk))
+
+    @property
+    def nchunks(self):
+        return -(-self.NSTEPS // self.chunk_steps)
+
+    ###################################
+    ###  WRITE
+    ###################################
+
+    def set_attrs(self, **attrs):
+        """Set some attributes (e.g. DT, box, Volume) and save them into the manifest."""
+        self._check_writable()
+        self.attrs.update(attrs)
+        self._write_manifest()
+
+    def append(self, data):
+        """
+        Append a segment to the store. data is a dictionary {key: array} of 2-d arrays (steps, components) with the
+        same number of steps. A new store takes its columns (and their dtype) from the first segment; the following
+        segments must contain the same columns.
+        """
+        self._check_writable()
+        if not data:
+            return
+        data = {key: np.asarray(value) for key, value in data.items()}
+        data = {key: (value[:, np.newaxis] if (value.ndim == 1) else value) for key, value in data.items()}
+        nsteps = {value.shape[0] for value in data.values()}
+        if (len(nsteps) != 1):
+            raise ValueError('The columns of a segment must have the same number of steps.')
+        nsteps = nsteps.pop()
+        if not self.columns:
+            for i, (key, value) in enumerate(data.items()):
+                self.columns[key] = dict(file='col{:d}'.format(i), shape=[0, value.shape[1]], dtype=value.dtype.str)
+                self.stats[key] = [0, 0., 0.]
+        elif (set(data.keys()) != set(self.columns.keys())):
+            raise ValueError('The segment columns {} differ from the store columns {}.'.format(
+                sorted(data.keys()), sorted(self.columns.keys())))
+
+        for key, value in data.items():
+            col = self.columns[key]
+            if (value.shape[1] != col['shape'][1]):
+                raise ValueError('Column {} has {:d} components, {:d} expected.'.format(
+                    key, value.shape[1], col['shape'][1]))
+            value = value.astype(col['dtype'], copy=False)
+            pos = 0
+            step = self.NSTEPS
+            while (pos < nsteps):
+                ichunk, offset = divmod(step, self.chunk_steps)
+                n = min(self.chunk_steps - offset, nsteps - pos)
+                chunk = value[pos:pos + n]
+                if (offset > 0):   # complete the last (partial) chunk
+                    chunk = np.concatenate([np.load(self._chunk_file(key, ichunk))[:offset], chunk])
+                chunk_file = self._chunk_file(key, ichunk)
+                np.save(chunk_file + '.tmp.npy', chunk)
+                os.replace(chunk_file + '.tmp.npy', chunk_file)
+                pos += n
+                step += n
+            self.stats[key] = _merge_stats(self.stats[key], value)
+        self.NSTEPS += nsteps
+        for col in self.columns.values():
+            col['shape'][0] = self.NSTEPS
+        self._write_manifest()   # commit the segment
+
+    ###################################
+    ###  READ
+    ###################################
+
+    def _check_range(self, start, stop):
+        if stop is None:
+            stop = self.NSTEPS
+        if (start < 0) or (stop > self.NSTEPS) or (start > stop):
+            raise IndexError('Step range [{}, {}) out of the store range [0, {}).'.format(start, stop, self.NSTEPS))
+        return start, stop
+
+    def load_chunk(self, key, ichunk):
+        """Return the memory-mapped chunk ichunk of column key."""
+        return np.load(self._chunk_file(key, ichunk), mmap_mode='r')
+
+    def _iter_range(self, key, start, stop):
+        """Yield (position in the range, memory-mapped piece) of the chunks of column key covering [start, stop)."""
+        step = start
+        while (step < stop):
+            ichunk, offset = divmod(step, self.chunk_steps)
+            n = min(self.chunk_steps - offset, stop - step)
+            yield step - start, self.load_chunk(key, ichunk)[offset:offset + n]
+            step += n
+
+    def read(self, key, start=0, stop=None, out=None):
+        """
+        Read the steps [start, stop) of column key.
+        If the range is contained in a chunk (and out is None) a read-only memory-mapped view is returned, otherwise the
+        chunks are copied into out (default: a new array).
+        """
+        start, stop = self._check_range(start, stop)
+        if (out is None):
+            if (stop - start > 0) and (start // self.chunk_steps == (stop - 1) // self.chunk_steps):
+                return next(self._iter_range(key, start, stop))[1]
+            out = np.empty((stop - start, self.columns[key]['shape'][1]), dtype=self.columns[key]['dtype'])
+        for pos, piece in self._iter_range(key, start, stop):
+            out[pos:pos + piece.shape[0]] = piece
+        return out
+
+    def stack(self, keys, start=0, stop=None, cols=None, dtype=None, out=None):
+        """
+        Return a (len(keys), stop - start, components) array with the steps [start, stop) of the columns keys (e.g. a
+        heat current and other currents), filled chunk by chunk from the memory-mapped chunks.
+        The whole array is allocated in memory, unless a preallocated out array (e.g. a np.memmap) is given.
+          INPUT:
+            keys   -> list of column keys
+            cols   -> list of the components to read (default: None -> all the components)
+            dtype  -> floating point type of the array (default: None -> type of the first column, or of out)
+            out    -> a preallocated (len(keys), stop - start, components) array (default: None)
+        """
+        start, stop = self._check_range(start, stop)
+        ncols = [self.columns[key]['shape'][1] for key in keys]
+        if (cols is None) and (len(set(ncols)) != 1):
+            raise ValueError('The columns {} have different numbers of components.'.format(keys))
+        shape = (len(keys), stop - start, ncols[0] if cols is None else len(cols))
+        if out is None:
+            out = np.empty(shape, dtype=self.columns[keys[0]]['dtype'] if (dtype is None) else dtype)
+        elif (out.shape != shape):
+            raise ValueError('out has shape {}, {} expected.'.format(out.shape, shape))
+        for i, key in enumerate(keys):
+            for pos, piece in self._iter_range(key, start, stop):
+                out[i, pos:pos + piece.shape[0]] = piece if (cols is None) else piece[:, cols]
+        return out
+
+    def column(self, key):
+        """Return a ChunkedColumn: an array-like view of column key, that reads only the indexed steps."""
+        return ChunkedColumn(self, key)
+
+    def mean(self, key):
+        """Return the mean of all the values of column key (from the running statistics)."""
+        n, mean, M2 = self.stats[key]
+        return mean if (n > 0) else np.nan
+
+    def std(self, key):
+        """Return the standard deviation of all the values of column key (from the running statistics)."""
+        n, mean, M2 = self.stats[key]
+        return np.sqrt(M2 / n) if (n > 0) else np.nan
+
+    def as_dict(self, keys=None):
+        """
+        Return a dictionary with the columns keys (default: all) as ChunkedColumn objects, the attributes, and the mean
+        and standard deviation of each scalar column as '<key>_ave' and '<key>_std' (e.g. Temp_ave, Temp_std).
+        """
+        if keys is None:
+            keys = list(self.columns.keys())
+        data = {key: self.column(key) for key in keys if key in self.columns}
+        for key, col in self.columns.items():
+            if (col['shape'][1] == 1):
+                data[key + '_ave'] = self.mean(key)
+                data[key + '_std'] = self.std(key)
+        data.update(self.attrs)
+        return data
+
+
+class ChunkedColumn(object):
+    """
+    An array-like view of a column of a ChunkedStore. Indexing reads only the selected steps, e.g.
+      column[1000:2000, :2]
+    and np.asarray(column) reads the whole column.
+    """
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self.dtype = np.dtype(store.columns[key]['dtype'])
+        self.shape = (store.NSTEPS, store.columns[key]['shape'][1])
+        self.ndim = 2
+
+    def __repr__(self):
+        return '<ChunkedColumn key={!r} shape={} dtype={}>'.format(self.key, self.shape, self.dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        if isinstance(index[0], slice):
+            start, stop, step = index[0].indices(self.shape[0])
+            values = self.store.read(self.key, start, max(start, stop)) if (step == 1) else \
+                     self.store.read(self.key)[start:stop:step]
+            return values[(slice(None),) + index[1:]]
+        if isinstance(index[0], (int, np.integer)):
+            i = index[0] + self.shape[0] if (index[0] < 0) else index[0]
+            return self.store.read(self.key, i, i + 1)[(0,) + index[1:]]
+        return self.store.read(self.key)[index]
+
+    def __array__(self, dtype=None):
+        values = self.store.read(self.key)
+        return values if (dtype is None) else values.astype(dtype, copy=False)
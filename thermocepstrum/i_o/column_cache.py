@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   ColumnCache
+###
+################################################################################
+###
+###  A persistent binary cache of the columns parsed from a text file (TableFile,
+###  LAMMPSLogFile). Each column key (e.g. 'flux', 'Temp') is saved into a .npy
+###  file, and later runs open it with np.load(mmap_mode='r') instead of parsing
+###  the text again.
+###
+###  The cache of a file is a directory named <basename>.<hash> inside the cache
+###  directory (default: '.thermocepstrum_cache' next to the input file).
+###  The hash is computed from the absolute path, size and modification time of
+###  the file and from the reader settings (e.g. group_vectors, run_keyword):
+###  if the file changes, a new entry is created and the old one is removed.
+###  A JSON manifest lists the cached columns.
+###
+###  When the total size of the cache directory exceeds max_size, the least
+###  recently used entries are evicted.
+###
+################################################################################
+###   example:
+###      jfile = TableFile(filename, cache=True)   # or cache='/path/to/cache_dir'
+###      jfile.read_datalines(select_ckeys=['flux'])   # parse and store 'flux'
+###      jfile.read_datalines(select_ckeys=['flux'])   # memory-mapped from cache
+###
+###      clear_cache('/path/to/cache_dir')   # remove all the entries
+################################################################################
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from thermocepstrum.utils.utils import PrintMethod
+log = PrintMethod()
+
+__all__ = ('ColumnCache', 'clear_cache', 'default_cache_dir')
+
+CACHE_DIRNAME = '.thermocepstrum_cache'
+MANIFEST = 'manifest.json'
+DEFAULT_MAX_SIZE = 10 * 1024**3   # 10 GiB
+
+
+def default_cache_dir(filename):
+    """Return the default cache directory of a file (next to the file)."""
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIRNAME)
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def _list_entries(cache_dir):
+    """Return a list of the cache entries (directories containing a manifest) in cache_dir."""
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = [os.path.join(cache_dir, d) for d in os.listdir(cache_dir)]
+    return [d for d in entries if os.path.isfile(os.path.join(d, MANIFEST))]
+
+
+def clear_cache(cache_dir):
+    """Remove all the entries of the cache directory cache_dir."""
+    entries = _list_entries(cache_dir)
+    for entry in entries:
+        shutil.rmtree(entry, ignore_errors=True)
+    log.write_log('  cache: {:d} entries removed from {}'.format(len(entries), cache_dir))
+
+
+class ColumnCache(object):
+    """
+    A persistent cache of the columns of a text file.
+
+    INPUT parameters:
+     - filename     the file whose columns are cached
+     - settings     a dictionary of the reader settings that affect the parsed columns
+     - cache_dir    the cache directory (default: '.thermocepstrum_cache' next to the file)
+     - max_size     maximum total size of the cache directory [bytes]
+    """
+
+    def __init__(self, filename, settings=None, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        self.filename = os.path.abspath(filename)
+        self.settings = settings if settings is not None else {}
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir(filename)
+        self.max_size = max_size
+
+        stat = os.stat(self.filename)
+        self.key = dict(filename=self.filename, size=stat.st_size, mtime=stat.st_mtime, settings=self.settings)
+        digest = hashlib.sha1(json.dumps(self.key, sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(self.cache_dir, '{}.{}'.format(os.path.basename(self.filename), digest))
+        self._remove_stale()
+        self._read_manifest()
+
+    def __repr__(self):
+        msg = 'ColumnCache:\n' + \
+              '  filename:      {}\n'.format(self.filename) + \
+              '  path:          {}\n'.format(self.path) + \
+              '  columns:       {}\n'.format(list(self.columns.keys()))
+        return msg
+
+    def _remove_stale(self):
+        """Remove the entries of the same file created with a different size/mtime/settings."""
+        for entry in _list_entries(self.cache_dir):
+            if (entry == self.path):
+                continue
+            try:
+                with open(os.path.join(entry, MANIFEST), 'r') as f:
+                    key = json.load(f)['key']
+            except (ValueError, KeyError, OSError):
+                continue
+            if (key['filename'] == self.filename) and (key['settings'] == self.settings):
+                log.write_log('  cache: removing stale entry {}'.format(entry))
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def _read_manifest(self):
+        self.columns = {}
+        self.NSTEPS = None
+        manifest = os.path.join(self.path, MANIFEST)
+        if os.path.isfile(manifest):
+            with open(manifest, 'r') as f:
+                content = json.load(f)
+            self.columns = content['columns']
+            self.NSTEPS = content['NSTEPS']
+
+    def _write_manifest(self):
+        manifest = os.path.join(self.path, MANIFEST)
+        with open(manifest + '.tmp', 'w') as f:
+            json.dump(dict(key=self.key, NSTEPS=self.NSTEPS, columns=self.columns), f)
+        os.replace(manifest + '.tmp', manifest)
+
+    def missing(self, ckeys):
+        """Return the list of ckeys that are not cached."""
+        return [key for key in ckeys if key not in self.columns]
+
+    def load(self, key):
+        """Return the memory-mapped column key."""
+        os.utime(os.path.join(self.path, MANIFEST))   # mark the entry as recently used
+        return np.load(os.path.join(self.path, self.columns[key]), mmap_mode='r')
+
+    def store(self, data):
+        """Save the columns of the data dictionary {key: array} into the cache, then evict old entries."""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for key, value in data.items():
+            if (self.NSTEPS is not None) and (value.shape[0] != self.NSTEPS):
+                raise ValueError('Column {} has {:d} steps, {:d} expected.'.format(key, value.shape[0], self.NSTEPS))
+            self.NSTEPS = value.shape[0]
+            colfile = self.columns.get(key, 'col{:d}.npy'.format(len(self.columns)))
+            np.save(os.path.join(self.path, colfile + '.tmp.npy'), value)
+            os.replace(os.path.join(self.path, colfile + '.tmp.npy'), os.path.join(self.path, colfile))
+            self.columns[key] = colfile
+        self._write_manifest()
+        log.write_log('  cache: {} stored in {}'.format(list(data.keys()), self.path))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache directory size is below max_size."""
+        entries = _list_entries(self.cache_dir)
+        sizes = {entry: _dir_size(entry) for entry in entries}
+        total_size = sum(sizes.values())
+        entries.sort(key=lambda entry: os.path.getmtime(os.path.join(entry, MANIFEST)))
+        for entry in entries:
+            if (total_size <= self.max_size):
+                break
+            if (entry == self.path):   # never evict the entry in use
+                continue
+            log.write_log('  cache: evicting {}'.format(entry))
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= sizes[entry]
+        if (total_size > self.max_size):
+            log.write_log('Warning:  cache size ({:d} bytes) exceeds max_size ({:d} bytes).'.format(
+                total_size, self.max_size))
+
+    def read_datalines(self, reader, NSTEPS=0, start_step=-1, select_ckeys=None, max_vector_dim=None,
+                       even_NSTEPS=True):   # yapf: disable
+        """
+        Read the selected ckeys of a reader (TableFile, LAMMPSLogFile) from the cache. The ckeys that are not cached
+        yet are parsed from the whole file and stored first.
+        The arguments and output are the same of reader.read_datalines; the returned arrays are read-only memory-maps.
+        """
+        reader._set_ckey(select_ckeys, max_vector_dim)   # set the ckeys to read
+        ckey, select_ckeys = reader.ckey, reader.select_ckeys
+        missing = self.missing(ckey)
+        if missing:
+            log.write_log('  cache: parsing {} ...'.format(missing))
+            current_step = reader.current_step
+            data = reader._read_datalines(NSTEPS=0, start_step=0, select_ckeys=missing, even_NSTEPS=False)
+            reader.ckey, reader.select_ckeys, reader.current_step = ckey, select_ckeys, current_step
+            if (not data) or (min(len(value) for value in data.values()) == 0):
+                log.write_log('WARNING:  no step read.')   # do not store empty or stale data
+                return
+            self.store(data)
+
+        start = reader.current_step if (start_step < 0) else start_step
+        nsteps = min(NSTEPS, self.NSTEPS - start) if (NSTEPS > 0) else (self.NSTEPS - start)
+        if (nsteps <= 0):
+            log.write_log('WARNING:  no step read.')
+            return
+        if (nsteps < NSTEPS):
+            log.write_log('Warning:  less steps read.')
+        reader.current_step = start + nsteps
+        if even_NSTEPS:
+            if (nsteps % 2 == 1):
+                nsteps = nsteps - 1
+        reader.data = {}
+        for key, idx in ckey.items():
+            reader.data[key] = self.load(key)[start:start + nsteps, :len(idx)]
+        log.write_log('  ( %d ) steps read from cache.' % (nsteps))
+        reader.NSTEPS = nsteps
+        return reader.data
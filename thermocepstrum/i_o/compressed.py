@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   Compressed
+###
+################################################################################
+###
+###  Transparent reading of compressed input files (gzip, bzip2, xz).
+###  The format is detected from the magic bytes of the file (or from its
+###  extension), and the file is decompressed while it is read, with the
+###  incremental decompressors of the standard library: no temporary file is
+###  written.
+###
+###  open_file returns a binary file object with read, readline, seek and tell,
+###  where the positions refer to the decompressed data. The last decompressed
+###  bytes are kept in memory, so that short backward seeks are cheap.
+###  Other backward seeks need to decompress the file again: for gzip files a
+###  block index of decompressor checkpoints (one every 32 MiB of data) is built
+###  while reading, so that decompression restarts from the closest checkpoint
+###  instead of the beginning of the file. (The bzip2 and xz decompressors
+###  cannot be checkpointed.)
+###
+################################################################################
+###   example:
+###      with open_file('flux.dat.gz') as f:
+###          header = f.readline()
+###          block = f.read(1 << 20)
+################################################################################
+
+import io
+import os
+import bz2
+import zlib
+import lzma
+import bisect
+
+__all__ = ('detect_compression', 'open_file', 'CompressedFile', 'iter_blocks')
+
+COMPRESSION_MAGIC = {'gzip': b'\x1f\x8b', 'bz2': b'BZh', 'xz': b'\xfd7zXZ\x00'}
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+RAW_BYTES = 1 << 16   # size of each read of compressed data
+WINDOW_BYTES = 1 << 25   # decompressed data kept in memory behind the current position (32 MiB)
+CHECKPOINT_BYTES = 1 << 25   # distance between two checkpoints of the gzip block index (32 MiB)
+BLOCK_BYTES = 1 << 24   # size of the blocks yielded by iter_blocks (16 MiB)
+
+
+def detect_compression(filename):
+    """Return the compression format of a file ('gzip', 'bz2', 'xz'), or None if it is not compressed."""
+    with open(filename, 'rb') as f:
+        magic = f.read(6)
+    for compression, signature in COMPRESSION_MAGIC.items():
+        if magic.startswith(signature):
+            return compression
+    if (len(magic) == 0):   # an empty file: trust the extension
+        return COMPRESSION_EXTENSIONS.get(os.path.splitext(filename)[1], None)
+    return None
+
+
+def open_file(filename, block_index=True):
+    """
+    Open a file for reading in binary mode. Compressed files are decompressed while they are read.
+      INPUT:
+        filename    -> the file name
+        block_index -> build a block index to speed up backward seeks (gzip only)
+      OUTPUT:
+        a binary file object (a CompressedFile if the file is compressed)
+    """
+    compression = detect_compression(filename)
+    if compression is None:
+        return open(filename, 'rb')
+    return CompressedFile(filename, compression, block_index)
+
+
+def _new_decompressor(compression):
+    if (compression == 'gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif (compression == 'bz2'):
+        return bz2.BZ2Decompressor()
+    elif (compression == 'xz'):
+        return lzma.LZMADecompressor()
+    raise ValueError('Unknown compression format {}.'.format(compression))
+
+
+class CompressedFile(object):
+    """
+    A read-only binary file object that decompresses a gzip, bzip2 or xz file while it is read.
+    Positions (seek, tell) refer to the decompressed data. Concatenated streams are supported.
+
+    INPUT parameters:
+     - filename      the compressed file name
+     - compression   the format: 'gzip', 'bz2' or 'xz'
+     - block_index   build a block index of decompressor checkpoints, to speed up backward seeks (gzip only)
+    """
+
+    def __init__(self, filename, compression, block_index=True):
+        self.name = filename
+        self.compression = compression
+        self._raw = open(filename, 'rb')
+        self._block_index = block_index and (compression == 'gzip')
+        self._checkpoints = []   # (decompressed offset, compressed offset, decompressor)
+        self._restart()
+
+    def __repr__(self):
+        return '<CompressedFile name={!r} compression={!r} pos={:d}>'.format(self.name, self.compression, self._pos)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._raw.close()
+        self._chunks = []
+
+    @property
+    def closed(self):
+        return self._raw.closed
+
+    def _restart(self, checkpoint=None):
+        """Restart the decompression from a checkpoint, or from the beginning of the file."""
+        if checkpoint is None:
+            self._raw.seek(0)
+            self._decompressor = _new_decompressor(self.compression)
+            self._produced = 0   # decompressed offset of the end of the buffered data
+        else:
+            self._produced, raw_pos, decompressor = checkpoint
+            self._raw.seek(raw_pos)
+            self._decompressor = decompressor.copy()
+        self._chunks = []   # buffered chunks of decompressed data
+        self._chunks_start = self._produced   # decompressed offset of the first buffered chunk
+        self._pos = self._produced
+        self._eof = False
+
+    def _decompress(self):
+        """Decompress a new chunk of data and append it to the buffer. Return False at EOF."""
+        while not self._eof:
+            if self._decompressor.eof:   # end of a stream: a new one may follow
+                rawdata = self._decompressor.unused_data or self._raw.read(RAW_BYTES)
+                if (len(rawdata) == 0):
+                    self._eof = True
+                    break
+                self._decompressor = _new_decompressor(self.compression)
+            else:
+                rawdata = self._raw.read(RAW_BYTES)
+                if (len(rawdata) == 0):
+                    raise EOFError('Compressed file {} ended before the end-of-stream marker.'.format(self.name))
+            data = self._decompressor.decompress(rawdata)
+            if (len(data) == 0):
+                continue
+            self._chunks.append(data)
+            self._produced += len(data)
+            if self._block_index and not self._decompressor.eof:
+                last = self._checkpoints[-1][0] if self._checkpoints else 0
+                if (self._produced >= last + CHECKPOINT_BYTES):
+                    self._checkpoints.append((self._produced, self._raw.tell(), self._decompressor.copy()))
+            return True
+        return False
+
+    def _locate(self, pos):
+        """Return the index of the buffered chunk containing pos, and the offset of pos inside it."""
+        i, start = 0, self._chunks_start
+        while (i < len(self._chunks)) and (pos >= start + len(self._chunks[i])):
+            start += len(self._chunks[i])
+            i += 1
+        return i, pos - start
+
+    def _trim(self):
+        """Drop the buffered chunks that are more than WINDOW_BYTES behind the current position."""
+        while self._chunks and (self._chunks_start + len(self._chunks[0]) < self._pos - WINDOW_BYTES):
+            self._chunks_start += len(self._chunks.pop(0))
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        pieces, nread = [], 0
+        i, offset = self._locate(self._pos)
+        while (size < 0) or (nread < size):
+            if (i == len(self._chunks)) and not self._decompress():
+                break
+            chunk = self._chunks[i]
+            stop = len(chunk) if (size < 0) else min(len(chunk), offset + size - nread)
+            pieces.append(chunk[offset:stop])
+            nread += stop - offset
+            i, offset = i + 1, 0
+        self._pos += nread
+        self._trim()
+        return b''.join(pieces)
+
+    def readline(self):
+        pieces = []
+        i, offset = self._locate(self._pos)
+        while True:
+            if (i == len(self._chunks)) and not self._decompress():
+                break
+            chunk = self._chunks[i]
+            end = chunk.find(b'\n', offset)
+            if (end >= 0):
+                pieces.append(chunk[offset:end + 1])
+                break
+            pieces.append(chunk[offset:])
+            i, offset = i + 1, 0
+        line = b''.join(pieces)
+        self._pos += len(line)
+        self._trim()
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def seek(self, offset, whence=0):
+        if (whence == 1):
+            offset += self._pos
+        elif (whence != 0):
+            raise io.UnsupportedOperation('Cannot seek from the end of a compressed file.')
+        if (offset < 0):
+            raise ValueError('Negative seek position {}.'.format(offset))
+        if (offset < self._chunks_start):   # data no longer buffered: restart
+            i = bisect.bisect_right([checkpoint[0] for checkpoint in self._checkpoints], offset)
+            self._restart(self._checkpoints[i - 1] if (i > 0) else None)
+        while (self._produced < offset):   # skip forward, keeping only the last chunk
+            if not self._decompress():
+                break
+            if (len(self._chunks) > 1):
+                self._chunks_start += sum(len(chunk) for chunk in self._chunks[:-1])
+                self._chunks = self._chunks[-1:]
+        self._pos = min(offset, self._produced)
+        self._trim()
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+
+def iter_blocks(f, start=0, end=None, block_bytes=BLOCK_BYTES):
+    """Yield (offset, bytes) blocks of the binary file object f, from byte start to byte end (default: EOF)."""
+    f.seek(start)
+    pos = start
+    while (end is None) or (pos < end):
+        block = f.read(block_bytes if (end is None) else min(block_bytes, end - pos))
+        if (len(block) == 0):   # EOF
+            break
+        yield pos, block
+        pos += len(block)
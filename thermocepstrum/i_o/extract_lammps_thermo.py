@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   ExtractLAMMPSThermo
+###
+################################################################################
+###
+###  Extract the thermo output (the columns of an output block) from one or more
+###  LAMMPS log files, and save it into the binary 'dict' format read by
+###  analysis.py (--input-format dict): a dictionary of column arrays saved with
+###  np.save, e.g. {'Step': ..., 'Temp': ..., 'flux': ...}.
+###  This is a Python replacement of extract_lammps_thermo.sh, built on
+###  LAMMPSLogFile: LAMMPS-style vectors are grouped (c_flux[1..3] -> 'flux')
+###  and the data lines are parsed in bulk.
+###
+###  Many files are extracted concurrently by a pool of processes (one file per
+###  process), and the throughput of each file (MB/s, steps/s) is reported.
+###
+################################################################################
+###  Example:
+###     extract the run following the line containing DUMP_RUN from two files:
+###        python extract_lammps_thermo.py log1.lammps log2.lammps -d DUMP_RUN -k Temp flux --nprocs 2
+###     -> log1.lammps.thermo.npy, log2.lammps.thermo.npy, to be analyzed with
+###        thermocepstrum-analysis log1.lammps.thermo.npy --input-format dict -k flux ...
+###
+###     from Python:
+###        stats = extract_thermo_files(filenames, ['Temp', 'flux'], run_keyword='DUMP_RUN', nprocs=4)
+################################################################################
+
+import os
+import sys
+import numpy as np
+import multiprocessing
+from time import time
+from thermocepstrum.i_o.read_lammps_log import LAMMPSLogFile
+from thermocepstrum.utils.utils import PrintMethod
+log = PrintMethod()
+
+__all__ = ('extract_thermo', 'extract_thermo_files', 'output_filename')
+
+OUTPUT_SUFFIX = '.thermo.npy'
+
+
+def output_filename(filename, output_dir=None, suffix=OUTPUT_SUFFIX):
+    """Return the output file of a log file: <output_dir>/<basename><suffix> (default: next to the log file)."""
+    if output_dir is None:
+        output_dir = os.path.dirname(os.path.abspath(filename))
+    return os.path.join(output_dir, os.path.basename(filename) + suffix)
+
+
+def extract_thermo(filename, select_ckeys=None, output=None, run_keyword=None, runs=None, endrun_keyword='Loop time',
+                   start_step=0, start_time=0., last_step=None, skip_first=False, volume=None, dtype=np.float64):
+    """
+    Extract the thermo columns of an output block of a LAMMPS log file, and save them into the 'dict' format.
+      INPUT:
+        filename       -> the LAMMPS log file
+        select_ckeys   -> the column keys to extract (default: None -> all the columns)
+        output         -> the output file (default: None -> not saved)
+        run_keyword    -> a string that identifies the run to read, e.g. the label of a dump command (see LAMMPSLogFile)
+        runs           -> index (or list of indexes) of the runs to read, instead of run_keyword (see list_runs)
+        endrun_keyword -> the string that ends the run output (default: 'Loop time')
+        start_step     -> value added to the Step column
+        start_time     -> value added to the Time column
+        last_step      -> the last step to keep (value of the Step column, before adding start_step)
+        skip_first     -> skip the first step (useful to concatenate files)
+        volume         -> the cell volume, saved as 'Volume' (default: None -> not saved)
+        dtype          -> floating point type of the data arrays (default: np.float64)
+      OUTPUT:
+        data   ->  the dictionary of the extracted columns
+        stats  ->  a dictionary with the file name, output file, number of bytes and steps, and elapsed time
+    """
+    start_time_ = time()
+    if (run_keyword is None) and (runs is None):
+        runs = [-1]   # the last run
+    jfile = LAMMPSLogFile(filename, run_keyword=run_keyword, runs=runs, endrun_keyword=endrun_keyword, dtype=dtype)
+    added_step = False   # 'Step' is read only to find last_step
+    if select_ckeys is not None:
+        select_ckeys = list(select_ckeys)
+        if (last_step is not None) and ('Step' not in select_ckeys):
+            select_ckeys.append('Step')
+            added_step = True
+    data = jfile.read_datalines(select_ckeys=select_ckeys, even_NSTEPS=False)
+    if data is None:
+        raise RuntimeError('No step found in {}.'.format(filename))
+    data = dict(data)
+    if (last_step is not None):
+        nsteps = int(np.searchsorted(data['Step'][:, 0], last_step, side='right'))
+        data = {key: value[:nsteps] for key, value in data.items()}
+        if added_step:
+            del data['Step']
+    if skip_first:
+        data = {key: value[1:] for key, value in data.items()}
+    if (start_step != 0) and ('Step' in data):
+        data['Step'] = data['Step'] + start_step
+    if (start_time != 0.) and ('Time' in data):
+        data['Time'] = data['Time'] + start_time
+    if volume is not None:
+        data['Volume'] = volume
+    if output is not None:
+        np.save(output, data)
+    nsteps = next(iter(data.values())).shape[0]
+    stats = dict(filename=filename, output=output, nbytes=os.path.getsize(filename), nsteps=nsteps,
+                 elapsed=time() - start_time_)
+    return data, stats
+
+
+def _extract_task(task, quiet=True):
+    """Extract a file (see extract_thermo_files). Return the stats, or the error message."""
+    filename, kwargs = task
+    if quiet:   # silence the reader of a worker process
+        log.set_method('other')
+        log.set_func(lambda *args, **kwargs: None)
+    try:
+        return extract_thermo(filename, **kwargs)[1]
+    except Exception as err:
+        return dict(filename=filename, error='{}: {}'.format(type(err).__name__, err))
+
+
+def extract_thermo_files(filenames, select_ckeys=None, output_dir=None, suffix=OUTPUT_SUFFIX, nprocs=1, **kwargs):
+    """
+    Extract the thermo columns of many LAMMPS log files concurrently, with a pool of nprocs processes, and save each of
+    them into the 'dict' format (see output_filename). The throughput of each file is reported.
+      INPUT:
+        filenames    -> a list of LAMMPS log files
+        select_ckeys -> the column keys to extract (default: None -> all the columns)
+        output_dir   -> the directory of the output files (default: None -> next to each log file)
+        suffix       -> the suffix appended to the name of each log file to get its output file
+        nprocs       -> number of processes (default: 1)
+        other keyword arguments are passed to extract_thermo
+      OUTPUT:
+        stats  ->  a list of the stats of each file (see extract_thermo); failed files have an 'error' key instead
+    """
+    tasks = []
+    for filename in filenames:
+        task_kwargs = dict(kwargs, select_ckeys=select_ckeys, output=output_filename(filename, output_dir, suffix))
+        tasks.append((filename, task_kwargs))
+    start_time = time()
+    if (nprocs > 1) and (len(tasks) > 1):
+        with multiprocessing.Pool(min(nprocs, len(tasks))) as pool:
+            stats = pool.map(_extract_task, tasks, chunksize=1)
+    else:
+        stats = [_extract_task(task, quiet=False) for task in tasks]
+    report_throughput(stats, time() - start_time)
+    return stats
+
+
+def report_throughput(stats, elapsed=None):
+    """Print a table with the throughput (MB/s, steps/s) of each extracted file."""
+    log.write_log('  {:>10s}  {:>10s}  {:>8s}  {:>9s}  {:>11s}  {}'.format('size [MB]', 'steps', 'time [s]', 'MB/s',
+                                                                           'steps/s', 'file'))
+    nbytes, nsteps = 0, 0
+    for s in stats:
+        if 'error' in s:
+            log.write_log('  {:>10s}  {:>10s}  {:>8s}  {:>9s}  {:>11s}  {}  ERROR: {}'.format(
+                '-', '-', '-', '-', '-', s['filename'], s['error']))
+            continue
+        nbytes += s['nbytes']
+        nsteps += s['nsteps']
+        elapsed_file = max(s['elapsed'], 1.0e-9)
+        log.write_log('  {:10.2f}  {:10d}  {:8.2f}  {:9.1f}  {:11.0f}  {} -> {}'.format(
+            s['nbytes'] / 1.0e6, s['nsteps'], s['elapsed'], s['nbytes'] / 1.0e6 / elapsed_file,
+            s['nsteps'] / elapsed_file, s['filename'], s['output']))
+    if elapsed is not None:
+        elapsed = max(elapsed, 1.0e-9)
+        log.write_log('  {:10.2f}  {:10d}  {:8.2f}  {:9.1f}  {:11.0f}  TOTAL'.format(
+            nbytes / 1.0e6, nsteps, elapsed, nbytes / 1.0e6 / elapsed, nsteps / elapsed))
+
+
+################################################################################
+def main():
+    """
+    This script extracts the thermo columns of one or more LAMMPS log files, and saves each of them into a Numpy file
+    ('dict' format of analysis.py).
+
+    Example:
+    extract the Temp and flux columns of the run that follows the line containing "DUMP_RUN" from all the log files,
+    using 4 processes:
+       python extract_lammps_thermo.py  log.*.lammps -d DUMP_RUN -k Temp flux --nprocs 4
+    """
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Extract the thermo columns of LAMMPS log files into the "dict" '
+                                     'format of thermocepstrum-analysis.')
+    parser.add_argument('lammps_logfiles', nargs='+', help='lammps log files to read')
+    parser.add_argument('-k', '--ckeys', nargs='+', dest='ckeys', help='list of column keys to extract (default: all)')
+    parser.add_argument('-d', '--runkey', help='RUN keyword, e.g. the label of the dump command of the production run')
+    parser.add_argument('-e', '--endrunkey', default='Loop time', help='ENDRUN keyword (default: "Loop time")')
+    parser.add_argument('-r', '--runs', nargs='+', type=int,
+                        help='indexes of the runs to read, instead of RUN key (default: the last run)')
+    parser.add_argument('--start-step', type=int, default=0, help='initial step to add to the Step column')
+    parser.add_argument('--start-time', type=float, default=0., help='initial time to add to the Time column')
+    parser.add_argument('--last-step', type=int, help='last step to read')
+    parser.add_argument('--skip-first', action='store_true', help='skip the first step (useful to concatenate files)')
+    parser.add_argument('-V', '--volume', type=float, help='volume of the cell, saved as "Volume"')
+    parser.add_argument('-o', '--output-dir', help='directory of the output files (default: next to each log file)')
+    parser.add_argument('--suffix', default=OUTPUT_SUFFIX,
+                        help='suffix appended to each log file name (default: {})'.format(OUTPUT_SUFFIX))
+    parser.add_argument('--nprocs', type=int, default=1, help='number of processes (default: 1)')
+    args = parser.parse_args()
+
+    if (args.nprocs < 1):
+        parser.error('the number of processes must be a positive number')
+    stats = extract_thermo_files(args.lammps_logfiles, args.ckeys, args.output_dir, args.suffix, args.nprocs,
+                                 run_keyword=args.runkey, runs=args.runs, endrun_keyword=args.endrunkey,
+                                 start_step=args.start_step, start_time=args.start_time, last_step=args.last_step,
+                                 skip_first=args.skip_first, volume=args.volume)
+    return 1 if any('error' in s for s in stats) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
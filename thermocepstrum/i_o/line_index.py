@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   LineIndex
+###
+################################################################################
+###
+###  A sparse index of the byte offsets of the lines of a text file, that allows
+###  one to jump to the N-th line of a (data) section without reading the lines
+###  that precede it.
+###
+###  The index is built once with a fast newline scan of the file, read in large
+###  blocks (compressed files are decompressed on the fly), and stores the total
+###  number of lines and the byte offset of one line every `stride` lines.
+###  Going to line N means seeking to the closest indexed line and skipping
+###  (less than `stride`) lines from there.
+###
+###  The index can be saved into a sidecar file (default: <filename>.lineindex.npz)
+###  and is loaded from it when the file was not modified.
+###
+################################################################################
+###   example:
+###      index = LineIndex(filename, start=start_byte)
+###      print(index.nlines)   # number of lines
+###      with open(filename, 'rb') as f:
+###          index.seek(f, 12345)   # go to the 12345-th line
+################################################################################
+
+import os
+import numpy as np
+from .bulkparse import read_lines
+from .compressed import open_file, iter_blocks
+from thermocepstrum.utils.utils import PrintMethod
+log = PrintMethod()
+
+__all__ = ('LineIndex', 'scan_lines', 'find_line', 'default_index_file')
+
+DEFAULT_STRIDE = 1000   # number of lines between two indexed lines
+INDEX_SUFFIX = '.lineindex.npz'
+SKIP_BYTES = 1 << 16   # size of the raw reads used to skip lines after a seek
+
+
+def default_index_file(filename):
+    """Return the default sidecar index file of a file."""
+    return filename + INDEX_SUFFIX
+
+
+def scan_lines(filename, start=0, end=None, stride=DEFAULT_STRIDE, f=None):
+    """
+    Scan the byte range [start, end) of a file looking for newlines.
+    A final line with no trailing newline is counted as a line.
+      INPUT:
+        filename -> the file name
+        start    -> byte position of the first line
+        end      -> byte position where the scan stops (default: None -> EOF)
+        stride   -> store the offset of one line every stride lines
+        f        -> an open binary file object of filename to be used (default: None -> open the file)
+      OUTPUT:
+        offsets  ->  array with the byte offsets of the lines 0, stride, 2*stride, ...
+        nlines   ->  the number of lines
+        end      ->  byte position where the scan stopped
+    """
+    if f is None:
+        with open_file(filename) as f:
+            return scan_lines(filename, start, end, stride, f)
+    offsets = [np.array([start], dtype=np.int64)]
+    count = 0   # number of newlines found
+    last = b'\n'   # last byte read
+    pos = start
+    for a, block in iter_blocks(f, start, end):
+        starts = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n')) + (a + 1)   # beginning of lines
+        lineno = np.arange(count + 1, count + 1 + starts.size)
+        pos = a + len(block)
+        offsets.append(starts[(lineno % stride == 0) & (starts < pos)])
+        count += starts.size
+        last = block[-1:]
+    nlines = count if (last == b'\n') else count + 1
+    return np.concatenate(offsets), nlines, pos
+
+
+def find_line(filename, pattern, start=0, f=None):
+    """Return the byte offset of the beginning of the first line (after byte start) containing pattern, or None."""
+    if isinstance(pattern, str):
+        pattern = pattern.encode()
+    if f is None:
+        with open_file(filename) as f:
+            return find_line(filename, pattern, start, f)
+    last_newline = start - 1   # position of the last newline before the current block
+    carry = b''   # end of the previous block, to find a pattern across two blocks
+    for a, block in iter_blocks(f, start):
+        block = carry + block
+        base = a - len(carry)
+        pos = block.find(pattern)
+        if (pos >= 0):
+            newline = block.rfind(b'\n', 0, pos)
+            return (base + newline + 1) if (newline >= 0) else (last_newline + 1)
+        newline = block.rfind(b'\n')
+        if (newline >= 0):
+            last_newline = base + newline
+        carry = block[max(0, len(block) - len(pattern) + 1):]
+    return None
+
+
+class LineIndex(object):
+    """
+    A sparse line-offset index of the byte range [start, end) of a text file.
+
+    INPUT parameters:
+     - filename     the file name
+     - start        byte position of the first line (e.g. the first data line after a header)
+     - end          byte position where the indexed section stops (default: None -> EOF)
+     - stride       number of lines between two indexed lines (default: 1000)
+     - index_file   a sidecar file where the index is saved, and loaded from if still valid:
+                    True (default sidecar '<filename>.lineindex.npz') or a file path (default: None -> not saved)
+     - f            an open binary file object of filename to be used for the scan (default: None -> open the file)
+    Byte positions refer to the decompressed data, if the file is compressed.
+    """
+
+    def __init__(self, filename, start=0, end=None, stride=DEFAULT_STRIDE, index_file=None, f=None):
+        self.filename = filename
+        self.start = start
+        self.stride = stride
+        stat = os.stat(filename)
+        self._key = np.array([stat.st_size, stat.st_mtime_ns, self.start, -1 if (end is None) else end, self.stride],
+                             dtype=np.int64)
+        self.index_file = default_index_file(filename) if (index_file is True) else index_file
+
+        if not ((self.index_file is not None) and self._load()):
+            self.offsets, self.nlines, self.end = scan_lines(filename, self.start, end, self.stride, f)
+            if (self.index_file is not None):
+                self.save()
+
+    def __repr__(self):
+        msg = 'LineIndex:\n' + \
+              '  filename:      {}\n'.format(self.filename) + \
+              '  byte range:    [{}, {})\n'.format(self.start, self.end) + \
+              '  nlines:        {}\n'.format(self.nlines) + \
+              '  stride:        {}\n'.format(self.stride)
+        return msg
+
+    def _load(self):
+        """Load the index from the sidecar file. Return False if it does not exist or it is outdated."""
+        if not os.path.isfile(self.index_file):
+            return False
+        try:
+            with np.load(self.index_file) as content:
+                if not np.array_equal(content['key'], self._key):
+                    log.write_log('  line index: {} is outdated.'.format(self.index_file))
+                    return False
+                self.offsets = content['offsets']
+                self.nlines = int(content['nlines'])
+                self.end = int(content['end'])
+        except (OSError, ValueError, KeyError):
+            return False
+        log.write_log('  line index loaded from {}'.format(self.index_file))
+        return True
+
+    def save(self, index_file=None):
+        """Save the index into a sidecar file (default: the index_file given at initialization)."""
+        if index_file is None:
+            index_file = self.index_file
+        tmpfile = index_file + '.tmp.npz'
+        try:
+            np.savez(tmpfile, key=self._key, offsets=self.offsets, nlines=self.nlines, end=self.end)
+            os.replace(tmpfile, index_file)
+        except OSError as err:
+            log.write_log('Warning:  cannot save line index to {} ({})'.format(index_file, err))
+            return
+        log.write_log('  line index saved to {}'.format(index_file))
+
+    def offset(self, line):
+        """Return the byte offset of the closest indexed line preceding line, and the number of lines in between."""
+        if (line >= self.nlines):
+            return self.end, 0
+        return int(self.offsets[line // self.stride]), line % self.stride
+
+    def seek(self, f, line):
+        """Move the (binary) file f to the beginning of line (or to the end of the section if line >= nlines)."""
+        pos, nskip = self.offset(line)
+        f.seek(pos)
+        if (nskip > 0):
+            read_lines(f, nskip, SKIP_BYTES)
+
+    def split(self, first, pos, nlines, nparts):
+        """
+        Split nlines lines, starting from line first (at byte pos), into (at most) nparts ranges whose boundaries are
+        indexed lines. Return a list of (start byte, number of lines) tuples.
+        """
+        last = min(first + nlines, self.nlines)
+        if (last <= first):
+            return []
+        bounds = [first]
+        for k in range(1, nparts):
+            line = (first + (last - first) * k // nparts) // self.stride * self.stride
+            if (line > bounds[-1]) and (line < last):
+                bounds.append(line)
+        bytes_ = [pos] + [int(self.offsets[line // self.stride]) for line in bounds[1:]]
+        bounds.append(last)
+        return [(byte, b - a) for byte, a, b in zip(bytes_, bounds[:-1], bounds[1:])]
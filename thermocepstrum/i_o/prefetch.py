@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   Prefetch
+###
+################################################################################
+###
+###  Asynchronous (double-buffered) reading of a file in chunks.
+###  A background thread reads and parses the next chunks of a reader
+###  (TableFile, LAMMPSLogFile, ...: any reader with the iter_chunks method)
+###  while the consumer processes the current one, so that the total time is
+###  limited by the slower between reading and computing, instead of by their
+###  sum. File reads, decompression and most NumPy/SciPy kernels release the
+###  GIL, so the two threads run concurrently.
+###
+###  The chunks are parsed into a small pool of nbuffers preallocated buffers,
+###  that are reused: the memory is bounded by nbuffers chunks. A buffer is
+###  given back to the reading thread when the consumer asks for the next chunk,
+###  hence the arrays of a chunk must be copied if they are needed later.
+###  While the chunks are prefetched the reader must not be used elsewhere.
+###
+################################################################################
+###   example:
+###      jfile = TableFile(filename)
+###      for chunk in prefetch_chunks(jfile, 100000, select_ckeys=['flux']):
+###          psd_sum += np.abs(np.fft.rfft(chunk['flux'], axis=0))**2   # computed while the next chunk is read
+################################################################################
+
+import queue
+import threading
+import numpy as np
+from thermocepstrum.utils.utils import PrintMethod
+log = PrintMethod()
+
+__all__ = ('prefetch_chunks',)
+
+DEFAULT_NBUFFERS = 2   # double buffering
+
+
+class _Stopped(Exception):
+    """Raised in the reading thread when the consumer stops the iteration."""
+
+
+def prefetch_chunks(reader, chunk_steps, select_ckeys=None, start_step=-1, NSTEPS=0, max_vector_dim=None,
+                    nbuffers=DEFAULT_NBUFFERS):
+    """
+    Read a file in chunks of chunk_steps steps with a background thread, that parses the next chunk while the current
+    one is processed (see reader.iter_chunks for the arguments).
+      INPUT:
+        reader    -> a reader with the iter_chunks method (e.g. TableFile, LAMMPSLogFile)
+        nbuffers  -> number of preallocated chunk buffers (default: 2); at most nbuffers - 1 chunks are read ahead
+      OUTPUT (yield):
+        data    ->  a dictionary with the selected-column steps of the chunk.
+                    Its arrays are reused after the next chunk is requested.
+    """
+    if (nbuffers < 2):
+        raise ValueError('nbuffers must be >= 2.')
+    free = queue.Queue()   # buffers given back by the consumer
+    ready = queue.Queue()   # (chunk, buffer) parsed by the reading thread
+    inflight = []   # buffers given to the reader, in order
+    stop = threading.Event()
+    end = object()
+
+    def buffer_source():
+        for _ in range(nbuffers):   # allocate the buffers when the ckeys are set
+            buffer = {key: np.zeros((chunk_steps, len(idx)), dtype=reader.dtype) for key, idx in reader.ckey.items()}
+            inflight.append(buffer)
+            yield buffer
+        while True:
+            buffer = free.get()
+            if stop.is_set():
+                raise _Stopped()
+            inflight.append(buffer)
+            yield buffer
+
+    def read():
+        try:
+            for chunk in reader.iter_chunks(chunk_steps, select_ckeys, start_step, NSTEPS, max_vector_dim,
+                                            buffers=buffer_source()):
+                ready.put((chunk, inflight.pop(0)))
+        except _Stopped:
+            pass
+        except BaseException as err:   # raised again by the consumer
+            ready.put((err, None))
+        finally:
+            ready.put((end, None))
+
+    thread = threading.Thread(target=read, name='prefetch_chunks', daemon=True)
+    thread.start()
+    try:
+        buffer = None
+        while True:
+            if buffer is not None:
+                free.put(buffer)   # the previous chunk is done: give its buffer back
+            chunk, buffer = ready.get()
+            if chunk is end:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        free.put(None)   # wake up the reading thread, if it is waiting for a buffer
+        thread.join()
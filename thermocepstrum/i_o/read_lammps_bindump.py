@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   ReadLAMMPSBinaryDump
+###
+################################################################################
+###
+###  a reader of LAMMPS binary dump files (dump custom ... with a .bin file name)
+###  with the same interface of LAMMPS_Dump (read_timesteps, select_ckeys,
+###  frame index, storage): the atom data are stored as doubles, and each frame
+###  is read straight into a preallocated (NATOMS, NALLCKEYS) float array, with
+###  no conversion from text.
+###
+###  Layout of a frame (see tools/binary2txt.cpp of LAMMPS, native byte order):
+###     [ bigint -len, char magic[len] 'DUMPCUSTOM', int endian, int revision ]
+###                                               (LAMMPS >= 2020, new format)
+###     bigint ntimestep, bigint natoms, int triclinic, int boundary[3][2],
+###     double xlo, xhi, ylo, yhi, zlo, zhi, [ double xy, xz, yz if triclinic ],
+###     int size_one,
+###     [ int len, char units[len], char time_flag, [ double time ],
+###       int len, char columns[len] ]              (new format, revision > 1)
+###     int nchunk, nchunk * ( int n, double data[n] )   (one chunk per processor)
+###
+###  The old format has no column names: they must be given with the 'columns'
+###  keyword, e.g. columns='id type vx vy vz' (the columns of the dump command).
+###  The frames are found by hopping from header to header, without reading the
+###  atom data (see scan_binary_frames).
+###
+################################################################################
+
+## example:
+##   traj = LAMMPS_BinaryDump('dump.bin')
+##   traj.read_timesteps((0, 1000), select_ckeys=['id', 'vx', 'vy', 'vz'])
+##
+
+import struct
+import numpy as np
+from thermocepstrum.i_o.compressed import open_file
+from thermocepstrum.i_o.read_lammps_dump import LAMMPS_Dump
+from thermocepstrum.utils.utils import PrintMethod
+log = PrintMethod()
+
+__all__ = ('LAMMPS_BinaryDump', 'read_frame_header', 'scan_binary_frames')
+
+MAGIC_STRING = b'DUMPCUSTOM'
+ENDIAN = 0x0001   # the endianness flag, as written by LAMMPS
+BOUNDARY_STYLES = 'pfsm'   # periodic, fixed, shrink-wrapped, shrink-wrapped with minimum
+BYTEORDER = '<'   # only little-endian files (as written by x86 and ARM machines) are supported
+
+
+def _unpack(f, fmt):
+    """Read and unpack the values of the struct format fmt from the binary file object f."""
+    fmt = BYTEORDER + fmt
+    size = struct.calcsize(fmt)
+    buf = f.read(size)
+    if (len(buf) < size):
+        raise EOFError('Truncated LAMMPS binary dump file.')
+    return struct.unpack(fmt, buf)
+
+
+def read_frame_header(f):
+    """
+    Read the header of the next frame of a LAMMPS binary dump file.
+      INPUT:
+        f  -> a binary file object, at the beginning of a frame
+      OUTPUT:
+        header  ->  a dictionary with the keys: timestep, natoms, triclinic, boundary, box (3x2 bounds, or 3x3 with the
+                    tilt factors if triclinic), size_one, revision, units, time, columns, nchunk.
+                    None at EOF. The file is left at the beginning of the atom data.
+    """
+    buf = f.read(8)
+    if (len(buf) == 0):   # EOF
+        return None
+    if (len(buf) < 8):
+        raise EOFError('Truncated LAMMPS binary dump file.')
+    timestep, = struct.unpack(BYTEORDER + 'q', buf)
+    header = {'revision': 0, 'units': None, 'time': None, 'columns': None}
+    if (timestep < 0):   # new format: magic string, endianness and revision
+        magic = f.read(-timestep)
+        if (magic != MAGIC_STRING):
+            raise ValueError('Unknown LAMMPS binary dump format: {}'.format(magic))
+        endian, header['revision'] = _unpack(f, 'ii')
+        if (endian != ENDIAN):
+            raise ValueError('Big-endian LAMMPS binary dump files are not supported.')
+        timestep, = _unpack(f, 'q')
+    header['timestep'] = timestep
+    header['natoms'], header['triclinic'] = _unpack(f, 'qi')
+    boundary = _unpack(f, '6i')
+    header['boundary'] = [BOUNDARY_STYLES[boundary[2 * i]] + BOUNDARY_STYLES[boundary[2 * i + 1]] for i in range(3)]
+    box = np.array(_unpack(f, '6d')).reshape((3, 2))
+    if header['triclinic']:
+        box = np.c_[box, _unpack(f, '3d')]   # xlo xhi xy / ylo yhi xz / zlo zhi yz
+    header['box'] = box
+    header['size_one'], = _unpack(f, 'i')
+    if (header['revision'] > 1):
+        length, = _unpack(f, 'i')
+        if (length > 0):   # the unit style is written in the first frame only
+            header['units'] = f.read(length).decode()
+        time_flag, = _unpack(f, 'b')
+        if time_flag:
+            header['time'], = _unpack(f, 'd')
+        length, = _unpack(f, 'i')
+        header['columns'] = f.read(length).decode()
+    header['nchunk'], = _unpack(f, 'i')
+    return header
+
+
+def _skip_frame_data(f, nchunk):
+    """Skip the atom data of a frame (nchunk chunks), without reading them."""
+    for _ in range(nchunk):
+        n, = _unpack(f, 'i')
+        f.seek(8 * n, 1)
+
+
+def scan_binary_frames(filename, f=None):
+    """
+    Find the byte offsets and the timesteps of all the frames of a LAMMPS binary dump file, reading only the headers.
+      INPUT:
+        filename  -> the file name
+        f         -> an open binary file object of filename (default: None)
+      OUTPUT:
+        offsets    ->  array with the byte offsets of the frames
+        timesteps  ->  array with the timesteps
+    """
+    if f is None:
+        with open_file(filename) as f:
+            return scan_binary_frames(filename, f)
+    offsets, timesteps = [], []
+    f.seek(0)
+    while True:
+        offset = f.tell()
+        header = read_frame_header(f)
+        if header is None:   # EOF
+            break
+        offsets.append(offset)
+        timesteps.append(header['timestep'])
+        _skip_frame_data(f, header['nchunk'])
+    return np.array(offsets, dtype=np.int64), np.array(timesteps, dtype=np.int64)
+
+
+def _readinto(f, array):
+    """Read the bytes of the contiguous array directly from the binary file object f."""
+    buf = memoryview(array).cast('B')
+    if hasattr(f, 'readinto'):
+        nread = f.readinto(buf)
+    else:   # e.g. compressed files
+        data = f.read(buf.nbytes)
+        nread = len(data)
+        buf[:nread] = data
+    if (nread < buf.nbytes):
+        raise EOFError('Warning:  reached EOF.')
+
+
+class LAMMPS_BinaryDump(LAMMPS_Dump):
+    """
+    A reader of LAMMPS binary dump files (dump custom). See LAMMPS_Dump for the methods and the keyword arguments.
+    Optional keyword arguments:
+      columns   the names of the columns, a list or a string (required by files written by LAMMPS < 2020, that
+                do not contain them)
+    Example:
+      traj = LAMMPS_BinaryDump('dump.bin', columns='id type vx vy vz')
+      traj.read_timesteps((10, 30, 2), select_ckeys=['id', 'vx', 'vy', 'vz'])
+    """
+
+    def __init__(self, *args, **kwargs):
+        columns = kwargs.pop('columns', None)
+        self._columns = columns.split() if isinstance(columns, str) else columns
+        self._frame_buffer = None
+        self._unread_chunks = 0   # chunks of the current frame not read yet
+        super().__init__(*args, **kwargs)
+
+    def __repr__(self):
+        return 'LAMMPS_BinaryDump' + super().__repr__()[len('LAMMPS_Dump'):]
+
+    def _read_ckeys(self, group_vectors=True, preload_timesteps=True):
+        """Read the header of the first frame and set the column keys. If group_vectors=True the vector ckeys are
+        grouped togheter"""
+        self._start_byte = self.file.tell()
+        self.all_ckeys = {}
+        self.all_timesteps = []
+        self.preload_timesteps = preload_timesteps
+        self.frame_index = None
+        header = read_frame_header(self.file)
+        if header is None:
+            raise RuntimeError('Reached EOF, no frame found.')
+        self.current_timestep = self.FIRST_TIMESTEP = header['timestep']
+        self.all_timesteps.append(self.current_timestep)
+        self.NATOMS = header['natoms']
+        self.BOX_BOUNDS = header['box']
+        self.BOX_BOUNDS_TYPE = header['boundary']
+        self.UNITS = header['units']
+        if header['columns'] is not None:
+            columns = header['columns'].split()
+        elif self._columns is not None:
+            columns = list(self._columns)
+        else:
+            raise ValueError('The file does not contain the column names: please give them with the columns keyword.')
+        if (len(columns) != header['size_one']):
+            raise ValueError('{} columns given, but the frames have {} columns.'.format(
+                len(columns), header['size_one']))
+        self._numeric_frames = True
+        self._set_all_ckeys(columns, group_vectors)
+        _skip_frame_data(self.file, header['nchunk'])
+        self._index_timesteps()
+        return
+
+    def _next_timestep(self):
+        """Read the timestep of the next frame (from the current position), or return None at EOF."""
+        header = read_frame_header(self.file)
+        if header is None:   # EOF
+            return None
+        _skip_frame_data(self.file, header['nchunk'])
+        return header['timestep']
+
+    def _scan_frames(self, filename, f=None):
+        """Find the byte offsets and the timesteps of all the frames (see scan_binary_frames)."""
+        return scan_binary_frames(filename, f)
+
+    def _read_frame(self):
+        """
+        Read the atom data of the current frame, chunk by chunk, into a preallocated buffer.
+        Return a (NATOMS, NALLCKEYS) float array (reused by the next frame).
+        """
+        if self._frame_buffer is None:
+            self._frame_buffer = np.empty((self.NATOMS, self.NALLCKEYS), dtype=np.float64)
+        flat = self._frame_buffer.reshape(-1)
+        pos = 0
+        for _ in range(self._unread_chunks):
+            n, = _unpack(self.file, 'i')
+            if (pos + n > flat.size):
+                raise ValueError('Frame with a wrong number of values found at TIMESTEP {}.'.format(
+                    self.current_timestep))
+            _readinto(self.file, flat[pos:pos + n])
+            pos += n
+        self._unread_chunks = 0
+        if (pos != flat.size):
+            raise ValueError('Frame with a wrong number of values found at TIMESTEP {}.'.format(self.current_timestep))
+        return self._frame_buffer
+
+    def _gototimestep(self, start_step, fast_check=True):
+        """
+        Go to the start_step-th line in the time series (assumes step=1).
+          start_step = -1  -->  ignore, continue from current step
+                        0  -->  go to FIRST timestep
+                        N  -->  go to N-th timestep
+          fast_check = True --> assumes the TIMESTEP are a monotonously increasing.
+                                If the the start_step is passed and not found then stop.
+        """
+        if (start_step >= 0):
+            if (start_step == 0):
+                goto_step = self.FIRST_TIMESTEP
+            else:
+                goto_step = start_step
+
+            if self.frame_index is not None:   # jump to the frame
+                offset = self.frame_index.offset(goto_step)
+                if offset is None:
+                    raise EOFError('Warning (gototimestep):  Timestep {} NOT FOUND.'.format(goto_step))
+                self.file.seek(offset)
+            elif (start_step <= self.current_timestep):
+                self.file.seek(self._start_byte)   #  --> start over
+            else:
+                _skip_frame_data(self.file, self._unread_chunks)   # go to the next header
+            self._unread_chunks = 0
+            # search until start_step is found, hopping from header to header
+            while True:
+                header = read_frame_header(self.file)
+                if header is None:   # EOF
+                    raise EOFError('Warning (gototimestep):  reached EOF. Timestep {} NOT FOUND.'.format(goto_step))
+                self.current_timestep = header['timestep']
+                if (self.current_timestep == goto_step):
+                    self._unread_chunks = header['nchunk']   # the file is at the beginning of the atom data
+                    break
+                if (fast_check) and (self.current_timestep > goto_step):
+                    raise Warning(
+                        'Warning (gototimestep):  Timestep {} NOT FOUND up to current_step = {}. (To force check the whole trajectory set fast_check=False)'
+                        .format(goto_step, self.current_timestep))
+                _skip_frame_data(self.file, header['nchunk'])
+        return
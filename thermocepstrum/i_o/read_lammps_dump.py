@@ -9,6 +9,19 @@
 ###  a package to read LAMMPS Dump files
 ###  (it assumes that the data column names and the number of atoms do not change)
 ###
+###  The byte offsets of all the frames (timesteps) are stored in a FrameIndex,
+###  so that any timestep can be reached with a single seek. The index can be
+###  saved into a sidecar file (default: <filename>.frameindex.npz).
+###  Compressed files (gzip, bzip2, xz) are decompressed while they are read
+###  (see compressed.py).
+###
+###  The atom lines of each frame are parsed in bulk and sorted by atom id.
+###  Data can be stored as a list of dictionaries (one per timestep, default),
+###  or as one contiguous (nsteps, NATOMS, ncols) array per key, optionally
+###  backed by a memory-mapped .npy file (storage='array' or 'memmap').
+###  The temporary directory of the memory-mapped files (if memmap_dir is not
+###  given) is removed by close(), or when the LAMMPS_Dump object is deleted.
+###
 ################################################################################
 
 ## example:
@@ -16,8 +29,15 @@
 ##   data = rd.LAMMPS_Dump(filename)
 ##
 
+import os
+import mmap
+import shutil
+import weakref
+import tempfile
 import numpy as np
 from time import time
+from thermocepstrum.i_o.bulkparse import read_lines, parse_block
+from thermocepstrum.i_o.compressed import detect_compression, open_file, iter_blocks, CompressedFile
 from thermocepstrum.utils.utils import PrintMethod
 log = PrintMethod()
 
@@ -39,17 +59,17 @@ def is_vector_variable(string):
 
 def file_length(filename):
     i = -1
-    with open(filename) as f:
+    with open_file(filename) as f:
         for i, l in enumerate(f, 1):
             pass
     return i
 
 
 def get_volume(filename):
-    f = open(filename, 'r')
+    f = open_file(filename)
     line = f.readline()
     while (line):
-        if 'BOX BOUNDS' in line:
+        if b'BOX BOUNDS' in line:
             xlo, xhi = list(map(float, f.readline().split()))
             ylo, yhi = list(map(float, f.readline().split()))
             zlo, zhi = list(map(float, f.readline().split()))
@@ -61,10 +81,10 @@ def get_volume(filename):
 
 
 def get_natoms(filename):
-    f = open(filename, 'r')
+    f = open_file(filename)
     line = f.readline()
     while (line):
-        if 'NUMBER OF ATOMS' in line:
+        if b'NUMBER OF ATOMS' in line:
             natoms = int(f.readline())
             break
         line = f.readline()
@@ -72,11 +92,166 @@ def get_natoms(filename):
     return natoms
 
 
+FRAME_TAG = b'ITEM: TIMESTEP\n'
+FRAME_INDEX_SUFFIX = '.frameindex.npz'
+
+
+def scan_frames(filename, f=None):
+    """
+    Find the byte offsets and the timesteps of all the frames of a LAMMPS dump file.
+    The offset of each frame is first guessed from the size of the previous one (the frame size is almost constant
+    when NATOMS does not change) and verified; if the guess is wrong the file is searched from the previous frame.
+    Compressed files are decompressed and searched block by block (see scan_frames_stream).
+      INPUT:
+        filename  -> the file name
+        f         -> an open binary file object of filename to be used for compressed files (default: None)
+      OUTPUT:
+        offsets    ->  array with the byte offsets of the 'ITEM: TIMESTEP' lines
+        timesteps  ->  array with the timesteps
+    """
+
+    def find_frame(mm, start):
+        """Return the offset of the first frame after byte start, or -1."""
+        pos = mm.find(b'\n' + FRAME_TAG, start)
+        return (pos + 1) if (pos >= 0) else -1
+
+    if isinstance(f, CompressedFile) or ((f is None) and (detect_compression(filename) is not None)):
+        return scan_frames_stream(filename, f)
+    offsets, timesteps = [], []
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if (size == 0):
+            return np.array(offsets, dtype=np.int64), np.array(timesteps, dtype=np.int64)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        pos = 0 if (mm[:len(FRAME_TAG)] == FRAME_TAG) else find_frame(mm, 0)
+        frame_size = 0
+        while (pos >= 0):
+            start = pos + len(FRAME_TAG)   # the timestep line
+            end = mm.find(b'\n', start)
+            offsets.append(pos)
+            timesteps.append(int(mm[start:size if (end < 0) else end]))
+            # guess the position of the next frame, and verify it
+            guess = pos + frame_size
+            if (frame_size > 0) and (mm[guess - 1:guess + len(FRAME_TAG)] == b'\n' + FRAME_TAG):
+                nextpos = guess
+            else:
+                nextpos = find_frame(mm, start)
+            frame_size = nextpos - pos
+            pos = nextpos
+        mm.close()
+    return np.array(offsets, dtype=np.int64), np.array(timesteps, dtype=np.int64)
+
+
+def scan_frames_stream(filename, f=None):
+    """
+    Find the byte offsets and the timesteps of all the frames of a (compressed) LAMMPS dump file, reading it in blocks.
+    See scan_frames.
+    """
+    if f is None:
+        with open_file(filename) as f:
+            return scan_frames_stream(filename, f)
+    tag = b'\n' + FRAME_TAG
+    offsets, timesteps = [], []
+    carry = b'\n'   # end of the previous block (a newline before the beginning of the file)
+    for a, block in iter_blocks(f, 0):
+        block = carry + block
+        base = a - len(carry)
+        i = 0
+        while True:
+            pos = block.find(tag, i)
+            if (pos < 0):
+                carry = block[max(i, len(block) - len(tag) + 1):]
+                break
+            end = block.find(b'\n', pos + len(tag))   # end of the timestep line
+            if (end < 0):   # incomplete: search it again in the next block
+                carry = block[pos:]
+                break
+            offsets.append(base + pos + 1)
+            timesteps.append(int(block[pos + len(tag):end]))
+            i = end
+    if carry.startswith(tag) and (len(carry) > len(tag)):   # last timestep line, without a final newline
+        offsets.append(base + len(block) - len(carry) + 1)
+        timesteps.append(int(carry[len(tag):]))
+    return np.array(offsets, dtype=np.int64), np.array(timesteps, dtype=np.int64)
+
+
+class FrameIndex(object):
+    """
+    The byte offsets of the frames of a LAMMPS dump file (see scan_frames).
+
+    INPUT parameters:
+     - filename     the dump file name
+     - index_file   a sidecar file where the index is saved, and loaded from if the file was not modified:
+                    True (default sidecar '<filename>.frameindex.npz') or a file path (default: None -> not saved)
+     - f            an open binary file object of filename to be used for compressed files (default: None)
+     - scan         the function that finds the frames, scan(filename, f) -> (offsets, timesteps) (default: scan_frames)
+    """
+
+    def __init__(self, filename, index_file=None, f=None, scan=scan_frames):
+        self.filename = filename
+        stat = os.stat(filename)
+        self._key = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        self.index_file = (filename + FRAME_INDEX_SUFFIX) if (index_file is True) else index_file
+
+        if not ((self.index_file is not None) and self._load()):
+            self.offsets, self.timesteps = scan(filename, f)
+            if (self.index_file is not None):
+                self.save()
+        # map each timestep to its (first) frame
+        self._frame = {timestep: i for i, timestep in reversed(list(enumerate(self.timesteps.tolist())))}
+
+    def __len__(self):
+        return self.timesteps.size
+
+    def _load(self):
+        """Load the index from the sidecar file. Return False if it does not exist or it is outdated."""
+        if not os.path.isfile(self.index_file):
+            return False
+        try:
+            with np.load(self.index_file) as content:
+                if not np.array_equal(content['key'], self._key):
+                    log.write_log('  frame index: {} is outdated.'.format(self.index_file))
+                    return False
+                self.offsets = content['offsets']
+                self.timesteps = content['timesteps']
+        except (OSError, ValueError, KeyError):
+            return False
+        log.write_log('  frame index loaded from {}'.format(self.index_file))
+        return True
+
+    def save(self, index_file=None):
+        """Save the index into a sidecar file (default: the index_file given at initialization)."""
+        if index_file is None:
+            index_file = self.index_file
+        tmpfile = index_file + '.tmp.npz'
+        try:
+            np.savez(tmpfile, key=self._key, offsets=self.offsets, timesteps=self.timesteps)
+            os.replace(tmpfile, index_file)
+        except OSError as err:
+            log.write_log('Warning:  cannot save frame index to {} ({})'.format(index_file, err))
+            return
+        log.write_log('  frame index saved to {}'.format(index_file))
+
+    def offset(self, timestep):
+        """Return the byte offset of the frame of timestep, or None if it is not found."""
+        frame = self._frame.get(timestep, None)
+        return None if (frame is None) else int(self.offsets[frame])
+
+
 class LAMMPS_Dump(object):
     """
     A LAMMPS_Dump file that can be read in blocks.
     example:
       traj = LAMMPS_Dump(filename, preload=False)  -->> do not preload list of steps (suggested if the file is big)
+      traj = LAMMPS_Dump(filename, index_file=True)  -->> save the frame index to '<filename>.frameindex.npz' (and
+                                                          load it from there next time)
+      traj = LAMMPS_Dump(filename, storage='array')  -->> store each key in a (nsteps, NATOMS, ncols) array:
+                                                          traj.data['xu'][istep], traj.data['TIMESTEP'][istep]
+      traj = LAMMPS_Dump(filename, storage='memmap', memmap_dir='/scratch')  -->> as 'array', but each key is a
+                                                          memory-mapped .npy file in memmap_dir (default: a new
+                                                          temporary directory, removed by traj.close() or when traj
+                                                          is deleted: the data arrays must not be used afterwards)
+      traj = LAMMPS_Dump(filename, dtype=np.float32)  -->> store the numerical columns in single precision
       traj.read_timesteps(10, start_step=0, select_ckeys=['id,xu,yu,vu']) -->>   Read first 10 timesteps, only the specified columns
       traj.read_timesteps(10, select_ckeys=['id,xu,yu,vu']) -->>   Read the next 10 timesteps, only the specified columns (DELTA_TIMESTEP is assumed)
       traj.read_timesteps((10,30))      -->>  Read from TIMESTEP 10 to 30
@@ -96,6 +271,13 @@ class LAMMPS_Dump(object):
             raise ValueError('No file given.')
         group_vectors = kwargs.get('group_vectors', True)
         preload_timesteps = kwargs.get('preload', True)
+        self._index_file = kwargs.get('index_file', None)
+        self._storage = kwargs.get('storage', 'list')
+        self._memmap_dir = kwargs.get('memmap_dir', None)
+        self._memmap_cleanup = None   # removes the temporary memmap_dir
+        self.dtype = np.dtype(kwargs.get('dtype', np.float64))
+        if self._storage not in ['list', 'array', 'memmap']:
+            raise ValueError('storage must be \'list\', \'array\' or \'memmap\'.')
         self._quiet = kwargs.get('quiet', False)
         self._GUI = kwargs.get('GUI', False)
         if self._GUI:
@@ -130,7 +312,7 @@ class LAMMPS_Dump(object):
     def _open_file(self):
         """Open the file."""
         try:
-            self.file = open(self.filename, 'r')
+            self.file = open_file(self.filename)
         except:
             raise ValueError('File does not exist.')
         return
@@ -141,8 +323,9 @@ class LAMMPS_Dump(object):
         self.all_ckeys = {}
         self.all_timesteps = []
         self.preload_timesteps = preload_timesteps
+        self.frame_index = None
         while True:
-            line = self.file.readline()
+            line = self.file.readline().decode()
             if len(line) == 0:   # EOF
                 raise RuntimeError('Reached EOF, no ckeys found.')
             values = np.array(line.split())
@@ -156,47 +339,66 @@ class LAMMPS_Dump(object):
                     self.NATOMS = int(self.file.readline())
                 elif ((values[1] == 'BOX') and values[2] == 'BOUNDS'):
                     self.BOX_BOUNDS_TYPE = values[3:6]
-                    xbox = self.file.readline().split()
-                    ybox = self.file.readline().split()
-                    zbox = self.file.readline().split()
+                    xbox = self.file.readline().decode().split()
+                    ybox = self.file.readline().decode().split()
+                    zbox = self.file.readline().decode().split()
                     self.BOX_BOUNDS = np.array([xbox, ybox, zbox], dtype='float')
                 elif (values[1] == 'ATOMS'):
-                    for i in range(2, len(values)):
-                        if group_vectors:
-                            bracket = is_vector_variable(values[i])   # get position of left square bracket
-                        else:
-                            bracket = 0
-                        if (bracket == 0):   # the variable is a scalar
-                            key = values[i]
-                            if (key[:2] == 'c_'):   # remove 'c_' if present
-                                key = key[2:]
-                            self.all_ckeys[key] = [i - 2]   # -2 offset
-                        else:   # the variable is a vector
-                            key = values[i][:bracket]   # name of vector
-                            if (key[:2] == 'c_'):   # remove 'c_' if present
-                                key = key[2:]
-                            vecidx = int(values[i][bracket + 1:-1])   # current index
-                            if key in self.all_ckeys:   # if this vector is already defined, add this component
-                                if (vecidx > self.all_ckeys[key].size):
-                                    self.ckeys[key] = np.resize(self.all_ckeys[key], vecidx)
-                                self.all_ckeys[key][vecidx - 1] = i - 2   # -2 offset!
-                            else:   # if it is not, define a vector
-                                self.all_ckeys[key] = np.array([0] * vecidx)
-                                self.all_ckeys[key][-1] = i - 2   # -2 offset!
+                    self._numeric_frames = True   # False if some columns cannot be converted to float
+                    self._set_all_ckeys(values[2:], group_vectors)
                     #self._start_byte = self.file.tell()
                     break
             #else:
             #   self.header += line
+        self._index_timesteps()
+        return
+
+    def _set_all_ckeys(self, values, group_vectors=True):
+        """Set the column keys from the list of the names of the atom columns."""
+        self.NALLCKEYS = len(values)   # number of columns of each atom line
+        for i in range(len(values)):
+            if group_vectors:
+                bracket = is_vector_variable(values[i])   # get position of left square bracket
+            else:
+                bracket = 0
+            if (bracket == 0):   # the variable is a scalar
+                key = values[i]
+                if (key[:2] == 'c_'):   # remove 'c_' if present
+                    key = key[2:]
+                self.all_ckeys[key] = [i]
+            else:   # the variable is a vector
+                key = values[i][:bracket]   # name of vector
+                if (key[:2] == 'c_'):   # remove 'c_' if present
+                    key = key[2:]
+                vecidx = int(values[i][bracket + 1:-1])   # current index
+                if key in self.all_ckeys:   # if this vector is already defined, add this component
+                    if (vecidx > self.all_ckeys[key].size):
+                        self.all_ckeys[key] = np.resize(self.all_ckeys[key], vecidx)
+                    self.all_ckeys[key][vecidx - 1] = i
+                else:   # if it is not, define a vector
+                    self.all_ckeys[key] = np.array([0] * vecidx)
+                    self.all_ckeys[key][-1] = i
+        return
 
+    def _next_timestep(self):
+        """Read the timestep of the next frame (from the current position), or return None at EOF."""
+        while True:
+            line = self.file.readline()
+            if len(line) == 0:   # EOF
+                return None
+            if (line == FRAME_TAG):
+                return int(self.file.readline())
+
+    def _scan_frames(self, filename, f=None):
+        """Find the byte offsets and the timesteps of all the frames (see scan_frames)."""
+        return scan_frames(filename, f)
+
+    def _index_timesteps(self):
+        """Get the list of the timesteps (and index the frames if preload_timesteps), then go to the first one."""
         if self.preload_timesteps:
-            # get the list of time steps
-            while True:
-                line = self.file.readline()
-                if len(line) == 0:   # EOF
-                    break
-                if (line == 'ITEM: TIMESTEP\n'):
-                    self.current_timestep = int(self.file.readline())
-                    self.all_timesteps.append(self.current_timestep)
+            # get the list of time steps and the position of each frame
+            self.frame_index = FrameIndex(self.filename, self._index_file, self.file, scan=self._scan_frames)
+            self.all_timesteps = self.frame_index.timesteps.tolist()
 
             self.LAST_TIMESTEP = self.all_timesteps[-1]
             self.DELTA_TIMESTEP = self.all_timesteps[1] - self.FIRST_TIMESTEP
@@ -206,12 +408,11 @@ class LAMMPS_Dump(object):
             log.write_log(' ** No timesteps pre-loaded. Be careful in the selection. **')
             # get the first 2 timesteps
             while (len(self.all_timesteps) < 2):
-                line = self.file.readline()
-                if len(line) == 0:   # EOF
+                timestep = self._next_timestep()
+                if timestep is None:   # EOF
                     break
-                if (line == 'ITEM: TIMESTEP\n'):
-                    self.current_timestep = int(self.file.readline())
-                    self.all_timesteps.append(self.current_timestep)
+                self.current_timestep = timestep
+                self.all_timesteps.append(self.current_timestep)
 
             self.LAST_TIMESTEP = None
             self.DELTA_TIMESTEP = self.all_timesteps[1] - self.FIRST_TIMESTEP
@@ -312,15 +513,61 @@ class LAMMPS_Dump(object):
             raise ValueError('ckey not set.')
         if self.timestep is None:
             raise ValueError('timestep not set.')
-        self.data = [dict() for i in range(self.nsteps)]
-        for istep in range(self.nsteps):
+        if (self._storage == 'list'):
+            self.data = [dict() for i in range(self.nsteps)]
+            for istep in range(self.nsteps):
+                for key, idx in self.ckey.items():
+                    if (key == 'element'):   # this should be improved
+                        self.data[istep][key] = np.zeros((self.NATOMS, len(idx)), dtype='S8')
+                    else:
+                        self.data[istep][key] = np.zeros((self.NATOMS, len(idx)), dtype=self.dtype)
+        else:   # one contiguous array per key
+            if (self._storage == 'memmap') and (self._memmap_dir is None):
+                self._memmap_dir = tempfile.mkdtemp(prefix='thermocepstrum_')
+                self._memmap_cleanup = weakref.finalize(self, shutil.rmtree, self._memmap_dir, ignore_errors=True)
+            self.data = {'TIMESTEP': np.zeros(self.nsteps, dtype=np.int64)}
             for key, idx in self.ckey.items():
-                if (key == 'element'):   # this should be improved
-                    self.data[istep][key] = np.zeros((self.NATOMS, len(idx)), dtype='S8')
+                shape = (self.nsteps, self.NATOMS, len(idx))
+                dtype = 'S8' if (key == 'element') else self.dtype
+                if (self._storage == 'memmap'):
+                    self.data[key] = np.lib.format.open_memmap(os.path.join(self._memmap_dir, key + '.npy'), mode='w+',
+                                                               dtype=dtype, shape=shape)
                 else:
-                    self.data[istep][key] = np.zeros((self.NATOMS, len(idx)), dtype='float64')
+                    self.data[key] = np.zeros(shape, dtype=dtype)
+            if (self._storage == 'memmap') and not self._quiet:
+                log.write_log('  memmap_dir = ', self._memmap_dir)
+        return
+
+    def close(self):
+        """
+        Close the file, and remove the temporary directory of the memory-mapped data (storage='memmap' without
+        memmap_dir). The data arrays must not be used after closing.
+        """
+        self.file.close()
+        if self._memmap_cleanup is not None:
+            self._memmap_cleanup()
+            self._memmap_cleanup = None
+            self._memmap_dir = None
         return
 
+    def _read_frame(self):
+        """
+        Read the NATOMS atom lines of the current frame in bulk.
+        Return a (NATOMS, NALLCKEYS) float array, or an array of bytes if some columns are not numerical (e.g. element).
+        """
+        block, nread = read_lines(self.file, self.NATOMS, 128 * self.NATOMS + 4096)
+        if (nread < self.NATOMS):
+            raise EOFError('Warning:  reached EOF.')
+        if self._numeric_frames:
+            try:
+                return parse_block(block, self.NATOMS, self.NALLCKEYS)
+            except ValueError:
+                self._numeric_frames = False   # do not try again with the next frames
+        values = np.array(block.split())
+        if (values.size != self.NATOMS * self.NALLCKEYS):
+            raise ValueError('Frame with a wrong number of columns found at TIMESTEP {}.'.format(self.current_timestep))
+        return values.reshape((self.NATOMS, self.NALLCKEYS))
+
     def _gototimestep(self, start_step, fast_check=True):
         """
         Go to the start_step-th line in the time series (assumes step=1).
@@ -331,23 +578,28 @@ class LAMMPS_Dump(object):
                                 If the the start_step is passed and not found then stop.
         """
         if (start_step >= 0):
-            if (start_step <= self.current_timestep):
-                # or (self.current_timestep == -1):  # if start_step is before/equal the current step
-                self.file.seek(self._start_byte)   #  --> start over
             if (start_step == 0):   # or (self.current_timestep == -1):
                 goto_step = self.FIRST_TIMESTEP
             else:
                 goto_step = start_step
 
-            # search until start_step is found     ***** MAY BE IMPROVED KNOWING THE N OF LINES TO SKIP ******
+            if self.frame_index is not None:   # jump to the frame
+                offset = self.frame_index.offset(goto_step)
+                if offset is None:
+                    raise EOFError('Warning (gototimestep):  Timestep {} NOT FOUND.'.format(goto_step))
+                self.file.seek(offset)
+            elif (start_step <= self.current_timestep):
+                # or (self.current_timestep == -1):  # if start_step is before/equal the current step
+                self.file.seek(self._start_byte)   #  --> start over
+            # search until start_step is found
             while True:
                 line = self.file.readline()
                 if len(line) == 0:   # EOF
                     raise EOFError('Warning (gototimestep):  reached EOF. Timestep {} NOT FOUND.'.format(goto_step))
-                if (line == 'ITEM: TIMESTEP\n'):
+                if (line == FRAME_TAG):
                     self.current_timestep = int(self.file.readline())
                     if (self.current_timestep == goto_step):
-                        while (self.file.readline().find('ITEM: ATOMS') < 0):   # jump to the data part
+                        while (self.file.readline().find(b'ITEM: ATOMS') < 0):   # jump to the data part
                             pass
                         break
                     if (fast_check) and (self.current_timestep > goto_step):
@@ -394,18 +646,16 @@ class LAMMPS_Dump(object):
         atomid_col = self.all_ckeys['id'][0]
         for istep, step in enumerate(self.timestep):
             self._gototimestep(step, fast_check)   # jump to the desired step,
-            self.data[istep]['TIMESTEP'] = step
-            for nat in range(self.NATOMS):   # read data (may be unsorted)
-                line = self.file.readline()
-                if len(line) == 0:   # EOF
-                    raise EOFError('Warning:  reached EOF.')
-                values = np.array(line.split())
-                for key, idx in self.ckey.items():   # save the selected columns
-                    atomid = int(values[atomid_col]) - 1   # current atom index (in LAMMPS it starts from 1)
-                    if (key == 'element'):   # this should be improved
-                        self.data[istep][key][atomid, :] = np.array(list(map(str, values[idx])))
-                    else:
-                        self.data[istep][key][atomid, :] = np.array(list(map(float, values[idx])))
+            values = self._read_frame()   # read data (may be unsorted)
+            atomid = values[:, atomid_col].astype(np.int64) - 1   # atom indexes (in LAMMPS they start from 1)
+            if (self._storage == 'list'):
+                self.data[istep]['TIMESTEP'] = step
+                for key, idx in self.ckey.items():   # save the selected columns, sorted by atom index
+                    self.data[istep][key][atomid, :] = values[:, idx]
+            else:
+                self.data['TIMESTEP'][istep] = step
+                for key, idx in self.ckey.items():   # save the selected columns, sorted by atom index
+                    self.data[key][istep, atomid, :] = values[:, idx]
             if ((istep + 1) % progbar_step == 0):
                 if self._GUI:
                     progbar.value = float(istep + 1) / self.nsteps * 100.
@@ -17,9 +17,27 @@
 ###  begin with a 'Step' in the first column).
 ###  The reading stops when and 'end_keyword' is found (default: 'Loop time').
 ###
+###  Alternatively, the output blocks of all the runs of the file can be listed
+###  with list_runs (a single pass through the file), and one or more runs can be
+###  selected by their index with the 'runs' keyword. Consecutive runs are read
+###  as a single contiguous time series (the first step of a run is skipped when
+###  it repeats the last step of the previous one).
+###
 ###  Lines are read SEQUENTIALLY with the method read_datalines.
 ###  If a start_step is not specified the file is read from the current position.
 ###  This allows one to read the file in blocks.
+###  Compressed files (gzip, bzip2, xz) are decompressed while they are read
+###  (see compressed.py).
+###  The method iter_chunks yields the data in chunks of fixed size, so that
+###  files larger than the available memory can be processed.
+###  The chunks can be prefetched by a background thread while the current one
+###  is processed (see prefetch.py).
+###  The method follow reads a log file that is still being written (tail/follow
+###  mode): each call parses only the lines appended since the previous one.
+###  A sparse line-offset index (see line_index.py) of the output block allows
+###  one to jump to any start_step without reading the preceding lines.
+###  The parsed columns can be stored in a persistent binary cache (cache=True,
+###  see column_cache.py), so that later runs do not parse the text again.
 ###
 ################################################################################
 ###  Example of LAMMPS Log file:
@@ -43,12 +61,27 @@
 ###     data.read_datalines(NSTEPS=100, start_step=0, select_ckeys=['Step', 'Temp', 'flux'])
 ###     print(data.data)
 ###
-###     # to save data into a Numpy file:
+###     runs = list_runs('lammps.log')   # list the output blocks
+###     data = LAMMPSLogFile('lammps.log', runs=[2, 3, 4])   # concatenate runs 2, 3, 4
+###
+###     data = LAMMPSLogFile('lammps.log', runs=-1)   # monitor the last (running) run
+###     data.follow(select_ckeys=['flux'])   # read all the steps written so far
+###     data.follow()   # later: read only the new steps
+###
+###     # to save data into a chunked store (see chunked_store.py), reading the file in chunks:
+###     save_hc_store(data, ['flux'], 'lammps.data', 'flux.store')
+###     # to save data into a Numpyz file (the whole arrays are kept in memory):
 ###     save_hc_npz(data, ['flux'], 'lammps.data', 'flux.npz')
 ################################################################################
 
+import os
 import numpy as np
 from time import time
+from thermocepstrum.i_o.bulkparse import CHUNK_BYTES, CHUNK_STEPS, read_lines, parse_block, parse_lines, column_plan
+from thermocepstrum.i_o.column_cache import ColumnCache, DEFAULT_MAX_SIZE
+from thermocepstrum.i_o.chunked_store import ChunkedStore, DEFAULT_CHUNK_STEPS
+from thermocepstrum.i_o.line_index import LineIndex, find_line
+from thermocepstrum.i_o.compressed import open_file, iter_blocks, CompressedFile
 from thermocepstrum.utils.utils import PrintMethod
 log = PrintMethod()
 
@@ -97,10 +130,26 @@ class LAMMPSLogFile(object):
   When this keyword is found the next output block is read (it is supposed to
   begin with a 'Step' in the first column).
   The reading stops when and 'end_keyword' is found (default: 'Loop time').
+  Alternatively, one or more runs (see list_runs) can be selected with 'runs':
+  consecutive runs are read as a single contiguous time series.
 
   Lines are read SEQUENTIALLY with the method read_datalines.
   If a start_step is not specified the file is read from the current position.
   This allows one to read the file in blocks.
+  A log file that is still being written can be monitored with the method follow.
+
+  Optional keyword arguments:
+    runs           -> index (or list of indexes) of the runs to read, instead of run_keyword (see list_runs);
+                      negative indexes count from the last run
+    endrun_keyword -> the string that ends the run output (default: 'Loop time')
+    group_vectors  -> group the components of LAMMPS-style vectors (default: True)
+    cache          -> store the parsed columns in a persistent binary cache:
+                      True (cache directory next to the file) or a cache directory path (default: None)
+    cache_max_size -> maximum size of the cache directory [bytes] (default: 10 GiB)
+    dtype          -> floating point type of the data arrays, e.g. np.float32 to halve the memory
+                      (default: np.float64)
+    index_file     -> save the line-offset index into a sidecar file, and load it from there in later runs:
+                      True ('<filename>.lineindex.npz') or a file path (default: None -> the index is not saved)
 
 #############################################################################
   Example of LAMMPS Log file:
@@ -145,19 +194,46 @@ class LAMMPSLogFile(object):
             raise ValueError('No file given.')
         self.run_keyword = kwargs.get('run_keyword', None)
         self.endrun_keyword = kwargs.get('endrun_keyword', 'Loop time')
+        runs = kwargs.get('runs', None)
         group_vectors = kwargs.get('group_vectors', True)
+        self.dtype = np.dtype(kwargs.get('dtype', np.float64))
         self._GUI = kwargs.get('GUI', False)
-        if self.run_keyword is None:
-            raise ValueError('Please specify run_keyword.')
+        if (self.run_keyword is None) and (runs is None):
+            raise ValueError('Please specify run_keyword or runs.')
+        if isinstance(runs, int):
+            runs = [runs]
         if self._GUI:
             from ipywidgets import FloatProgress
             from IPython.display import display
             global FloatProgress, display
 
         self._open_file()
-        self.MAX_NSTEPS = file_length(self.filename)
-        self._read_ckeys(self.run_keyword, group_vectors)
+        if runs is None:
+            self._read_ckeys(self.run_keyword, group_vectors)
+            # index the output block, up to the line containing endrun_keyword
+            end = find_line(self.filename, self.endrun_keyword, self._start_byte, f=self.file)
+            index = LineIndex(self.filename, start=self._start_byte, end=end, index_file=kwargs.get('index_file', None),
+                              f=self.file)
+            self.segments = [dict(index=index, skip=0, nsteps=index.nlines, complete=(end is not None))]
+        else:
+            self._read_runs(runs, group_vectors)
+        self.runs = runs
         self.ckey = None
+        self._follow = None   # state of the follow mode
+        self.follow_complete = False
+        self.current_step = 0
+        self.gotostep(0)
+        self.MAX_NSTEPS = sum(segment['nsteps'] for segment in self.segments)
+        log.write_log('Data length = ', self.MAX_NSTEPS)
+
+        cache = kwargs.get('cache', None)
+        if cache:
+            settings = dict(reader='LAMMPSLogFile', group_vectors=group_vectors, run_keyword=self.run_keyword,
+                            endrun_keyword=self.endrun_keyword, runs=runs, dtype=self.dtype.name)
+            self.cache = ColumnCache(self.filename, settings=settings, cache_dir=(None if cache is True else cache),
+                                     max_size=kwargs.get('cache_max_size', DEFAULT_MAX_SIZE))
+        else:
+            self.cache = None
         return
 
     def __repr__(self):
@@ -173,17 +249,16 @@ class LAMMPSLogFile(object):
     def _open_file(self):
         """Open the file."""
         try:
-            self.file = open(self.filename, 'r')
+            self.file = open_file(self.filename)
         except:
             raise ValueError('File does not exist.')
         return
 
     def _read_ckeys(self, run_keyword, group_vectors=True):
         """Seek the line containing 'run_keyword'. Read the column keys. If group_vectors=True the vector ckeys are grouped togheter."""
-        self.all_ckeys = {}
         nlines = 0
         while True:
-            line = self.file.readline()
+            line = self.file.readline().decode()
             nlines += 1
             if len(line) == 0:   # EOF
                 raise RuntimeError('Reached EOF, run_keyword was not found!')
@@ -192,7 +267,7 @@ class LAMMPSLogFile(object):
                 log.write_log('  run_keyword found at line {:d}.'.format(nlines))
                 break
         while True:
-            line = self.file.readline()
+            line = self.file.readline().decode()
             nlines += 1
             if len(line) == 0:   # EOF
                 raise RuntimeError('Reached EOF, no ckeys found.')
@@ -200,37 +275,64 @@ class LAMMPSLogFile(object):
             # find the column headers line
             if (len(values) and (is_string(values[0])) and (values[0] == 'Step')):
                 log.write_log('  column headers found at line {:d}. Reading data...'.format(nlines))
-                for i in range(len(values)):
-                    if group_vectors:
-                        bracket = is_vector_variable(values[i])   # position of left square bracket
-                    else:
-                        bracket = 0
-                    if (bracket == 0):   # the variable is a scalar
-                        key = values[i]
-                        if (key[:2] == 'c_'):   # remove 'c_' if present
-                            key = key[2:]
-                        self.all_ckeys[key] = np.array([i])
-                    else:   # the variable is a vector
-                        key = values[i][:bracket]   # name of vector
-                        if (key[:2] == 'c_'):   # remove 'c_' if present
-                            key = key[2:]
-                        vecidx = int(values[i][bracket + 1:-1])   # current index
-                        if key in self.all_ckeys:   # if this vector is already defined, add this component
-                            if (vecidx > self.all_ckeys[key].size):
-                                self.all_ckeys[key] = np.resize(self.all_ckeys[key], vecidx)
-                            self.all_ckeys[key][vecidx - 1] = i
-                        else:   # if it is not, define a vector
-                            self.all_ckeys[key] = np.array([0] * vecidx)
-                            self.all_ckeys[key][-1] = i
+                self._set_all_ckeys(values, group_vectors)
                 self._start_byte = self.file.tell()
-                self.MAX_NSTEPS -= nlines
                 break
-        self.NALLCKEYS = np.concatenate(list(self.all_ckeys.values())).size
+        return
+
+    def _set_all_ckeys(self, values, group_vectors=True):
+        """Set the column keys from the column headers. If group_vectors=True the vector ckeys are grouped togheter."""
+        self.all_ckeys = {}
+        for i in range(len(values)):
+            if group_vectors:
+                bracket = is_vector_variable(values[i])   # position of left square bracket
+            else:
+                bracket = 0
+            if (bracket == 0):   # the variable is a scalar
+                key = values[i]
+                if (key[:2] == 'c_'):   # remove 'c_' if present
+                    key = key[2:]
+                self.all_ckeys[key] = np.array([i])
+            else:   # the variable is a vector
+                key = values[i][:bracket]   # name of vector
+                if (key[:2] == 'c_'):   # remove 'c_' if present
+                    key = key[2:]
+                vecidx = int(values[i][bracket + 1:-1])   # current index
+                if key in self.all_ckeys:   # if this vector is already defined, add this component
+                    if (vecidx > self.all_ckeys[key].size):
+                        self.all_ckeys[key] = np.resize(self.all_ckeys[key], vecidx)
+                    self.all_ckeys[key][vecidx - 1] = i
+                else:   # if it is not, define a vector
+                    self.all_ckeys[key] = np.array([0] * vecidx)
+                    self.all_ckeys[key][-1] = i
+        self.NALLCKEYS = len(values)   # number of columns of each data line
         log.write_log(' #####################################')
         log.write_log('  all_ckeys = ', self.all_ckeys)
         log.write_log(' #####################################')
         return
 
+    def _read_runs(self, runs, group_vectors=True):
+        """Scan the runs of the file and select the output blocks of runs, that should have the same column headers."""
+        all_runs = scan_runs(self.filename, self.endrun_keyword, self.file)
+        runs = [(irun + len(all_runs)) if (irun < 0) else irun for irun in runs]   # negative indexes
+        for irun in runs:
+            if not (0 <= irun < len(all_runs)):
+                raise ValueError('Run {} not found ({:d} runs in file).'.format(irun, len(all_runs)))
+            if (all_runs[irun]['columns'] != all_runs[runs[0]]['columns']):
+                raise ValueError('Runs {} and {} have different column headers.'.format(runs[0], irun))
+        log.write_log('  reading runs {}'.format(runs))
+        self._set_all_ckeys(np.array(all_runs[runs[0]]['columns']), group_vectors)
+        self._start_byte = all_runs[runs[0]]['start_byte']
+        self.segments = []
+        for i, irun in enumerate(runs):
+            run = all_runs[irun]
+            # skip the first step if it repeats the last step of the previous run
+            skip = int((i > 0) and (run['nlines'] > 0) and (run['first_step'] is not None) and
+                       (run['first_step'] == all_runs[runs[i - 1]]['last_step']))
+            self.segments.append(
+                dict(index=run['index'], skip=skip, nsteps=run['nlines'] - skip, complete=run['complete']))
+        return
+
     def _set_ckey(self, select_ckeys=None, max_vector_dim=None):
         """Set the ckeys that have been selected, checking the available ones."""
         if select_ckeys is not None:
@@ -249,6 +351,8 @@ class LAMMPSLogFile(object):
             raise KeyError('No ckey set. Check selected keys.')
         else:
             log.write_log('  ckey = ', self.ckey)
+        # column plan: only the selected columns are converted when parsing
+        self._usecols, self._ckey_cols = column_plan(self.ckey)
         return
 
     def _initialize_dic(self, NSTEPS=None):
@@ -263,7 +367,7 @@ class LAMMPSLogFile(object):
         self.NSTEPS = 0
         self.data = {}
         for key, idx in self.ckey.items():
-            self.data[key] = np.zeros((NSTEPS, len(idx)))
+            self.data[key] = np.zeros((NSTEPS, len(idx)), dtype=self.dtype)
         return
 
     def gotostep(self, start_step):
@@ -274,11 +378,224 @@ class LAMMPSLogFile(object):
                         N  -->  go to N-th step
         """
         if (start_step >= 0):
-            self.file.seek(self._start_byte)
-            for i in range(start_step):   # advance of start_step-1 lines
-                self.file.readline()
+            # find the output block (segment) containing start_step
+            iseg, first = 0, 0
+            while (iseg < len(self.segments) - 1) and (start_step >= first + self.segments[iseg]['nsteps']):
+                first += self.segments[iseg]['nsteps']
+                iseg += 1
+            self._segment, self._segment_step = iseg, start_step - first
+            segment = self.segments[iseg]
+            # seek the closest indexed line, then skip the remaining ones
+            segment['index'].seek(self.file, segment['skip'] + self._segment_step)
+            self.current_step = start_step
         return
 
+    def _parse_block(self, block, nlines):
+        """
+        Convert the selected columns (see _set_ckey) of a block of nlines data lines into a (nlines, len(usecols))
+        array.
+        If a malformed line is found, only the lines preceding it are returned and the file is moved back to its
+        beginning.
+        """
+        try:
+            return parse_block(block, nlines, self.NALLCKEYS, self._usecols)
+        except ValueError:
+            lines = block.splitlines(True)
+            values, nvalid = parse_lines(lines, self.NALLCKEYS)
+            if (nvalid < len(lines)):
+                log.write_log('Warning:  line with wrong number of columns found. Stopping here...')
+                log.write_log(lines[nvalid].decode())
+            self.file.seek(sum(len(line) for line in lines[:nvalid]) - len(block), 1)
+            return values[:, self._usecols]
+
+    def _parse_datalines(self, NSTEPS, progbar=None):
+        """
+        Read and parse NSTEPS lines, converting CHUNK_STEPS lines at once, and moving to the next output block (segment)
+        when the current one is over. Return the number of steps read.
+        """
+        progbar_step = max(100000, int(0.005 * NSTEPS))
+        step = 0
+        while (step < NSTEPS):
+            segment = self.segments[self._segment]
+            if (self._segment_step >= segment['nsteps']):   # end of the output block
+                if (self._segment + 1 == len(self.segments)):
+                    if segment['complete']:
+                        log.write_log('  endrun_keyword found.')
+                    else:
+                        log.write_log('Warning:  reached EOF.')
+                    break
+                self._segment, self._segment_step = self._segment + 1, 0
+                segment = self.segments[self._segment]
+                segment['index'].seek(self.file, segment['skip'])
+            nlines = min(CHUNK_STEPS, NSTEPS - step, segment['nsteps'] - self._segment_step)
+            block, nread = read_lines(self.file, nlines)
+            values = self._parse_block(block, nread)
+            nvalid = values.shape[0]
+            for key, cols in self._ckey_cols.items():   # save the selected columns
+                self.data[key][step:step + nvalid, :] = values[:, cols]
+            if ((step + nvalid) // progbar_step > step // progbar_step):
+                if progbar is not None:
+                    progbar.value = float(step + nvalid) / NSTEPS * 100.
+                    progbar.description = '{:6.2f}%'.format(progbar.value)
+                else:
+                    log.write_log('    step = {:9d} - {:6.2f}% completed'.format(step + nvalid,
+                                                                                 float(step + nvalid) / NSTEPS * 100.))
+            step += nvalid
+            self._segment_step += nvalid
+            if (nvalid < nlines):
+                if (nvalid == nread):
+                    log.write_log('Warning:  reached EOF.')
+                break
+        return step
+
+    def iter_chunks(self, chunk_steps, select_ckeys=None, start_step=-1, NSTEPS=0, max_vector_dim=None, buffers=None):
+        """
+        Read the file in chunks of chunk_steps steps, yielding a data dictionary for each chunk, so that a file of any
+        size can be processed with a bounded amount of memory. The file position is kept between chunks.
+          INPUT:
+            chunk_steps    -> number of steps of each chunk (the last chunk may be shorter)
+            select_ckeys   -> an array with the column keys you want to read (see all_ckeys for a list)
+            start_step  = -1 -> continue from current step (default)
+                           0 -> go to start step
+                           N -> go to N-th step
+            NSTEPS         -> total number of steps to read (default: 0 -> read until the end of the data)
+            max_vector_dim -> when reading vectors read only this number of components (None = read all components)
+            buffers        -> an iterable of preallocated data dictionaries (with at least chunk_steps steps), into which
+                              the chunks are parsed in turn instead of new arrays (see prefetch.py)
+          OUTPUT (yield):
+            data    ->  a dictionary with the selected-column steps of the chunk
+        Example:
+          for chunk in jfile.iter_chunks(100000, select_ckeys=['flux']):
+              process(chunk['flux'])
+        """
+        if (chunk_steps <= 0):
+            raise ValueError('chunk_steps must be a positive number.')
+        if buffers is not None:
+            buffers = iter(buffers)
+        self._set_ckey(select_ckeys, max_vector_dim)   # set the ckeys to read
+        self.gotostep(start_step)   # jump to the starting step
+        if (NSTEPS == 0):
+            NSTEPS = self.MAX_NSTEPS - self.current_step
+        nread = 0
+        while (nread < NSTEPS):
+            nsteps = min(chunk_steps, NSTEPS - nread)
+            if buffers is None:
+                self._initialize_dic(nsteps)   # allocate the chunk
+            else:
+                self.data = next(buffers)   # parse into a preallocated chunk
+            step = self._parse_datalines(nsteps)
+            self.current_step += step
+            nread += step
+            if (step == 0):
+                break
+            self.NSTEPS = step
+            yield {key: value[:step] for key, value in self.data.items()}
+            if (step < nsteps):
+                break
+        log.write_log('  ( %d ) steps read in chunks of %d.' % (nread, chunk_steps))
+
+    def follow(self, select_ckeys=None, max_vector_dim=None):
+        """
+        Tail/follow mode: read a log file that is still being written.
+        The first call reads all the steps of the selected output block(s) written so far; each following call parses
+        only the lines appended after the byte offset where the previous call stopped, so that its cost is proportional
+        to the new data. A partially written final line is left for the next call. The data arrays grow with amortized
+        (geometric) reallocation, and self.data contains all the steps read so far (the number of steps is not rounded
+        to an even number).
+        Following stops when the line containing endrun_keyword is found (self.follow_complete becomes True). Other
+        lines that are not data lines (e.g. LAMMPS warnings) are skipped.
+        Only the last output block is followed: runs started later are not read.
+          INPUT:
+            select_ckeys   -> an array with the column keys you want to read (only used by the first call)
+            max_vector_dim -> when reading vectors read only this number of components (only used by the first call)
+          OUTPUT:
+            nnew    ->  the number of new steps read
+        Example:
+          jfile = LAMMPSLogFile('log.lammps', runs=-1)
+          while not jfile.follow_complete:
+              jfile.follow(select_ckeys=['flux'])
+              process(jfile.data['flux'])
+              sleep(300)
+        """
+        if isinstance(self.file, CompressedFile):
+            raise ValueError('The follow mode is not available for compressed files.')
+        nnew = 0
+        if self._follow is None:   # first call: read the previous output blocks, then follow the last one
+            self._set_ckey(select_ckeys, max_vector_dim)
+            last = self.segments[-1]
+            self._initialize_dic(max(self.MAX_NSTEPS, 1))
+            self.gotostep(0)
+            nnew = self._parse_datalines(self.MAX_NSTEPS - last['nsteps'])
+            last['index'].seek(self.file, last['skip'])
+            # the last output block is closed if it is not followed by EOF (e.g. a new run begins after it)
+            closed = last['complete'] or (last['index'].end < os.path.getsize(self.filename))
+            self._follow = dict(pos=self.file.tell(), end=(last['index'].end if closed else None), nsteps=nnew,
+                                buffers=self.data)
+            self.follow_complete = False
+        state = self._follow
+        complete = self.follow_complete
+        while not self.follow_complete:
+            self.file.seek(state['pos'])
+            size = CHUNK_BYTES if (state['end'] is None) else min(CHUNK_BYTES, state['end'] - state['pos'])
+            block = self.file.read(size)
+            nbytes = block.rfind(b'\n') + 1   # only complete lines are parsed
+            if (nbytes > 0):
+                chunks, consumed, self.follow_complete = self._parse_new_lines(block[:nbytes])
+                for values in chunks:
+                    self._append_steps(values)
+                    nnew += values.shape[0]
+                state['pos'] += consumed
+            if (state['end'] is not None) and (state['pos'] >= state['end']):
+                self.follow_complete = True
+            if (len(block) < size) or (nbytes == 0):   # EOF
+                break
+        if self.follow_complete and not complete:
+            log.write_log('  end of the output block reached.')
+        self.NSTEPS = self.current_step = state['nsteps']
+        self.data = {key: buffer[:self.NSTEPS] for key, buffer in state['buffers'].items()}
+        log.write_log('  ( %d ) new steps read, %d in total.' % (nnew, self.NSTEPS))
+        return nnew
+
+    def _parse_new_lines(self, block):
+        """
+        Parse a block of complete lines found by follow, skipping the lines that are not data lines.
+        Return a list of arrays of values, the number of bytes consumed, and True if the line containing endrun_keyword
+        was found (the block is consumed up to that line).
+        """
+        chunks, consumed = [], 0
+        endrun_keyword = self.endrun_keyword.encode()
+        while block:
+            try:
+                chunks.append(parse_block(block, block.count(b'\n'), self.NALLCKEYS, self._usecols))
+                return chunks, consumed + len(block), False
+            except ValueError:
+                lines = block.splitlines(True)
+                values, nvalid = parse_lines(lines, self.NALLCKEYS)
+                chunks.append(values[:, self._usecols])
+                if (nvalid == len(lines)):
+                    break
+                nbytes = sum(len(line) for line in lines[:nvalid])
+                if endrun_keyword in lines[nvalid]:
+                    return chunks, consumed + nbytes, True
+                log.write_log('Warning:  skipping line: ' + lines[nvalid].decode(errors='replace').rstrip())
+                nbytes += len(lines[nvalid])
+                consumed += nbytes
+                block = block[nbytes:]
+        return chunks, consumed + len(block), False
+
+    def _append_steps(self, values):
+        """Append the steps read by follow to its data buffers, enlarging them (at least doubling) when full."""
+        state = self._follow
+        nsteps, nnew = state['nsteps'], values.shape[0]
+        for key, cols in self._ckey_cols.items():
+            buffer = state['buffers'][key]
+            if (nsteps + nnew > buffer.shape[0]):
+                new_buffer = np.zeros((max(2 * buffer.shape[0], nsteps + nnew), buffer.shape[1]), dtype=buffer.dtype)
+                new_buffer[:nsteps] = buffer[:nsteps]
+                state['buffers'][key] = buffer = new_buffer
+            buffer[nsteps:nsteps + nnew] = values[:, cols]
+        state['nsteps'] += nnew
+
     def read_datalines(self, NSTEPS=0, start_step=-1, select_ckeys=None, max_vector_dim=None, even_NSTEPS=True):
         """
         Read NSTEPS steps of file, starting from start_step, and store only the selected ckeys.
@@ -295,6 +612,12 @@ class LAMMPSLogFile(object):
         OUTPUT:
           data    ->  a dictionary with the selected-column steps
         """
+        if self.cache is not None:
+            return self.cache.read_datalines(self, NSTEPS, start_step, select_ckeys, max_vector_dim, even_NSTEPS)
+        return self._read_datalines(NSTEPS, start_step, select_ckeys, max_vector_dim, even_NSTEPS)
+
+    def _read_datalines(self, NSTEPS=0, start_step=-1, select_ckeys=None, max_vector_dim=None, even_NSTEPS=True):
+        """Read NSTEPS steps of file (see read_datalines), parsing the text."""
         if self._GUI:
             progbar = FloatProgress(min=0, max=100)
             display(progbar)
@@ -306,42 +629,20 @@ class LAMMPSLogFile(object):
         self.gotostep(start_step)   # jump to the starting step
 
         # read NSTEPS of the file
-        progbar_step = max(100000, int(0.005 * NSTEPS))
-        for step in range(NSTEPS):
-            line = self.file.readline()
-            if (len(line) == 0):   # EOF
-                log.write_log('Warning:  reached EOF.')
-                break
-            if self.endrun_keyword in line:   # end-of-run keyword
-                log.write_log('  endrun_keyword found.')
-                step -= 1
-                break
-            values = np.array(line.split())
-            if (values.size != self.NALLCKEYS):
-                log.write_log('Warning:  line with wrong number of columns found. Stopping here...')
-                log.write_log(line)
-                break
-            for key, idx in self.ckey.items():   # save the selected columns
-                self.data[key][step, :] = np.array(list(map(float, values[idx])))
-            if ((step + 1) % progbar_step == 0):
-                if self._GUI:
-                    progbar.value = float(step + 1) / NSTEPS * 100.
-                    progbar.description = '{:6.2f}%'.format(progbar.value)
-                else:
-                    log.write_log('    step = {:9d} - {:6.2f}% completed'.format(step + 1,
-                                                                                 float(step + 1) / NSTEPS * 100.))
+        step = self._parse_datalines(NSTEPS, progbar if self._GUI else None)
+        self.current_step += step
 
         if self._GUI:
             progbar.close()
         # check number of steps read, keep an even number of steps
-        if (step + 1 < NSTEPS):
+        if (step < NSTEPS):
             if (step == 0):
                 log.write_log('WARNING:  no step read.')
                 return
             else:
                 if (NSTEPS != self.MAX_NSTEPS):   # if NSTEPS was specified
                     log.write_log('Warning:  less steps read.')
-                NSTEPS = step + 1   # the correct number of read steps
+                NSTEPS = step   # the correct number of read steps
         # even the number of steps
         if even_NSTEPS:
             if (NSTEPS % 2 == 1):
@@ -355,6 +656,118 @@ class LAMMPSLogFile(object):
         return self.data
 
 
+def scan_runs(filename, endrun_keyword='Loop time', f=None):
+    """
+    Scan a LAMMPS log file and find the output blocks of all its runs: a block begins after a column headers line
+    (starting with 'Step') and ends before the line containing endrun_keyword, or before the next column headers line.
+    The file is read in large blocks of lines, that are searched for these lines; then each output block is indexed.
+      INPUT:
+        filename        -> the file name
+        endrun_keyword  -> the string that ends the run output (default: 'Loop time')
+        f               -> an open binary file object of filename to be used (default: None -> open the file)
+      OUTPUT:
+        runs  ->  a list of dictionaries, one for each run, with the keys:
+                    command      the last 'run' command preceding the block (None if not found)
+                    columns      the list of column headers
+                    start_byte   byte position of the first data line
+                    end_byte     byte position of the end of the block
+                    nlines       the number of lines of the block
+                    first_step   the first and last value of the Step column
+                    last_step      (None if they cannot be read)
+                    complete     True if the block is terminated by endrun_keyword
+                    index        a LineIndex of the block
+    """
+    if f is None:
+        with open_file(filename) as f:
+            return scan_runs(filename, endrun_keyword, f)
+
+    def get_step(line):
+        try:
+            return int(float(line.split()[0]))
+        except (ValueError, IndexError):
+            return None
+
+    def find_all(block, pattern, check):
+        """Return the positions of the beginning of the lines of block that contain pattern and satisfy check."""
+        positions = []
+        p = block.find(pattern)
+        while (p >= 0):
+            bol = block.rfind(b'\n', 0, p) + 1   # beginning of the line
+            if check(block, bol, p) and ((not positions) or (positions[-1] < bol)):
+                positions.append(bol)
+            p = block.find(pattern, p + len(pattern))
+        return positions
+
+    def is_header(block, bol, p):   # 'Step' is the first word of the line
+        return (len(block[bol:p].strip()) == 0) and block[p + 4:p + 5].isspace()
+
+    def is_command(block, bol, p):   # 'run' is the first word of the line
+        return (bol == p)
+
+    endrun_keyword = endrun_keyword.encode()
+    runs = []
+    run = None   # the run being scanned
+    command = None   # the last run command found
+    last_line = b''   # the last line of the previous block
+    carry = b''   # the last incomplete line of the previous block
+    pos = 0
+    for a, block in iter_blocks(f, 0):
+        block = carry + block
+        base = a - len(carry)
+        end = block.rfind(b'\n') + 1   # keep only complete lines
+        carry, block = block[end:], block[:end]
+        if (len(block) == 0):
+            continue
+        if (run is not None) and (run['first_step'] is None) and (run['start_byte'] == base):
+            run['first_step'] = get_step(block[:block.find(b'\n')])
+        events = [(p, 'header') for p in find_all(block, b'Step', is_header)] + \
+                 [(p, 'endrun') for p in find_all(block, endrun_keyword, lambda *args: True)] + \
+                 [(p, 'command') for p in find_all(block, b'run ', is_command)]
+        for p, event in sorted(events):
+            if (event == 'command') and (run is None):
+                command = block[p:block.find(b'\n', p)].decode().strip()
+            elif (event == 'header') or ((event == 'endrun') and (run is not None)):
+                if run is not None:   # close the current run
+                    previous = block[block.rfind(b'\n', 0, max(p - 1, 0)) + 1:p] if (p > 0) else last_line
+                    run.update(end_byte=base + p, last_step=get_step(previous), complete=(event == 'endrun'))
+                    runs.append(run)
+                    run, command = None, None
+                if (event == 'header'):   # open a new run
+                    eol = block.find(b'\n', p) + 1
+                    next_eol = block.find(b'\n', eol) + 1
+                    run = dict(command=command, columns=block[p:eol].decode().split(), start_byte=base + eol,
+                               first_step=get_step(block[eol:next_eol]) if (next_eol > 0) else None)
+        last_line = block[block.rfind(b'\n', 0, len(block) - 1) + 1:]
+        pos = base + len(block)
+    if run is not None:   # the last run is not terminated
+        if (len(carry) > 0):
+            last_line = carry
+            if (run['first_step'] is None) and (run['start_byte'] == pos):
+                run['first_step'] = get_step(carry)
+        run.update(end_byte=pos + len(carry), last_step=get_step(last_line), complete=False)
+        runs.append(run)
+
+    # index the output blocks
+    for run in runs:
+        run['index'] = LineIndex(filename, start=run['start_byte'], end=run['end_byte'], f=f)
+        run['nlines'] = run['index'].nlines
+        if (run['nlines'] == 0):
+            run['first_step'], run['last_step'] = None, None
+    keys = ['command', 'columns', 'start_byte', 'end_byte', 'nlines', 'first_step', 'last_step', 'complete', 'index']
+    return [{key: run[key] for key in keys} for run in runs]
+
+
+def list_runs(filename, endrun_keyword='Loop time'):
+    """Print a table of the runs of a LAMMPS log file (see scan_runs) and return their list."""
+    runs = scan_runs(filename, endrun_keyword)
+    log.write_log('  {:>4s}  {:>10s}  {:>12s}  {:>12s}  {}'.format('run', 'nlines', 'first step', 'last step',
+                                                                   'command'))
+    for i, run in enumerate(runs):
+        log.write_log('  {:4d}  {:10d}  {:>12}  {:>12}  {}'.format(i, run['nlines'], str(run['first_step']),
+                                                                   str(run['last_step']), run['command']))
+    return runs
+
+
 def save_hc_npz(lammpslogfile, select_ckeys, lammps_structurefilename, outfilename):
     """
      Takes a LAMMPSLogFile object, a LAMMPS structure data file (optional), takes
@@ -409,29 +822,99 @@ def save_hc_npz(lammpslogfile, select_ckeys, lammps_structurefilename, outfilena
     return
 
 
+def save_hc_store(lammpslogfile, select_ckeys, lammps_structurefilename, path, chunk_steps=DEFAULT_CHUNK_STEPS):
+    """
+     Takes a LAMMPSLogFile object, a LAMMPS structure data file (optional), reads
+     the desired columns (plus Step, Time, Temp) in chunks of chunk_steps steps and
+     appends them to a ChunkedStore (see chunked_store.py), so that the whole time
+     series is never kept in memory. If the store exists, it must contain the first
+     steps of the same log file: only the following steps are read and appended
+     (e.g. to update the store of a running simulation), hence running this function
+     again does not duplicate any step. DT, DT_TIMEUNITS, box and Volume are saved
+     as attributes; Temp_ave and Temp_std are computed by the store.
+
+     # example to save data into a chunked store:
+     save_hc_store(lammpslogfile_object, ['flux'], 'lammps.data', 'flux.store')
+    """
+    from thermocepstrum.i_o.read_lammps_datafile import get_box
+
+    if not isinstance(lammpslogfile, LAMMPSLogFile):
+        raise ValueError('lammpslogfile is not a LAMMPSLogFile object.')
+    if 'Temp' not in lammpslogfile.all_ckeys:
+        raise RuntimeError('Temp not found.')
+    for key in select_ckeys:
+        if key not in lammpslogfile.all_ckeys:
+            raise ValueError('ckey not found.')
+    keys = list(select_ckeys)
+    for key in ['Step', 'Time', 'Temp']:
+        if (key not in keys) and (key in lammpslogfile.all_ckeys):
+            keys.append(key)
+
+    store = ChunkedStore(path, mode='a', chunk_steps=chunk_steps)
+    if (store.NSTEPS > lammpslogfile.MAX_NSTEPS):
+        raise ValueError('The store {} has {:d} steps, more than the log file ({:d}).'.format(
+            path, store.NSTEPS, lammpslogfile.MAX_NSTEPS))
+    if (store.NSTEPS > 0):
+        log.write_log('  store: resuming from step {:d}'.format(store.NSTEPS))
+    attrs = {}
+    if lammps_structurefilename is not None:
+        attrs['box'], attrs['Volume'] = get_box(lammps_structurefilename)
+    for data in lammpslogfile.iter_chunks(store.chunk_steps, select_ckeys=keys, start_step=store.NSTEPS):
+        if ('DT' not in store.attrs) and ('DT' not in attrs) and ('Step' in data) and (data['Step'].shape[0] > 1):
+            attrs['DT'] = data['Step'][1, 0] - data['Step'][0, 0]
+            if 'Time' in data:
+                attrs['DT_TIMEUNITS'] = data['Time'][1, 0] - data['Time'][0, 0]
+        store.append(data)
+    store.set_attrs(**attrs)
+    log.write_log('These keys were saved in store \"{:}\" :'.format(path))
+    log.write_log(' ', list(store.columns.keys()) + list(store.attrs.keys()))
+    log.write_log('  ( %d ) steps in the store.' % (store.NSTEPS))
+    return store
+
+
 ################################################################################
 def main():
     """
-    This script extracts the desired columns from a LAMMPS Log file and saves them into a Numpyz file for later use.
+    This script extracts the desired columns from a LAMMPS Log file and saves them into a Numpyz file for later use or,
+    with --store, into a chunked store (a directory, see chunked_store.py) that is read in chunks.
 
     Example:
     start reading when "PRODUCTION RUN" is found, read "flux1" and "Press" columns from log.lammps
     log file and structure.data data file (containing structure):
        python read_lammps_log.py  log.lammps structure.data out.npz -k flux1 Press -d "PRODUCTION RUN"
+       python read_lammps_log.py  log.lammps structure.data out.store -k flux1 Press -d "PRODUCTION RUN" --store
+    list the runs of log.lammps, then read runs 2 and 3 as a single time series:
+       python read_lammps_log.py  log.lammps --list-runs
+       python read_lammps_log.py  log.lammps structure.data out.npz -k flux1 Press -r 2 3
     """
 
     import argparse
 
     parser = argparse.ArgumentParser()
     parser.add_argument('lammps_logfile', help='lammps log file to read')
-    parser.add_argument('lammps_structurefile', help='lammps structure data file to read')
-    parser.add_argument('output_file', help='numpy file that will be saved')
+    parser.add_argument('lammps_structurefile', nargs='?', help='lammps structure data file to read')
+    parser.add_argument('output_file', nargs='?', help='numpy file (or chunked store directory) that will be saved')
     parser.add_argument('-k', '--ckeys', nargs='+', dest='ckeys', help='list of column keys to read')
     parser.add_argument('-d', '--runkey', help='RUN keyword')
-    parser.add_argument('-e', '--endrunkey', help='ENDRUN keyword (default: "Loop time")')
+    parser.add_argument('-e', '--endrunkey', default='Loop time', help='ENDRUN keyword (default: "Loop time")')
+    parser.add_argument('-r', '--runs', nargs='+', type=int, help='indexes of the runs to read (instead of RUN key)')
+    parser.add_argument('-l', '--list-runs', action='store_true', help='list the runs of the log file and exit')
+    parser.add_argument('-s', '--store', action='store_true',
+                        help='save a chunked store (a directory) instead of a numpy file; an existing store is updated')
+    parser.add_argument('-c', '--chunk-steps', type=int, default=DEFAULT_CHUNK_STEPS,
+                        help='number of steps of each chunk of the store (default: {})'.format(DEFAULT_CHUNK_STEPS))
     args = parser.parse_args()
 
-    logfile = LAMMPSLogFile(args.lammps_logfile, run_keyword=args.runkey)
+    if args.list_runs:
+        list_runs(args.lammps_logfile, args.endrunkey)
+        return 0
+    if (args.lammps_structurefile is None) or (args.output_file is None):
+        parser.error('lammps_structurefile and output_file are required')
+
+    logfile = LAMMPSLogFile(args.lammps_logfile, run_keyword=args.runkey, endrun_keyword=args.endrunkey, runs=args.runs)
+    if args.store:
+        save_hc_store(logfile, args.ckeys, args.lammps_structurefile, args.output_file, args.chunk_steps)
+        return 0
     select_ckeys = args.ckeys[:]
     if 'Step' not in args.ckeys:
         select_ckeys += ['Step']
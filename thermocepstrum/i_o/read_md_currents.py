@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+###
+###   ReadMDCurrents
+###
+################################################################################
+###
+###  Readers of the heat-current outputs of other MD codes:
+###    - GPUMDFile:   GPUMD 'compute.out' (compute keyword) and 'hac.out'
+###                   (compute_hac keyword) files
+###    - DLPOLYFile:  DL_POLY heat-flux files
+###    - QEHeatFile:  Quantum ESPRESSO all_currents (QEHeat) output files
+###
+###  These files have no header line: the column names are built from the
+###  layout of each format, and can be changed with the 'columns' keyword
+###  (e.g. for a different version of the code). Comment lines ('#') at the
+###  beginning of the file are skipped.
+###  The readers are TableFile objects: the data lines are converted in bulk
+###  (see bulkparse.py) and the same interface is available, i.e.
+###  read_datalines, iter_chunks, the line index, the binary cache, nprocs, dtype.
+###  The heat current is read in the 'flux' key, the temperature (if present)
+###  in the 'Temp' key, so that the data can be used by analysis.py with the
+###  units of the code (-u gpumd, dlpoly, qepw).
+###
+################################################################################
+###  Column layouts:
+###
+###  GPUMD compute.out, 'compute' keyword with quantities in {T, U, F, W, jp, jk}
+###  and ngroups groups: the quantities are written in this order,
+###     T, U  ->  ngroups columns (one per group)           keys 'Temp', 'U'
+###     F, W  ->  3 * ngroups columns (x of all the groups,
+###               then y, then z)                            keys 'F', 'W'
+###     jp, jk -> 3 columns (potential, kinetic heat current) keys 'jp', 'jk'
+###  the total heat current 'flux' = jp + jk is computed while reading.
+###
+###  GPUMD hac.out: correlation time, HAC (in-x, out-x, in-y, out-y, z),
+###  running thermal conductivity (same components)   keys 't', 'hac', 'rtc'
+###
+###  DL_POLY heat flux file: step, time, volume, heat flux (x, y, z)
+###                                               keys 'Step', 'Time', 'Volume', 'flux'
+###
+###  QEHeat (all_currents.x) output: step, time, energy current (x, y, z)
+###                                               keys 'Step', 'Time', 'flux'
+###
+################################################################################
+###   example:
+###      jfile = GPUMDFile('compute.out', quantities=['T', 'jp', 'jk'])
+###      jfile.read_datalines(start_step=0, select_ckeys=['Temp', 'flux'])
+###      print(jfile.data)
+###
+###      jfile = QEHeatFile('current_hz')
+###      for chunk in jfile.iter_chunks(100000, select_ckeys=['flux']):
+###          process(chunk['flux'])
+################################################################################
+
+from .read_tablefile import TableFile
+from thermocepstrum.utils.utils import PrintMethod
+log = PrintMethod()
+
+__all__ = ('GPUMDFile', 'DLPOLYFile', 'QEHeatFile')
+
+GPUMD_QUANTITIES = ('T', 'U', 'F', 'W', 'jp', 'jk')   # order of the quantities in compute.out
+GPUMD_HAC_COLUMNS = ['t'] + ['hac[{:d}]'.format(i) for i in range(1, 6)] + ['rtc[{:d}]'.format(i) for i in range(1, 6)]
+DLPOLY_COLUMNS = ['Step', 'Time', 'Volume', 'flux[1]', 'flux[2]', 'flux[3]']
+QEHEAT_COLUMNS = ['Step', 'Time', 'flux[1]', 'flux[2]', 'flux[3]']
+
+
+def _vector(key, n):
+    return ['{}[{:d}]'.format(key, i) for i in range(1, n + 1)]
+
+
+def gpumd_columns(quantities, ngroups=1):
+    """Return the column names of a GPUMD compute.out file, given the computed quantities and the number of groups."""
+    for q in quantities:
+        if q not in GPUMD_QUANTITIES:
+            raise ValueError('Unknown GPUMD quantity {}. Valid quantities: {}'.format(q, GPUMD_QUANTITIES))
+    columns = []
+    for q in GPUMD_QUANTITIES:   # the order of the file does not depend on the order of the compute keyword
+        if q not in quantities:
+            continue
+        if (q == 'T'):
+            columns += _vector('Temp', ngroups) if (ngroups > 1) else ['Temp']
+        elif (q == 'U'):
+            columns += _vector('U', ngroups) if (ngroups > 1) else ['U']
+        elif q in ('F', 'W'):
+            columns += _vector(q, 3 * ngroups)
+        else:
+            columns += _vector(q, 3)
+    return columns
+
+
+class GPUMDFile(TableFile):
+    """
+    A reader of the GPUMD outputs compute.out (output='compute') and hac.out (output='hac').
+    See the TableFile class for the methods and the optional keyword arguments.
+
+    INPUT parameters:
+     - filename     the file name
+     - quantities   the quantities of the compute keyword (compute.out only) (default: ['T', 'jp', 'jk'])
+     - ngroups      the number of groups of the compute keyword (compute.out only) (default: 1)
+     - output       'compute' (default) or 'hac'
+
+    The heat current of compute.out can be read with the key 'flux' (= jp + jk).
+    """
+
+    DERIVED_CKEYS = {'flux': ('jp', 'jk')}   # the total heat current is the sum of the potential and kinetic parts
+
+    def __init__(self, filename, quantities=('T', 'jp', 'jk'), ngroups=1, output='compute', **kwargs):
+        if (output == 'compute'):
+            kwargs.setdefault('columns', gpumd_columns(quantities, ngroups))
+        elif (output == 'hac'):
+            kwargs.setdefault('columns', GPUMD_HAC_COLUMNS)
+        else:
+            raise ValueError('output must be "compute" or "hac".')
+        self._derived = []   # the derived ckeys selected
+        self._requested_ckeys = None
+        super().__init__(filename, **kwargs)
+
+    def _expand_ckeys(self, select_ckeys):
+        """Replace the derived ckeys with the ckeys they are computed from. Return the ckeys to read."""
+        if select_ckeys is None:
+            if self._requested_ckeys is None:
+                return None
+            select_ckeys = self._requested_ckeys   # continue with the ckeys requested before
+        self._requested_ckeys = list(select_ckeys)
+        self._derived = []
+        ckeys = []
+        for key in select_ckeys:
+            if (key in self.DERIVED_CKEYS) and (key not in self.all_ckeys):
+                self._derived.append(key)
+                ckeys.extend(k for k in self.DERIVED_CKEYS[key] if k not in ckeys)
+            elif key not in ckeys:
+                ckeys.append(key)
+        return ckeys
+
+    def _add_derived(self, data):
+        """Compute the derived ckeys of a data dictionary and remove the ckeys that were not requested."""
+        if not self._derived:
+            return data
+        for key in self._derived:
+            parts = self.DERIVED_CKEYS[key]
+            data[key] = data[parts[0]] + sum(data[k] for k in parts[1:])
+        for key in list(data.keys()):
+            if key not in self._requested_ckeys:
+                del data[key]
+        return data
+
+    def read_datalines(self, NSTEPS=0, start_step=-1, select_ckeys=None, max_vector_dim=None, even_NSTEPS=True):
+        """Read NSTEPS steps of file (see TableFile.read_datalines). The derived ckeys (e.g. 'flux') can be selected."""
+        ckeys = self._expand_ckeys(select_ckeys)
+        data = super().read_datalines(NSTEPS, start_step, ckeys, max_vector_dim, even_NSTEPS)
+        if data is None:
+            return
+        self.data = self._add_derived(data)
+        return self.data
+
+    def iter_chunks(self, chunk_steps, select_ckeys=None, start_step=-1, NSTEPS=0, max_vector_dim=None, buffers=None):
+        """Read the file in chunks (see TableFile.iter_chunks). The derived ckeys (e.g. 'flux') can be selected."""
+        ckeys = self._expand_ckeys(select_ckeys)
+        for data in super().iter_chunks(chunk_steps, ckeys, start_step, NSTEPS, max_vector_dim, buffers):
+            yield self._add_derived(data)
+
+
+class DLPOLYFile(TableFile):
+    """
+    A reader of DL_POLY heat-flux files (step, time, volume, heat flux x y z).
+    See the TableFile class for the methods and the optional keyword arguments (e.g. columns, to change the layout).
+    """
+
+    def __init__(self, filename, **kwargs):
+        kwargs.setdefault('columns', DLPOLY_COLUMNS)
+        super().__init__(filename, **kwargs)
+
+
+class QEHeatFile(TableFile):
+    """
+    A reader of the energy-current output of Quantum ESPRESSO all_currents.x (QEHeat) (step, time, current x y z).
+    See the TableFile class for the methods and the optional keyword arguments (e.g. columns, to change the layout).
+    """
+
+    def __init__(self, filename, **kwargs):
+        kwargs.setdefault('columns', QEHEAT_COLUMNS)
+        super().__init__(filename, **kwargs)
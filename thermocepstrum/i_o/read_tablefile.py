@@ -15,6 +15,18 @@
 ###  Lines are read SEQUENTIALLY with the method read_datalines.
 ###  If a start_step is not specified the file is read from the current position.
 ###  This allows one to read the file in blocks.
+###  The method iter_chunks yields the data in chunks of fixed size, so that
+###  files larger than the available memory can be processed.
+###  The chunks can be prefetched by a background thread while the current one
+###  is processed (see prefetch.py).
+###  Data lines are read and converted in bulk (see bulkparse.py).
+###  A sparse line-offset index (see line_index.py) allows one to jump to any
+###  start_step without reading the preceding lines.
+###  Large files can be parsed by many processes in parallel (nprocs > 1).
+###  Compressed files (gzip, bzip2, xz) are decompressed while they are read
+###  (see compressed.py).
+###  The parsed columns can be stored in a persistent binary cache (cache=True,
+###  see column_cache.py), so that later runs do not parse the text again.
 ###
 ################################################################################
 ###  The input file should look like this:
@@ -35,8 +47,13 @@
 ###      print(current.data)
 ################################################################################
 
+import os
 import numpy as np
 from time import time
+from .bulkparse import CHUNK_STEPS, read_lines, parse_block, parse_lines, column_plan, parse_file_parallel
+from .column_cache import ColumnCache, DEFAULT_MAX_SIZE
+from .line_index import LineIndex
+from .compressed import open_file, CompressedFile
 from thermocepstrum.utils.utils import PrintMethod
 log = PrintMethod()
 
@@ -89,6 +106,20 @@ class TableFile(object):
       e.g.    c_flux[0] c_flux[1] c_flux[2]  -->  placed in 'flux0' key
     Comments lines are ignored.
 
+    Optional keyword arguments:
+      group_vectors  -> group the components of LAMMPS-style vectors (default: True)
+      cache          -> store the parsed columns in a persistent binary cache:
+                        True (cache directory next to the file) or a cache directory path (default: None)
+      cache_max_size -> maximum size of the cache directory [bytes] (default: 10 GiB)
+      nprocs         -> number of processes used to parse the data lines (default: 1)
+      dtype          -> floating point type of the data arrays, e.g. np.float32 to halve the memory
+                        (default: np.float64)
+      index_file     -> save the line-offset index into a sidecar file, and load it from there in later runs:
+                        True ('<filename>.lineindex.npz') or a file path (default: None -> the index is not saved)
+      columns        -> the list of column names (LAMMPS-style vectors allowed, e.g. 'flux[1]') of a file with no
+                        header line: the comment ('#') and blank lines at the beginning of the file are skipped
+                        (default: None -> the names are read from the header line)
+
     #############################################################################
     The input file should look like this:
 
@@ -115,6 +146,9 @@ class TableFile(object):
         group_vectors = kwargs.get('group_vectors', True)
         self._GUI = kwargs.get('GUI', False)
         self._print_elapsed = kwargs.get('print_elapsed', True)
+        self._nprocs = kwargs.get('nprocs', 1)
+        self.dtype = np.dtype(kwargs.get('dtype', np.float64))
+        self._columns = kwargs.get('columns', None)
         if self._GUI:
             from ipywidgets import FloatProgress
             from IPython.display import display
@@ -123,8 +157,25 @@ class TableFile(object):
         self._open_file()
         self._read_ckeys(group_vectors)
         self.ckey = None
-        self.MAX_NSTEPS = data_length(self.filename)
+        self.current_step = 0
+        self.index = LineIndex(self.filename, start=self._start_byte, index_file=kwargs.get('index_file', None),
+                               f=self.file)
+        self.file.seek(self._start_byte)
+        self.MAX_NSTEPS = self.index.nlines
+        if (self._nprocs > 1) and isinstance(self.file, CompressedFile):
+            log.write_log('Warning:  compressed files are parsed by a single process.')
+            self._nprocs = 1
         log.write_log('Data length = ', self.MAX_NSTEPS)
+
+        cache = kwargs.get('cache', None)
+        if cache:
+            settings = dict(reader=type(self).__name__, group_vectors=group_vectors, dtype=self.dtype.name)
+            if self._columns is not None:
+                settings['columns'] = list(self._columns)
+            self.cache = ColumnCache(self.filename, settings=settings, cache_dir=(None if cache is True else cache),
+                                     max_size=kwargs.get('cache_max_size', DEFAULT_MAX_SIZE))
+        else:
+            self.cache = None
         return
 
     def __repr__(self):
@@ -140,7 +191,7 @@ class TableFile(object):
     def _open_file(self):
         """Open the file."""
         try:
-            self.file = open(self.filename, 'r')
+            self.file = open_file(self.filename)
         except:
             raise ValueError('File does not exist.')
         return
@@ -149,40 +200,65 @@ class TableFile(object):
         """Read the column keys. If group_vectors=True the vector ckeys are grouped togheter"""
         self.all_ckeys = {}
         self.header = ''
+        if self._columns is not None:
+            self._skip_comments()
+            self._set_all_ckeys(self._columns, group_vectors)
+            return
         while True:
-            line = self.file.readline()
+            line = self.file.readline().decode()
             if len(line) == 0:   # EOF
                 raise RuntimeError('Reached EOF, no ckeys found.')
             values = np.array(line.split())
             # text line: read variables names and save indexes in ckey
             if (is_string(values[0]) and (values[0].find('#') < 0)):
                 self.header += line[:-1]
-                for i in range(len(values)):
-                    if group_vectors:
-                        bracket = is_vector_variable(values[i])   # position of left square bracket
-                    else:
-                        bracket = 0
-                    if (bracket == 0):   # the variable is a scalar
-                        key = values[i]
-                        if (key[:2] == 'c_'):   # remove 'c_' if present
-                            key = key[2:]
-                        self.all_ckeys[key] = [i]
-                    else:   # the variable is a vector
-                        key = values[i][:bracket]   # name of vector
-                        if (key[:2] == 'c_'):   # remove 'c_' if present
-                            key = key[2:]
-                        vecidx = int(values[i][bracket + 1:-1])   # current index
-                        if key in self.all_ckeys:   # if this vector is already defined, add this component
-                            if (vecidx > self.all_ckeys[key].size):
-                                self.all_ckeys[key] = np.resize(self.all_ckeys[key], vecidx)
-                            self.all_ckeys[key][vecidx - 1] = i
-                        else:   # if it is not, define a vector
-                            self.all_ckeys[key] = np.array([0] * vecidx)
-                            self.all_ckeys[key][-1] = i
                 self._start_byte = self.file.tell()
-                break
+                self._set_all_ckeys(values, group_vectors)
+                return
             else:
                 self.header += line
+
+    def _skip_comments(self):
+        """Skip the comment ('#') and blank lines preceding the data of a file with no header line (columns given)."""
+        while True:
+            pos = self.file.tell()
+            line = self.file.readline().decode()
+            if len(line) == 0:   # EOF
+                raise RuntimeError('Reached EOF, no data found.')
+            if (len(line.split()) > 0) and not line.lstrip().startswith('#'):
+                break
+            self.header += line
+        if (len(line.split()) != len(self._columns)):
+            raise ValueError('{:d} columns given, but the data lines contain {:d} values.'.format(
+                len(self._columns), len(line.split())))
+        self.header += ' '.join(self._columns)
+        self._start_byte = pos
+
+    def _set_all_ckeys(self, values, group_vectors=True):
+        """Set the column keys from a list of column names."""
+        self.NALLCKEYS = len(values)   # number of columns of each data line
+        for i in range(len(values)):
+            if group_vectors:
+                bracket = is_vector_variable(values[i])   # position of left square bracket
+            else:
+                bracket = 0
+            if (bracket == 0):   # the variable is a scalar
+                key = values[i]
+                if (key[:2] == 'c_'):   # remove 'c_' if present
+                    key = key[2:]
+                self.all_ckeys[key] = [i]
+            else:   # the variable is a vector
+                key = values[i][:bracket]   # name of vector
+                if (key[:2] == 'c_'):   # remove 'c_' if present
+                    key = key[2:]
+                vecidx = int(values[i][bracket + 1:-1])   # current index
+                if key in self.all_ckeys:   # if this vector is already defined, add this component
+                    if (vecidx > self.all_ckeys[key].size):
+                        self.all_ckeys[key] = np.resize(self.all_ckeys[key], vecidx)
+                    self.all_ckeys[key][vecidx - 1] = i
+                else:   # if it is not, define a vector
+                    self.all_ckeys[key] = np.array([0] * vecidx)
+                    self.all_ckeys[key][-1] = i
         log.write_log(self.header)
         log.write_log(' #####################################')
         log.write_log('  all_ckeys = ', self.all_ckeys)
@@ -207,6 +283,8 @@ class TableFile(object):
             raise KeyError('No ckey set. Check selected keys.')
         else:
             log.write_log('  ckey = ', self.ckey)
+        # column plan: only the selected columns are converted when parsing
+        self._usecols, self._ckey_cols = column_plan(self.ckey)
         return
 
     def _initialize_dic(self, NSTEPS=None):
@@ -221,7 +299,7 @@ class TableFile(object):
         self.NSTEPS = 0
         self.data = {}
         for key, idx in self.ckey.items():
-            self.data[key] = np.zeros((NSTEPS, len(idx)))
+            self.data[key] = np.zeros((NSTEPS, len(idx)), dtype=self.dtype)
         return
 
     def gotostep(self, start_step):
@@ -230,11 +308,117 @@ class TableFile(object):
                        0  -->  go to start step
                        N  -->  go to N-th step"""
         if (start_step >= 0):
-            self.file.seek(self._start_byte)
-            for i in range(start_step):   # advance of start_step-1 lines
-                self.file.readline()
+            self.index.seek(self.file, start_step)   # seek the closest indexed line, then skip the remaining ones
+            self.current_step = start_step
         return
 
+    def _parse_block(self, block, nlines):
+        """
+        Convert the selected columns (see _set_ckey) of a block of nlines data lines into a (nlines, len(usecols))
+        array.
+        If a malformed line is found, only the lines preceding it are returned and the file is moved back to its
+        beginning.
+        """
+        try:
+            return parse_block(block, nlines, self.NALLCKEYS, self._usecols)
+        except ValueError:
+            lines = block.splitlines(True)
+            values, nvalid = parse_lines(lines, self.NALLCKEYS)
+            if (nvalid < len(lines)):
+                log.write_log('Warning:  line with wrong number of columns found. Stopping here...')
+                log.write_log(lines[nvalid].decode())
+            self.file.seek(sum(len(line) for line in lines[:nvalid]) - len(block), 1)
+            return values[:, self._usecols]
+
+    def _parse_datalines(self, NSTEPS, progbar=None):
+        """Read and parse NSTEPS lines, converting CHUNK_STEPS lines at once. Return the number of steps read."""
+        progbar_step = max(100000, int(0.005 * NSTEPS))
+        step = 0
+        while (step < NSTEPS):
+            nlines = min(CHUNK_STEPS, NSTEPS - step)
+            block, nread = read_lines(self.file, nlines)
+            values = self._parse_block(block, nread)
+            nvalid = values.shape[0]
+            for key, cols in self._ckey_cols.items():   # save the selected columns
+                self.data[key][step:step + nvalid, :] = values[:, cols]
+            if ((step + nvalid) // progbar_step > step // progbar_step):
+                if progbar is not None:
+                    progbar.value = float(step + nvalid) / NSTEPS * 100.
+                    progbar.description = '{:6.2f}%'.format(progbar.value)
+                else:
+                    log.write_log('    step = {:9d} - {:6.2f}% completed'.format(step + nvalid,
+                                                                                 float(step + nvalid) / NSTEPS * 100.))
+            step += nvalid
+            if (nvalid < nlines):
+                if (nvalid == nread):
+                    log.write_log('Warning:  reached EOF.')
+                break
+        return step
+
+    def _parse_datalines_parallel(self, NSTEPS):
+        """
+        Read and parse NSTEPS lines with a pool of processes (see bulkparse.parse_file_parallel).
+        The data arrays are views of a single shared-memory array. Return the number of steps read.
+        """
+        log.write_log('  parsing with {:d} processes...'.format(self._nprocs))
+        ranges = self.index.split(self.current_step, self.file.tell(), NSTEPS, self._nprocs)
+        values, step, end = parse_file_parallel(self.filename, self.file.tell(), NSTEPS, self.NALLCKEYS, self._usecols,
+                                                self._nprocs, ranges, self.dtype)
+        if (step < NSTEPS) and (end < os.path.getsize(self.filename)):
+            log.write_log('Warning:  line with wrong number of columns found. Stopping here...')
+        self.file.seek(end)
+        self.NSTEPS = 0
+        self.data = {}
+        for key, cols in self._ckey_cols.items():
+            self.data[key] = values[:, cols]
+        return step
+
+    def iter_chunks(self, chunk_steps, select_ckeys=None, start_step=-1, NSTEPS=0, max_vector_dim=None, buffers=None):
+        """
+        Read the file in chunks of chunk_steps steps, yielding a data dictionary for each chunk, so that a file of any
+        size can be processed with a bounded amount of memory. The file position is kept between chunks.
+          INPUT:
+            chunk_steps    -> number of steps of each chunk (the last chunk may be shorter)
+            select_ckeys   -> an array with the column keys you want to read (see all_ckeys for a list)
+            start_step  = -1 -> continue from current step (default)
+                           0 -> go to start step
+                           N -> go to N-th step
+            NSTEPS         -> total number of steps to read (default: 0 -> read until the end of the data)
+            max_vector_dim -> when reading vectors read only this number of components (None = read all components)
+            buffers        -> an iterable of preallocated data dictionaries (with at least chunk_steps steps), into which
+                              the chunks are parsed in turn instead of new arrays (see prefetch.py)
+          OUTPUT (yield):
+            data    ->  a dictionary with the selected-column steps of the chunk
+        Example:
+          for chunk in jfile.iter_chunks(100000, select_ckeys=['flux']):
+              process(chunk['flux'])
+        """
+        if (chunk_steps <= 0):
+            raise ValueError('chunk_steps must be a positive number.')
+        if buffers is not None:
+            buffers = iter(buffers)
+        self._set_ckey(select_ckeys, max_vector_dim)   # set the ckeys to read
+        self.gotostep(start_step)   # jump to the starting step
+        if (NSTEPS == 0):
+            NSTEPS = self.MAX_NSTEPS - self.current_step
+        nread = 0
+        while (nread < NSTEPS):
+            nsteps = min(chunk_steps, NSTEPS - nread)
+            if buffers is None:
+                self._initialize_dic(nsteps)   # allocate the chunk
+            else:
+                self.data = next(buffers)   # parse into a preallocated chunk
+            step = self._parse_datalines(nsteps)
+            self.current_step += step
+            nread += step
+            if (step == 0):
+                break
+            self.NSTEPS = step
+            yield {key: value[:step] for key, value in self.data.items()}
+            if (step < nsteps):
+                break
+        log.write_log('  ( %d ) steps read in chunks of %d.' % (nread, chunk_steps))
+
     def read_datalines(self, NSTEPS=0, start_step=-1, select_ckeys=None, max_vector_dim=None, even_NSTEPS=True):
         """Read NSTEPS steps of file, starting from start_step, and store only
       the selected ckeys.
@@ -249,6 +433,12 @@ class TableFile(object):
       OUTPUT:
         data    ->  a dictionary with the selected-column steps
       """
+        if self.cache is not None:
+            return self.cache.read_datalines(self, NSTEPS, start_step, select_ckeys, max_vector_dim, even_NSTEPS)
+        return self._read_datalines(NSTEPS, start_step, select_ckeys, max_vector_dim, even_NSTEPS)
+
+    def _read_datalines(self, NSTEPS=0, start_step=-1, select_ckeys=None, max_vector_dim=None, even_NSTEPS=True):
+        """Read NSTEPS steps of file (see read_datalines), parsing the text."""
         if self._GUI:
             progbar = FloatProgress(min=0, max=100)
             display(progbar)
@@ -256,37 +446,25 @@ class TableFile(object):
         if (NSTEPS == 0):
             NSTEPS = self.MAX_NSTEPS
         self._set_ckey(select_ckeys, max_vector_dim)   # set the ckeys to read
-        self._initialize_dic(NSTEPS)   # allocate dictionary
         self.gotostep(start_step)   # jump to the starting step
-
-        # read NSTEPS of the file
-        progbar_step = max(100000, int(0.005 * NSTEPS))
-        for step in range(NSTEPS):
-            line = self.file.readline()
-            if len(line) == 0:   # EOF
-                log.write_log('Warning:  reached EOF.')
-                break
-            values = np.array(line.split())
-            for key, idx in self.ckey.items():   # save the selected columns
-                self.data[key][step, :] = np.array(list(map(float, values[idx])))
-            if ((step + 1) % progbar_step == 0):
-                if self._GUI:
-                    progbar.value = float(step + 1) / NSTEPS * 100.
-                    progbar.description = '{:6.2f}%'.format(progbar.value)
-                else:
-                    log.write_log('    step = {:9d} - {:6.2f}% completed'.format(step + 1,
-                                                                                 float(step + 1) / NSTEPS * 100.))
+        if (self._nprocs > 1):
+            step = self._parse_datalines_parallel(NSTEPS)
+        else:
+            self._initialize_dic(NSTEPS)   # allocate dictionary
+            step = self._parse_datalines(NSTEPS, progbar if self._GUI else None)
+        self.current_step += step
 
         if self._GUI:
             progbar.close()
         # check number of steps read, keep an even number of steps
-        if (step + 1 < self.NSTEPS):
+        if (step < NSTEPS):
             if (step == 0):
                 log.write_log('WARNING:  no step read.')
                 return
             else:
-                log.write_log('Warning:  less steps read.')
-                self.NSTEPS = step + 1
+                if (NSTEPS != self.MAX_NSTEPS):   # if NSTEPS was specified
+                    log.write_log('Warning:  less steps read.')
+                NSTEPS = step   # the correct number of read steps
         if even_NSTEPS:
             if (NSTEPS % 2 == 1):
                 NSTEPS = NSTEPS - 1
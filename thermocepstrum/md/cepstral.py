@@ -2,7 +2,7 @@
 
 import numpy as np
 from scipy.special import polygamma
-from scipy.fftpack import dct
+from .tools.fftbackend import dct
 from .tools.spectrum import logtau_to_tau
 from .aic import *
 from thermocepstrum.utils.utils import PrintMethod
@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import copy
 import numpy as np
 from thermocepstrum.utils.loadAfterPlt import plt
-from .tools.spectrum import freq_THz_to_red, freq_red_to_THz
+from .tools.spectrum import freq_THz_to_red, freq_red_to_THz, rfft, sum_abs2, cospectrum
+from .tools import fftbackend
 from .tools.filter import runavefilter
-from .tools.acf import acovf, integrate_acf
+from .tools.resample import resample_spectrum
+from .tools.acf import acovf_multi, integrate_acf
 from .resample import resample_timeseries
 
 from thermocepstrum.utils.loadAfterPlt import plt
@@ -19,6 +22,26 @@ except:
 __all__ = ('MDSample',)
 
 
+class LazyAttribute(object):
+    """
+    A derived attribute computed on first access by the decorated method and stored into the instance __dict__, where
+    it shadows the descriptor: later reads are plain attribute lookups, and deleting the value from __dict__ (see
+    MDSample._discard_derived) recomputes it on the next access. Assigning the attribute overrides it.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.func(instance)
+        instance.__dict__[self.name] = value
+        return value
+
+
 class MDSample(object):
     """
     An MDSample object contains all the information that represent a
@@ -45,6 +68,10 @@ class MDSample(object):
                     For now it is assumed to be one sided, i.e. it contains
                     NFREQS = N/2+1 normalized frequencies contained
                     in the interval [0, 1/(2N*DT)]
+       - spectrALL  the one-sided spectrum of each component of the trajectory
+                    (NFREQS * N_COMPONENTS array). It is computed once and cached
+                    (see compute_spectrALL): the periodogram and the cospectrum are
+                    derived from it.
        - psd        the Power Spectral Density (periodogram), defined as
                               DT    N-1
                      I(f) =  ---- * SUM | x[n] * exp(-2.0J*pi*f/N) |^2
@@ -65,17 +92,51 @@ class MDSample(object):
         self.PSD_FILTER_W           width of the moving average filter (reduced frequency units)
         self.PSD_FILTER_W_THZ       width of the moving average filter (THz)
         self.PSD_FILTER_WF          width of the moving average filter (number of frequencies)
+        self.dtype                  floating point type of the trajectory (np.float64 or np.float32)
+        self.TRAJ_FACTOR            factor multiplied by the trajectory, applied lazily to its spectrum and acf
+
+    A single precision trajectory (dtype=np.float32) halves the memory: its spectra are computed in single precision
+    (complex64), while the periodogram and the cospectrum are accumulated in double precision.
 
+    The quantities derived from the periodogram (logpsd, psd_min, psd_power, fpsd, flogpsd, fcospectrum) and the
+    frequencies in THz (freqs_THz, Nyquist_f_THz) are computed on first access and cached: assigning any of the
+    attributes they depend on (psd, freqs, DT_FS, cospectrum, PSD_FILTER_WF, ...) discards them (see
+    _DERIVED_ATTRIBUTES). Arrays modified in place are not tracked: assign a new array instead.
     """
 
-    def __init__(self, traj=None, spectr=None, psd=None, freqs=None, DT_FS=1.0):
+    # the cached derived attributes that depend on each attribute
+    _DERIVED_ATTRIBUTES = {
+        'psd': ('logpsd', 'logpsd_min', 'psd_min', 'psd_power', 'fpsd'),
+        'logpsd': ('flogpsd',),
+        'fpsd': ('flogpsd',),
+        'freqs': ('freqs_THz',),
+        'DT_FS': ('freqs_THz',),
+        'freqs_THz': ('Nyquist_f_THz',),
+        'PSD_FILTER_WF': ('fpsd', 'flogpsd', 'fcospectrum'),
+        'LOGPSD_FILTER_TYPE': ('flogpsd',),
+        'cospectrum': ('fcospectrum',),
+        'L': ('fcospectrum',),
+    }
+
+    def __init__(self, traj=None, spectr=None, psd=None, freqs=None, DT_FS=1.0, dtype=np.float64, traj_factor=1.0):
         self.DT_FS = DT_FS
-        self.initialize_traj(traj)
+        self.dtype = np.dtype(dtype)
+        self.initialize_traj(traj, traj_factor)
         self.initialize_spectrum(spectr)
         self.initialize_psd(freqs=freqs, psd=psd, DT_FS=DT_FS)
 
         self.cospectrum = None
-        self.fcospectrum = None
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in self._DERIVED_ATTRIBUTES:
+            self._discard_derived(name)
+
+    def _discard_derived(self, name):
+        """Discard the cached attributes derived from the attribute name (recursively)."""
+        for derived in self._DERIVED_ATTRIBUTES.get(name, ()):
+            self.__dict__.pop(derived, None)
+            self._discard_derived(derived)
 
     def __repr__(self):
         msg = 'MDSample:\n' + \
@@ -104,7 +165,7 @@ class MDSample(object):
           TimeSeries, builder = self._get_builder()
           new_ts = TimeSeries(**builder)
         """
-        builder = dict(traj=self.traj, DT_FS=self.DT_FS)
+        builder = dict(traj=self.traj, DT_FS=self.DT_FS, dtype=self.dtype, traj_factor=self.TRAJ_FACTOR)
         return type(self), builder
 
     #############################################
@@ -113,18 +174,21 @@ class MDSample(object):
     ###################################
     #############################################
 
-    def initialize_traj(self, array):
+    def initialize_traj(self, array, factor=1.0):
         """
         Initialize a trajectory from an array.
         The dimensions of the array should be:
           (number of time points, number of equivalent components)
         or, in the case of 1 component:
           (number of time points)
+        The trajectory is stored with the floating point type self.dtype: an array (or np.memmap) of this type is not
+        copied, and self.traj is a view of it. The trajectory is multiplied by factor lazily, i.e. the factor is
+        applied to its spectrum and autocovariance (self.TRAJ_FACTOR).
         """
         if not isinstance(array, (list, np.ndarray, tuple)):
             raise TypeError('Input trajectory must be an array.')
         if array is not None:
-            array = np.array(array, dtype=float)
+            array = np.asarray(array, dtype=self.dtype)
             if (len(array.shape) == 1):
                 self.MANY_COMPONENTS = False
                 self.traj = array[:, np.newaxis]
@@ -145,6 +209,8 @@ class MDSample(object):
             self.traj = None
             self.N = None
             self.N_COMPONENTS = None
+        self.TRAJ_FACTOR = factor
+        self.spectrALL = None   # the cached spectrum of the trajectory
         self.acf = None
         self.NLAGS = None
 
@@ -195,8 +261,6 @@ class MDSample(object):
 
         self.psd = None
         self.freqs = None
-        self.fpsd = None
-        self.flogpsd = None
         self.PSD_FILTER_W = None
         self.PSD_FILTER_W_THZ = None
         self.PSD_FILTER_WF = None
@@ -205,8 +269,6 @@ class MDSample(object):
         if array is None:
             return
         self.psd = np.array(array, dtype=float)
-        self.logpsd = np.log(self.psd)
-        self.logpsd_min = np.min(self.psd)
 
         # frequencies
         self.NFREQS = self.psd.size
@@ -220,8 +282,6 @@ class MDSample(object):
         # freqs conversions to THz
         if DT_FS is not None:
             self.DT_FS = DT_FS
-        self.freqs_THz = freq_red_to_THz(self.freqs, self.DT_FS)
-        self.Nyquist_f_THz = self.freqs_THz[-1]
         self.DF = 0.5 / (self.NFREQS - 1)
         self.DF_THZ = freq_red_to_THz(self.DF, self.DT_FS)
 
@@ -240,34 +300,52 @@ class MDSample(object):
         if self.spectr is None:
             raise ValueError('Spectrum not defined.')
         full_spectr = np.append(self.spectr, self.spectr[-2:0:-1].conj())
-        self.traj = np.real(np.fft.ifft(full_spectr))   #*np.sqrt(self.NFREQS-1)
+        self.traj = np.real(fftbackend.ifft(full_spectr))   #*np.sqrt(self.NFREQS-1)
         self.N = self.traj.size
+        self.TRAJ_FACTOR = 1.0
+        self.spectrALL = None
 
     def compute_spectrum(self):
         """Compute spectrum from trajectory by FFT."""
         if self.traj is None:
             raise ValueError('Trajectory not defined.')
-        full_spectr = np.fft.fft(self.traj)
+        full_spectr = fftbackend.fft(self.traj) * self.TRAJ_FACTOR
         self.spectr = full_spectr[:self.N / 2 + 1]
         self.NFREQS = self.spectr.size
         self.DF = 0.5 / (self.NFREQS - 1)
 
+    def compute_spectrALL(self):
+        """
+        Compute the one-sided spectrum of each component of the trajectory (real FFT along the time axis), and cache it
+        in self.spectrALL. The transform is computed only once per trajectory: the periodogram, the cospectrum and the
+        autocovariance are derived from the cached spectrum.
+        A single precision trajectory gives a complex64 spectrum.
+        """
+        if self.spectrALL is None:
+            if self.traj is None:
+                raise ValueError('Trajectory not defined.')
+            self.spectrALL = rfft(self.traj, axis=0)
+            if (self.TRAJ_FACTOR != 1.0):
+                self.spectrALL *= self.TRAJ_FACTOR
+        return self.spectrALL
+
     def compute_psd(self, PSD_FILTER_W=None, freq_units='THz', method='trajectory', DT_FS=None, normalize=False):
         # overridden in HeatCurrent (will call, at the end, this method)
         """
         Compute the periodogram from the trajectory or the spectrum.
         If a PSD_FILTER_W (expressed in freq_units) is known or given, the psd is also filtered.
         The PSD is multiplied by DT_FS at the end.
+        The periodogram is the mean of the squared modulus of the cached spectrum of the components (see
+        compute_spectrALL), accumulated in double precision.
         """
-        from scipy.signal import periodogram
         if DT_FS is not None:
             self.DT_FS = DT_FS
         if (method == 'trajectory'):
-            if self.traj is None:
-                raise ValueError('Trajectory not defined.')
-            self.freqs, self.psdALL = periodogram(self.traj, detrend=None, axis=0)
-            self.psd = np.mean(self.psdALL, axis=1)
-            self.psd[1:-1] = self.psd[1:-1] * 0.5
+            self.compute_spectrALL()
+            self.freqs = np.fft.rfftfreq(self.N)
+            self.psd = sum_abs2(self.spectrALL, axis=1) / (self.N * self.N_COMPONENTS)
+            if (self.N % 2 == 1):   # as in scipy.signal.periodogram, the last frequency is doubled
+                self.psd[-1] *= 2.
             self.psd *= self.DT_FS
             self.NFREQS = self.freqs.size
             self.DF = 0.5 / (self.NFREQS - 1)
@@ -280,13 +358,8 @@ class MDSample(object):
         else:
             raise KeyError('method not understood')
 
-        self.freqs_THz = self.freqs / self.DT_FS * 1000.
-        self.Nyquist_f_THz = self.freqs_THz[-1]
         if normalize:
             self.psd = self.psd / np.trapz(self.psd) / self.N / self.DT_FS
-        self.logpsd = np.log(self.psd)
-        self.psd_min = np.min(self.psd)
-        self.psd_power = np.trapz(self.psd)   # one-side PSD power
 
         # (re)compute filtered psd, if a window has been defined
         if (PSD_FILTER_W is not None) or (self.PSD_FILTER_W is not None):
@@ -317,36 +390,85 @@ class MDSample(object):
         else:
             raise ValueError('Filter window width not defined.')
 
-        if (window_type == 'rectangular'):
-            self.fpsd = runavefilter(self.psd, self.PSD_FILTER_WF)
-
-            # try to filter the other currents (if present)
-            if self.cospectrum is not None:
-                self.fcospectrum = []
-                for i in range(self.cospectrum.shape[0]):
-                    self.fcospectrum.append([])
-                    for j in range(self.cospectrum.shape[1]):
-                        ffpsd = runavefilter(self.cospectrum[i, j], self.PSD_FILTER_WF)
-                        self.fcospectrum[i].append(ffpsd / self.L)
-                self.fcospectrum = np.asarray(self.fcospectrum)
-
-            # filter log-psd
-            if (logpsd_filter_type == 1):
-                self.flogpsd = runavefilter(self.logpsd, self.PSD_FILTER_WF)
-            else:
-                self.flogpsd = np.log(self.fpsd)
-        else:
+        if (window_type != 'rectangular'):
             raise KeyError('Window type unknown.')
+        # fpsd, flogpsd and fcospectrum (if the other currents are present) are computed on first access
+        self.LOGPSD_FILTER_TYPE = logpsd_filter_type
+
+    ###################################
+    ###  DERIVED ATTRIBUTES (lazy)
+    ###################################
+
+    @LazyAttribute
+    def logpsd(self):
+        """The log-periodogram."""
+        return None if (self.psd is None) else np.log(self.psd)
+
+    @LazyAttribute
+    def logpsd_min(self):
+        """The minimum of the periodogram: an alias of psd_min."""
+        return self.psd_min
+
+    @LazyAttribute
+    def psd_min(self):
+        """The minimum of the periodogram."""
+        return None if (self.psd is None) else np.min(self.psd)
+
+    @LazyAttribute
+    def psd_power(self):
+        """The one-side PSD power."""
+        return None if (self.psd is None) else np.trapz(self.psd)
+
+    @LazyAttribute
+    def freqs_THz(self):
+        """The frequencies, in THz."""
+        return None if (self.freqs is None) else self.freqs / self.DT_FS * 1000.
+
+    @LazyAttribute
+    def Nyquist_f_THz(self):
+        """The Nyquist frequency, in THz."""
+        return None if (self.freqs_THz is None) else self.freqs_THz[-1]
+
+    @LazyAttribute
+    def fpsd(self):
+        """The periodogram filtered with a moving average of PSD_FILTER_WF frequencies (see filter_psd)."""
+        if (self.psd is None) or (self.PSD_FILTER_WF is None):
+            return None
+        return runavefilter(self.psd, self.PSD_FILTER_WF)
+
+    @LazyAttribute
+    def flogpsd(self):
+        """The filtered log-periodogram: the filtered logpsd (LOGPSD_FILTER_TYPE = 1) or the log of fpsd."""
+        if (self.psd is None) or (self.PSD_FILTER_WF is None):
+            return None
+        if (getattr(self, 'LOGPSD_FILTER_TYPE', 1) == 1):
+            return runavefilter(self.logpsd, self.PSD_FILTER_WF)
+        return np.log(self.fpsd)
+
+    @LazyAttribute
+    def fcospectrum(self):
+        """The cospectrum filtered with a moving average of PSD_FILTER_WF frequencies, divided by L."""
+        if (getattr(self, 'cospectrum', None) is None) or (self.PSD_FILTER_WF is None):
+            return None
+        fcospectrum = runavefilter(self.cospectrum, self.PSD_FILTER_WF, axis=-1)   # all the (i, j) elements at once
+        fcospectrum /= self.L
+        return fcospectrum
 
     def compute_acf(self, NLAGS=None):
-        """Computes the autocovariance function of the trajectory."""
+        """
+        Computes the (unbiased) autocovariance function of the trajectory.
+        All the components are transformed at once: the linear autocovariance needs a zero-padded transform of the
+        mean-subtracted trajectory, hence it cannot be derived from the cached spectrum.
+        """
+        if self.traj is None:
+            raise ValueError('Trajectory not defined.')
         if NLAGS is not None:
             self.NLAGS = NLAGS
         else:
             self.NLAGS = self.N
-        self.acf = np.zeros((self.NLAGS, self.N_COMPONENTS))
-        for d in range(self.N_COMPONENTS):
-            self.acf[:, d] = acovf(self.traj[:, d], unbiased=True, fft=True)[:NLAGS]
+        self.acf = acovf_multi(self.traj, unbiased=True)[:self.NLAGS]
+        if (self.TRAJ_FACTOR != 1.0):
+            self.acf *= self.TRAJ_FACTOR**2
         self.acfm = np.mean(self.acf, axis=1)   # average acf
 
     def compute_gkintegral(self):
@@ -371,6 +493,7 @@ class MDSample(object):
         The output arrays are the same as in the one-component case.
         If a PSD_FILTER_W is known or given, the psd is also filtered.
         The elements of the matrix are multiplied by DT_FS at the end.
+        Single precision trajectories give complex64 spectra, while the cospectrum is accumulated in double precision.
         others is a list of other currents, i.e. MDSample objects. For example, in the case of 4 currents, of which
         j is the energy current and j1, j2, j3 are mass currents (MDSample objects):
 
@@ -379,67 +502,65 @@ class MDSample(object):
         # check if others is an array
         if not isinstance(others, (list, tuple, np.ndarray)):
             others = [others]
-        N_CURRENTS = len(others)
         if DT_FS is not None:
             self.DT_FS = DT_FS
 
-        if (method == 'trajectory'):
-            if self.traj is None:
-                raise ValueError('Trajectory not defined.')
-            self.spectrALL = np.fft.rfft(self.traj, axis=0)
-            self.NFREQS = self.spectrALL.shape[0]
-            self.freqs = np.linspace(0., 0.5, self.NFREQS)
-            self.DF = 0.5 / (self.NFREQS - 1)
-            self.DF_THZ = freq_red_to_THz(self.DF, self.DT_FS)
-        else:
+        if (method != 'trajectory'):
             raise KeyError('method not understood')
-        self.freqs_THz = self.freqs / self.DT_FS * 1000.
-        self.Nyquist_f_THz = self.freqs_THz[-1]
-
-        # calculate the same thing on the other trajectory
-        if (call_other):
-            for other in others:   # call other.compute_kappa_multi (MDsample method)
-                MDSample.compute_kappa_multi(other, [self], PSD_FILTER_W, freq_units, method, self.DT_FS, normalize,
-                                             False)
-        else:
+        # compute the frequencies of all the currents (self first: a Current computes all the spectra at once)
+        for x in ([self] + list(others) if call_other else [self]):
+            x.DT_FS = self.DT_FS
+            x.compute_spectrALL()   # cached
+            x.NFREQS = x.spectrALL.shape[0]
+            x.freqs = np.linspace(0., 0.5, x.NFREQS)
+            x.DF = 0.5 / (x.NFREQS - 1)
+            x.DF_THZ = freq_red_to_THz(x.DF, x.DT_FS)
+        if not call_other:
             return
 
-        # define the cospectrum matrix. Its shape is (2, 2, NFREQS,n_spatial_dim)
+        # define the cospectrum matrix. Its shape is (2, 2, NFREQS), summed over the components
         #  [  self.spectrALL*self.spectrALL.conj()     self.spectrALL*other.spectrALL.conj() ]
         #  [ other.spectrALL*self.spectrALL.conj()    other.spectrALL*other.spectrALL.conj() ]
+        # and the element 1/"(0,0) of the inverse" (aka the transport coefficient), computed by frequency chunks as a
+        # Schur complement: the diagonal elements of the inverse have very convenient statistical properties
         other_spectrALL = []
         for other in others:
             other_spectrALL.append(other.spectrALL)
-
-        # compute the matrix defined by the outer product of only the first indexes of the two arrays
-        covarALL = self.DT_FS / (2.*(self.NFREQS - 1.)) *\
-                    np.einsum('a...,b...->ab...', np.array([self.spectrALL] + other_spectrALL),
-                                                  np.array([self.spectrALL] + other_spectrALL).conj())
+        self.cospectrum, schur = cospectrum([self.spectrALL] + other_spectrALL,
+                                            scale=self.DT_FS / (2. * (self.NFREQS - 1.)))
 
         # number of degrees of freedom of the chi-square distribution of the psd
-        ndf_chi = covarALL.shape[3] - len(other_spectrALL)
-
-        # compute the sum over the last axis (equivalent cartesian components):
-        self.L = covarALL.shape[3]   ## isn't is == to N_CURRENTS?
-        self.cospectrum = covarALL.sum(axis=3)
-
-        # compute the element 1/"(0,0) of the inverse" (aka the transport coefficient)
-        # the diagonal elements of the inverse have very convenient statistical properties
-        multi_psd = (np.linalg.inv(self.cospectrum.transpose((2, 0, 1)))[:, 0, 0]**-1).real / ndf_chi
+        ndf_chi = self.N_COMPONENTS - len(other_spectrALL)
+        self.L = self.N_COMPONENTS   ## isn't is == to N_CURRENTS?
+        multi_psd = schur / ndf_chi
 
         if normalize:
             multi_psd = multi_psd / np.trapz(multi_psd) / self.N / self.DT_FS
 
         self.ndf_chi = ndf_chi
         self.psd = multi_psd
-        self.logpsd = np.log(self.psd)
-        self.psd_min = np.min(self.psd)
-        self.psd_power = np.trapz(self.psd)   # one-side PSD power
         if (PSD_FILTER_W is not None) or (self.PSD_FILTER_W is not None):
             self.filter_psd(PSD_FILTER_W, freq_units)
 
+    def _resample_spectrum(self, TSKIP, FILTER_W=None):
+        """
+        Return a copy of this sample filtered & resampled in the frequency domain (see resample_spectrum), with the
+        resampled spectrum and no trajectory. The periodogram is not computed.
+        """
+        xf = copy.copy(self)
+        xf.spectrALL, N = resample_spectrum(self.compute_spectrALL(), self.N, TSKIP, FILTER_W)
+        xf.traj = None
+        xf.N = N
+        xf.DT_FS = self.DT_FS * TSKIP
+        xf.acf = None
+        xf.NLAGS = None
+        xf.initialize_spectrum(None)
+        xf.initialize_psd()
+        xf.cospectrum = None
+        return xf
+
     def resample(self, TSKIP=None, fstar_THz=None, FILTER_W=None, plot=False, PSD_FILTER_W=None,
-                 freq_units='THz', FIGSIZE=None, verbose=True):   # yapf: disable
+                 freq_units='THz', FIGSIZE=None, verbose=True, method='time'):   # yapf: disable
         """
         Simulate the resampling of the time series.
 
@@ -456,13 +577,16 @@ class MDSample(object):
                        'red'  [omega*DT/(2*pi)]
         FIGSIZE      = plot figure size
         verbose      = print log [True]
+        method       = 'time'      filter & sample the trajectory, and compute its spectrum [default]
+                       'spectral'  filter & sample the cached spectrum (fast, the new object has no trajectory)
 
         Returns
         -------
         xf : a filtered & resampled time series object
         ax : an array of plot axes, optional (if plot=True)
         """
-        return resample_timeseries(self, TSKIP, fstar_THz, FILTER_W, plot, PSD_FILTER_W, freq_units, FIGSIZE, verbose)
+        return resample_timeseries(self, TSKIP, fstar_THz, FILTER_W, plot, PSD_FILTER_W, freq_units, FIGSIZE, verbose,
+                                   method)
 
     ###################################
     ###  PLOT METHODS
@@ -477,7 +601,7 @@ class MDSample(object):
         """Plot the time series."""
         if self.traj is None:
             raise ValueError('Trajectory not defined.')
-        plt.plot(self.traj, **param_dict)
+        plt.plot(self.traj * self.TRAJ_FACTOR, **param_dict)
         plt.xlabel(r'$t$')
         plt.grid()
         plt.legend()
@@ -15,7 +15,7 @@ except:
 
 
 def resample_timeseries(x, TSKIP=None, fstar_THz=None, FILTER_W=None, plot=False, PSD_FILTER_W=None, freq_units='THz',
-                        FIGSIZE=None, verbose=True):   # yapf: disable
+                        FIGSIZE=None, verbose=True, method='time'):   # yapf: disable
     """
     Simulate the resampling of a time series x.
 
@@ -33,6 +33,10 @@ def resample_timeseries(x, TSKIP=None, fstar_THz=None, FILTER_W=None, plot=False
                    'red'  [omega*DT/(2*pi)]
     FIGSIZE      = plot figure size
     verbose      = print log [True]
+    method       = 'time'      filter & sample the trajectory, and compute the spectrum of the new one [default]
+                   'spectral'  filter & sample the cached spectrum of x (see MDSample.compute_spectrALL): the
+                               moving-average transfer function is applied and the aliases are folded, with no new
+                               transform. The resampled object has no trajectory (traj = None).
 
     Returns
     -------
@@ -47,6 +51,8 @@ def resample_timeseries(x, TSKIP=None, fstar_THz=None, FILTER_W=None, plot=False
         raise ValueError('Please specify either TSKIP or fstar_THz.')
     elif (TSKIP is None) and (fstar_THz is None):
         raise ValueError('Please specify either TSKIP or fstar_THz.')
+    if method not in ('time', 'spectral'):
+        raise ValueError('method must be \'time\' or \'spectral\'.')
     if x.psd is None or PSD_FILTER_W:
         x.compute_psd(PSD_FILTER_W, freq_units)   # this ensures that Nyquist_f_THz is defined
     if fstar_THz:
@@ -60,27 +66,38 @@ def resample_timeseries(x, TSKIP=None, fstar_THz=None, FILTER_W=None, plot=False
     fstar_THz = x.Nyquist_f_THz / TSKIP
     fstar_idx = np.argmin(x.freqs_THz < fstar_THz)
 
-    # get the builder of the original time series object
-    # builder is a dictionary containing the parameters to define the new time series
-    TimeSeries, builder = x._get_builder()
-    trajectory = builder['traj']
-
-    # filter & resample time series -- for 3D time series, apply to each row
-    if (len(trajectory.shape) == 3):
-        new_trajectory = np.array([filter_and_sample(traj, FILTER_W, TSKIP, 'rectangular') for traj in trajectory])
-    elif (len(trajectory.shape) < 3):
-        new_trajectory = filter_and_sample(trajectory, FILTER_W, TSKIP, 'rectangular')
-    else:
-        raise ValueError('Trajectory shape not valid.')
-
-    # define new time series by updating the builder
-    builder.update(traj=new_trajectory, DT_FS=(x.DT_FS * TSKIP))
-    xf = TimeSeries(**builder)
-
     # define new filtering window width to be equal to the original one
-    new_PSD_FILTER_W = x.PSD_FILTER_W_THZ if freq_units in ('THz', 'thz') else x.PSD_FILTER_W * TSKIP
-    if xf.psd is None:
-        xf.compute_psd(new_PSD_FILTER_W, freq_units)   # this ensures that Nyquist_f_THz is defined
+    if x.PSD_FILTER_W is None:
+        new_PSD_FILTER_W = None
+    else:
+        new_PSD_FILTER_W = x.PSD_FILTER_W_THZ if freq_units in ('THz', 'thz') else x.PSD_FILTER_W * TSKIP
+
+    if (method == 'spectral'):
+        # filter & resample the spectrum of each current
+        xf = x._resample_spectrum(TSKIP, FILTER_W)
+        xf.compute_psd(new_PSD_FILTER_W, freq_units)
+        if hasattr(xf, 'initialize_cepstral_parameters'):
+            xf.initialize_cepstral_parameters()
+    else:
+        # get the builder of the original time series object
+        # builder is a dictionary containing the parameters to define the new time series
+        TimeSeries, builder = x._get_builder()
+        trajectory = builder['traj']
+
+        # filter & resample time series -- for 3D time series, apply to each row
+        if (len(trajectory.shape) == 3):
+            new_trajectory = np.array([filter_and_sample(traj, FILTER_W, TSKIP, 'rectangular') for traj in trajectory])
+        elif (len(trajectory.shape) < 3):
+            new_trajectory = filter_and_sample(trajectory, FILTER_W, TSKIP, 'rectangular')
+        else:
+            raise ValueError('Trajectory shape not valid.')
+
+        # define new time series by updating the builder
+        builder.update(traj=new_trajectory, DT_FS=(x.DT_FS * TSKIP))
+        xf = TimeSeries(**builder)
+
+        if xf.psd is None:
+            xf.compute_psd(new_PSD_FILTER_W, freq_units)   # this ensures that Nyquist_f_THz is defined
 
     # write log
     xf.resample_log = \
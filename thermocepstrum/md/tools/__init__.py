@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ['acf', 'filter', 'resample', 'spectrum']
+__all__ = ['acf', 'fftbackend', 'filter', 'resample', 'spectrum']
 
 from . import *
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+from .fftbackend import next_fast_len, fft as _fft, ifft as _ifft, rfft as _rfft, irfft as _irfft
 
 
 def integrate_acf(acf):
@@ -93,9 +94,9 @@ def acovf(x, unbiased=False, demean=True, fft=False, missing='none'):
 
     if fft:
         nobs = len(xo)
-        n = _next_regular(2 * nobs + 1)
-        Frf = np.fft.fft(xo, n=n)
-        acov = np.fft.ifft(Frf * np.conjugate(Frf))[:nobs] / d[nobs - 1:]
+        n = next_fast_len(2 * nobs + 1, real=False)
+        Frf = _fft(xo, n=n)
+        acov = _ifft(Frf * np.conjugate(Frf))[:nobs] / d[nobs - 1:]
         acov = acov.real
     else:
         acov = (np.correlate(xo, xo, 'full') / d)[n - 1:]
@@ -107,6 +108,42 @@ def acovf(x, unbiased=False, demean=True, fft=False, missing='none'):
     return acov
 
 
+def acovf_multi(x, unbiased=False, demean=True):
+    """
+    Autocovariance of each column of a (N, N_COMP) array (or of a 1D array), computed by FFT convolution with a single
+    real FFT of all the columns. Each column gives the same result as acovf(x[:, d], unbiased, demean, fft=True).
+
+    Parameters
+    ----------
+    x : array
+        Time series data (N, N_COMP) or (N,). Missing values are not supported.
+    unbiased : bool
+        If True, then denominators is n-k, otherwise n
+    demean : bool
+        If True, then subtract the mean of each column
+
+    Returns
+    -------
+    acovf : array
+        autocovariance function of each column, same shape as x
+    """
+    x = np.asarray(x)
+    if (x.ndim == 1):
+        return acovf_multi(x[:, np.newaxis], unbiased, demean)[:, 0]
+    if (x.ndim != 2):
+        raise ValueError('x must be 1d or 2d. Got %d dims.' % x.ndim)
+    nobs = x.shape[0]
+    xo = x - x.mean(axis=0) if demean else x
+    n = next_fast_len(2 * nobs + 1)
+    Frf = _rfft(xo, n=n, axis=0)
+    acov = _irfft(Frf.real**2 + Frf.imag**2, n=n, axis=0)[:nobs]
+    if unbiased:
+        acov /= np.arange(nobs, 0, -1)[:, np.newaxis]
+    else:
+        acov /= nobs
+    return acov
+
+
 #see for example
 # http://www.itl.nist.gov/div898/handbook/eda/section3/autocopl.htm
 def acf(x, unbiased=False, nlags=40, qstat=False, fft=False, alpha=None, missing='none'):
@@ -254,52 +291,3 @@ def has_missing(data):
     Returns True if 'data' contains missing entries, otherwise False
     """
     return np.isnan(np.sum(data))
-
-
-def _next_regular(target):
-    """
-    Find the next regular number greater than or equal to target.
-    Regular numbers are composites of the prime factors 2, 3, and 5.
-    Also known as 5-smooth numbers or Hamming numbers, these are the optimal
-    size for inputs to FFTPACK.
-
-    Target must be a positive integer.
-    """
-    if target <= 6:
-        return target
-
-    # Quickly check if it's already a power of 2
-    if not (target & (target - 1)):
-        return target
-
-    match = float('inf')   # Anything found will be smaller
-    p5 = 1
-    while p5 < target:
-        p35 = p5
-        while p35 < target:
-            # Ceiling integer division, avoiding conversion to float
-            # (quotient = ceil(target / p35))
-            quotient = -(-target // p35)
-            # Quickly find next power of 2 >= quotient
-            try:
-                p2 = 2**((quotient - 1).bit_length())
-            except AttributeError:
-                # Fallback for Python <2.7
-                p2 = 2**_bit_length_26(quotient - 1)
-
-            N = p2 * p35
-            if N == target:
-                return N
-            elif N < match:
-                match = N
-            p35 *= 3
-            if p35 == target:
-                return p35
-        if p35 < match:
-            match = p35
-        p5 *= 5
-        if p5 == target:
-            return p5
-    if p5 < match:
-        match = p5
-    return match
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+The FFT backend used by all the transforms of thermocepstrum (spectra, autocovariance, cepstral filter).
+
+Backends:
+  - 'scipy'   scipy.fft, multithreaded with the workers argument (default)
+  - 'pyfftw'  pyFFTW (FFTW) through its scipy.fft interface, with the plan cache enabled (default if installed)
+  - 'numpy'   numpy.fft (single-threaded; DCTs are computed with scipy.fft, or scipy.fftpack)
+scipy.fft needs scipy >= 1.4: with older versions only the 'numpy' backend is available (and it is the default).
+The backend and the number of threads can be set with the environment variables THERMOCEPSTRUM_FFT_BACKEND and
+THERMOCEPSTRUM_FFT_WORKERS, or by calling set_backend. A negative number of workers counts from the number of CPUs
+(-1 = all the CPUs, default).
+
+Single precision (float32, complex64) arrays are transformed in single precision by every backend.
+
+Example:
+   from thermocepstrum.md.tools import fftbackend
+   fftbackend.set_backend('scipy', workers=16)
+"""
+
+import os
+import numpy as np
+try:
+    from scipy import fft as sp_fft
+except ImportError:   # scipy < 1.4
+    sp_fft = None
+    from scipy import fftpack
+
+__all__ = ('set_backend', 'get_backend', 'next_fast_len', 'rfft', 'irfft', 'fft', 'ifft', 'dct')
+
+BACKENDS = ('scipy', 'pyfftw', 'numpy')
+ENV_BACKEND = 'THERMOCEPSTRUM_FFT_BACKEND'
+ENV_WORKERS = 'THERMOCEPSTRUM_FFT_WORKERS'
+
+_backend = {'name': None, 'workers': None, 'module': None}
+
+
+def _default_backend():
+    if sp_fft is None:
+        return 'numpy'
+    try:
+        import pyfftw   # noqa: F401
+        return 'pyfftw'
+    except ImportError:
+        return 'scipy'
+
+
+def _n_workers(workers):
+    """Number of threads: a negative number counts from the number of CPUs (-1 = all)."""
+    workers = int(workers)
+    if (workers == 0):
+        raise ValueError('The number of FFT workers cannot be 0.')
+    if (workers < 0):
+        workers = max(1, (os.cpu_count() or 1) + 1 + workers)
+    return workers
+
+
+def set_backend(name=None, workers=None):
+    """
+    Set the FFT backend.
+      INPUT:
+        name     -> 'scipy', 'pyfftw' or 'numpy'
+                    (default: None -> $THERMOCEPSTRUM_FFT_BACKEND, or 'pyfftw' if installed, or 'scipy')
+        workers  -> number of threads, negative values count from the number of CPUs
+                    (default: None -> $THERMOCEPSTRUM_FFT_WORKERS, or -1 = all the CPUs)
+    """
+    if name is None:
+        name = os.environ.get(ENV_BACKEND) or _default_backend()
+    name = name.lower()
+    if name not in BACKENDS:
+        raise ValueError('FFT backend {} not valid. Valid backends: {}'.format(name, BACKENDS))
+    if workers is None:
+        workers = os.environ.get(ENV_WORKERS) or -1
+    workers = _n_workers(workers)
+    if (sp_fft is None) and (name != 'numpy'):
+        raise ImportError('The FFT backend {} needs scipy.fft (scipy >= 1.4).'.format(name))
+    if (name == 'pyfftw'):
+        import pyfftw
+        import pyfftw.interfaces.scipy_fft as module
+        pyfftw.interfaces.cache.enable()   # reuse the FFTW plans of repeated transforms
+    elif (name == 'scipy'):
+        module = sp_fft
+    else:
+        module = None
+    _backend.update(name=name, workers=workers, module=module)
+
+
+def get_backend():
+    """Return the name of the FFT backend and the number of threads."""
+    if _backend['name'] is None:
+        set_backend()
+    return _backend['name'], _backend['workers']
+
+
+def _module():
+    if _backend['name'] is None:
+        set_backend()
+    return _backend['module']
+
+
+def next_fast_len(target, real=True):
+    """Return the smallest length >= target that the FFT backend transforms efficiently (a product of small primes)."""
+    module = _module()
+    if (module is not None) and (module is not sp_fft) and hasattr(module, 'next_fast_len'):
+        return module.next_fast_len(int(target))   # FFTW: 7-smooth lengths
+    if sp_fft is None:
+        return fftpack.next_fast_len(int(target))   # 5-smooth lengths
+    return sp_fft.next_fast_len(int(target), real)
+
+
+def _single(x):
+    return np.asarray(x).dtype in (np.float32, np.complex64)
+
+
+def _numpy_transform(func, x, n, axis, single):
+    result = func(x, n=n, axis=axis)
+    return result.astype(np.complex64 if np.iscomplexobj(result) else np.float32) if single else result
+
+
+def rfft(x, n=None, axis=-1):
+    """Real FFT of x along axis (see scipy.fft.rfft), computed by the FFT backend."""
+    module = _module()
+    if module is None:
+        return _numpy_transform(np.fft.rfft, x, n, axis, _single(x))
+    return module.rfft(x, n=n, axis=axis, workers=_backend['workers'])
+
+
+def irfft(x, n=None, axis=-1):
+    """Inverse of rfft (see scipy.fft.irfft), computed by the FFT backend."""
+    module = _module()
+    if module is None:
+        return _numpy_transform(np.fft.irfft, x, n, axis, _single(x))
+    return module.irfft(x, n=n, axis=axis, workers=_backend['workers'])
+
+
+def fft(x, n=None, axis=-1):
+    """FFT of x along axis (see scipy.fft.fft), computed by the FFT backend."""
+    module = _module()
+    if module is None:
+        return _numpy_transform(np.fft.fft, x, n, axis, _single(x))
+    return module.fft(x, n=n, axis=axis, workers=_backend['workers'])
+
+
+def ifft(x, n=None, axis=-1):
+    """Inverse FFT of x along axis (see scipy.fft.ifft), computed by the FFT backend."""
+    module = _module()
+    if module is None:
+        return _numpy_transform(np.fft.ifft, x, n, axis, _single(x))
+    return module.ifft(x, n=n, axis=axis, workers=_backend['workers'])
+
+
+def dct(x, type=2, axis=-1):
+    """Discrete Cosine Transform of x along axis (see scipy.fft.dct, unnormalized), computed by the FFT backend."""
+    module = _module()
+    if (module is None) or not hasattr(module, 'dct'):
+        module = sp_fft
+    if module is None:
+        return fftpack.dct(x, type=type, axis=axis)
+    return module.dct(x, type=type, axis=axis, workers=_backend['workers'])
@@ -3,15 +3,50 @@
 import numpy as np
 
 
-def runavefilter(X, WF):
+def runavefilter(X, WF, axis=-1, out=None):
     """Computes the running average of a numpy array over WF consecutive elements (or WF+1 if WF is even):
             (X[i-WF/2]+...+X[i]+...+X[i+WF/2]) / WF
     assumes that the array is "even" ( X[-i] = X[i] ) and anti-periodic (X[(N-1)+i]=X[(N-1)-i]), like a ONE-SIDED PSD.
+    X can be an N-d array (e.g. a cospectrum), filtered along axis in a single pass. The running sums are computed as
+    cumulative sums over blocks of WF elements (a window spans two blocks), hence the cost per element does not
+    depend on WF, and the round-off error does not grow with the size of the array.
+      INPUT:
+        X     -> the (real or complex) array
+        WF    -> the width of the window
+        axis  -> the axis along which X is filtered (default: -1)
+        out   -> a preallocated output array with the same shape of X (default: None)
+      OUTPUT:
+        the filtered array
     """
 
     if (WF % 2 == 0):
         WF = WF + 1
     W = int(WF / 2)
 
-    Y = np.concatenate((X[W:0:-1], X, X[-2:-W - 2:-1]))
-    return np.convolve(Y, np.array([1.0 / WF] * WF), 'valid')
+    X = np.asarray(X)
+    if out is None:
+        out = np.empty(X.shape, dtype=np.result_type(X.dtype, np.float64))
+    if (WF == 1):
+        out[...] = X
+        return out
+    X = np.moveaxis(X, axis, -1)
+    N = X.shape[-1]
+
+    # reflect the array at both ends, and split it in blocks of WF elements (padded with zeros)
+    idx = np.concatenate((np.arange(W, 0, -1), np.arange(N), np.arange(N - 2, N - W - 2, -1)))
+    NBLOCKS = N // WF + 2
+    Y = np.zeros(X.shape[:-1] + (NBLOCKS * WF,), dtype=out.dtype)
+    Y[..., :len(idx)] = np.take(X, idx, axis=-1)
+    Y = Y.reshape(X.shape[:-1] + (NBLOCKS, WF))
+
+    # the window [i, i+WF) starts in the block k = i // WF at r = i % WF, and it ends in the block k+1 at r:
+    #   sum = tail[k, r] + head[k+1, r]
+    # with tail[k, r] the sum of the elements r, ..., WF-1 of block k and head[k, r] the sum of its first r elements
+    # (both cumulative sums, hence no cancellation of large terms)
+    tail = np.cumsum(Y[..., ::-1], axis=-1)[..., ::-1]
+    head = np.zeros_like(Y)
+    np.cumsum(Y[..., :-1], axis=-1, out=head[..., 1:])
+    tail = tail[..., :-1, :]
+    tail += head[..., 1:, :]
+    np.divide(tail.reshape(X.shape[:-1] + (-1,))[..., :N], WF, out=np.moveaxis(out, axis, -1))
+    return out
@@ -33,6 +33,60 @@ def filter_and_sample(y_big, W, DT, window='rectangular', even_NSTEPS=True, detr
     return y
 
 
+def moving_average_response(freqs, W):
+    """
+    Frequency response of the moving average of width W of filter_and_sample (freqs in reduced units, i.e. cycles per
+    step), including the delay compensation of dropping the first W - 1 steps: (1/W) * sum_{u=0}^{W-1} exp(2 pi i f u).
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    if (W <= 1):
+        return np.ones(freqs.shape, dtype=np.complex128)
+    den = W * np.sin(np.pi * freqs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        amplitude = np.where(den == 0., 1., np.sin(np.pi * freqs * W) / den)
+    return amplitude * np.exp(1.0J * np.pi * freqs * (W - 1))
+
+
+def resample_spectrum(spectrALL, N, DT, W=None):
+    """
+    Filter with a moving average window of width W and sample with time step DT in the frequency domain: return the
+    one-sided spectrum of the resampled time series directly from the one-sided spectrum (rfft) of the original one.
+    The transfer function of the filter is applied and the aliases of each new frequency are folded:
+        Y(k) = 1/DT * sum_m H(f_m) X(f_m),    f_m = (k + m * NEW_N) / (NEW_N * DT),  m = 0, ..., DT-1
+    The result is the spectrum of filter_and_sample(x, W, DT) with a circular filter, exact if DT divides N; otherwise
+    each alias frequency is taken from the nearest frequency of the original spectrum.
+      INPUT:
+        spectrALL  -> the one-sided spectrum of the time series, (N // 2 + 1, ...) array
+        N          -> the number of steps of the time series
+        DT         -> the sampling time step (integer)
+        W          -> the filter window width (default: DT)
+      OUTPUT:
+        spectrum   ->  the one-sided spectrum of the resampled time series, (NEW_N // 2 + 1, ...) array
+        NEW_N      ->  the number of steps of the resampled time series (even)
+    """
+    if W is None:
+        W = DT
+    NEW_N = N // DT
+    NEW_N -= NEW_N % 2   # keeps an even number of points
+    if (NEW_N < 2):
+        raise ValueError('Sampling time step too large ({} steps, DT = {}).'.format(N, DT))
+    spectrALL = np.asarray(spectrALL)
+    expand = (slice(None),) + (np.newaxis,) * (spectrALL.ndim - 1)
+    # filtered spectrum (the response of negative frequencies is the complex conjugate)
+    filtered = spectrALL * moving_average_response(np.arange(spectrALL.shape[0]) / N, W)[expand]
+    filtered = filtered.astype(spectrALL.dtype, copy=False)
+    k = np.arange(NEW_N // 2 + 1)
+    spectrum = np.zeros((k.size,) + spectrALL.shape[1:], dtype=spectrALL.dtype)
+    for m in range(DT):   # fold the aliases
+        j = np.rint((k + m * NEW_N) * (N / (NEW_N * DT))).astype(np.int64) % N   # two-sided index of the alias
+        conjugate = (j > N // 2)   # negative frequencies: X(-f) = conj(X(f))
+        alias = filtered[np.where(conjugate, N - j, j)]
+        alias[conjugate] = alias[conjugate].conj()
+        spectrum += alias
+    spectrum *= np.sqrt(NEW_N * DT / N) / DT   # (the length factor is 1 if DT divides N)
+    return spectrum, NEW_N
+
+
 def resample_psd(freqs, psd, cutfrequency):
     if (cutfrequency >= freqs[-1]):
         return freqs, psd
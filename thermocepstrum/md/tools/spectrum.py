@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+from . import fftbackend
 
 
 def freq_THz_to_red(f_THz, DT_FS):
@@ -19,6 +20,63 @@ def freq_red_to_THz(f_red, DT_FS):
     return f_red * 1000. / DT_FS
 
 
+def rfft(x, axis=0):
+    """
+    Real FFT of x along axis, computed by the FFT backend (see fftbackend.py).
+    Single precision (float32) arrays are transformed in single precision and give a complex64 spectrum,
+    other arrays give a complex128 spectrum.
+    """
+    return fftbackend.rfft(x, axis=axis)
+
+
+def sum_abs2(spectr, axis=-1):
+    """Sum of |spectr|**2 over axis, accumulated in double precision (also for complex64 spectra)."""
+    spectr = np.moveaxis(np.asarray(spectr), axis, 0)
+    total = np.zeros(spectr.shape[1:])
+    for x in spectr:
+        total += x.real.astype(np.float64)**2 + x.imag.astype(np.float64)**2
+    return total
+
+
+COSPECTRUM_CHUNK = 1 << 16   # number of frequencies processed at once by cospectrum
+
+
+def cospectrum(spectra, scale=1.0, chunk=COSPECTRUM_CHUNK):
+    """
+    Cospectrum matrix of many currents, summed over the equivalent components, and the inverse of the (0,0) element
+    of its inverse, i.e. the Schur complement of the other currents:
+        S_ab(f) = scale * sum_c  X_a(f, c) * conj(X_b(f, c))
+        1 / (S^-1)_00 = S_00 - S_0r S_rr^-1 S_r0
+    The frequencies are processed in chunks, so that the temporary memory is bounded by chunk frequencies (the
+    component axis is summed while the products are computed, and no inverse matrix is formed).
+      INPUT:
+        spectra  -> a list of the L spectra (NFREQS, N_COMPONENTS) of the currents (complex64 or complex128)
+        scale    -> factor multiplied by the cospectrum
+        chunk    -> number of frequencies processed at once
+      OUTPUT:
+        cospectrum  ->  the (L, L, NFREQS) complex128 cospectrum
+        schur       ->  the (NFREQS,) real Schur complement 1 / (S^-1)_00
+    """
+    L = len(spectra)
+    NFREQS = spectra[0].shape[0]
+    result = np.empty((L, L, NFREQS), dtype=np.complex128)
+    schur = np.empty(NFREQS)
+    for start in range(0, NFREQS, chunk):
+        stop = min(start + chunk, NFREQS)
+        X = np.empty((stop - start,) + (L, spectra[0].shape[1]), dtype=np.complex128)   # (f, current, component)
+        for a, spectr in enumerate(spectra):
+            X[:, a] = spectr[start:stop]
+        S = np.matmul(X, X.conj().transpose((0, 2, 1)))   # (f, L, L), summed over the components
+        S *= scale
+        result[:, :, start:stop] = S.transpose((1, 2, 0))
+        if (L > 1):
+            Srr_inv_Sr0 = np.linalg.solve(S[:, 1:, 1:], S[:, 1:, :1])
+            schur[start:stop] = (S[:, 0, 0] - np.matmul(S[:, :1, 1:], Srr_inv_Sr0)[:, 0, 0]).real
+        else:
+            schur[start:stop] = S[:, 0, 0].real
+    return result, schur
+
+
 def logtau_to_tau(logtau, logtau_mean, logtau_var, correct_mean=True):
     if correct_mean:
         logtau = logtau - logtau_mean
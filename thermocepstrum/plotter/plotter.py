@@ -476,12 +476,12 @@ class Plotter:
         return axis
 
     def GUI_resample_current(self, current, TSKIP=None, fstar_THz=None, FILTER_W=None, plot=True, PSD_FILTER_W=None,
-                             freq_units='thz', FIGSIZE=None, axis=None, data=None):
+                             freq_units='thz', FIGSIZE=None, axis=None, data=None, method='time'):
 
         if data.changes:
             print('resampling current')
             xf = current.resample(TSKIP=TSKIP, fstar_THz=fstar_THz, FILTER_W=FILTER_W, plot=False,
-                                  PSD_FILTER_W=PSD_FILTER_W, freq_units=freq_units)
+                                  PSD_FILTER_W=PSD_FILTER_W, freq_units=freq_units, method=method)
         else:
             print('not resampling current (data is same) {}'.format(data.changes))
             xf = data.xf
@@ -592,9 +592,9 @@ class GUIPlotter(Plotter):
                                             FIGSIZE, **plot_kwargs)
 
     def GUI_resample_current(self, current, TSKIP=None, fstar_THz=None, FILTER_W=None, plot=True, PSD_FILTER_W=None,
-                             freq_units='thz', FIGSIZE=None, axis=None, data=None):
+                             freq_units='thz', FIGSIZE=None, axis=None, data=None, method='time'):
         return super().GUI_resample_current(current, TSKIP, fstar_THz, FILTER_W, plot, PSD_FILTER_W, freq_units,
-                                            FIGSIZE, axis, data)
+                                            FIGSIZE, axis, data, method)
 
 
 def addPlotToPdf(func, pdf, *args, **kwargs):
@@ -236,16 +236,9 @@ def main():
                 else:
                     ffpsd = tc.md.tools.filter.runavefilter(self.psd, WF)
                 self.fpsd = ffpsd
-                try:
-                    for i in range(self.ucospectrum.shape[0]):
-                        for j in range(self.ucospectrum.shape[1]):
-                            if not single:
-                                ffc = tc.md.tools.filter.runavefilter(self.mcospectrum[i, j], WF)
-                            else:
-                                ffc = tc.md.tools.filter.runavefilter(self.ucospectrum[i, j], WF)
-                            self.cospectrum[i, j] = ffc
-                except AttributeError:
-                    pass
+                if (self.ucospectrum is not None) and (self.cospectrum is not None):
+                    cospectrum = self.mcospectrum if not single else self.ucospectrum
+                    tc.md.tools.filter.runavefilter(cospectrum, WF, axis=-1, out=self.cospectrum)
 
         psd = Psd()
 
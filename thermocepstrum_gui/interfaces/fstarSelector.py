@@ -127,7 +127,7 @@ class FStarSelector(Frame):
 
         if cu.data.fstar > 0:
             self.graph.add_graph(cu.gm.GUI_resample_current, 'resample', current=cu.data.j, fstar_THz=cu.data.fstar,
-                                 PSD_FILTER_W=cu.data.psd_filter_width)
+                                 PSD_FILTER_W=cu.data.psd_filter_width, method='spectral')
             self.graph.update_cut()
 
             self.graph.cut_line = cu.data.xf.Nyquist_f_THz